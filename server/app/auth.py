@@ -1,18 +1,23 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from .config import get_settings
 from .database import get_db
 from .models import User, Admin
-from .redis_client import get_redis
+from .user_cache import get_user_cache
+# 密码加密（cost 由 BCRYPT_ROUNDS 配置；def 路由中请使用 password_hasher 的 *_from_thread 版本）
+from .password_hasher import (
+    pwd_context, truncate_password, hash_password_from_thread, verify_password_from_thread,
+)
+from .cache_bus import register_handler, publish_invalidation_nowait
+from collections import OrderedDict
+import hashlib
 import secrets
 import threading
 import time
-import json as _json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,160 +25,35 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 security = HTTPBearer()
 
-# 密码加密
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-# ===== 用户认证缓存（优先 Redis，降级到内存字典） =====
-# P2 #15: 内存缓存加上限，防止长期运行 OOM
-try:
-    from cachetools import TTLCache
-    _user_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
-except ImportError:
-    _user_cache: dict[int, tuple[User, float]] = {}  # type: ignore[no-redef]
-_user_cache_lock = threading.Lock()
-_USER_CACHE_TTL = 300  # Redis 模式提升到 5 分钟
-_USER_CACHE_TTL_LOCAL = 60  # 内存降级 60 秒
-
-
-def _user_to_cache(user: User) -> str:
-    """序列化用户对象为 JSON（只缓存认证所需字段）"""
-    return _json.dumps({
-        "id": user.id,
-        "username": user.username,
-        "nickname": user.nickname,
-        "avatar": user.avatar,
-        "is_banned": user.is_banned,
-        "ban_reason": user.ban_reason,
-        "persona": user.persona,
-        "token": user.token,
-        "created_at": user.created_at.isoformat() if user.created_at else None,
-    })
-
-
-def _user_from_cache(data: str, db: Session) -> User:
-    """从 JSON 反序列化为 User 并绑定到当前 Session"""
-    from datetime import datetime
-    d = _json.loads(data)
-    # 还原 created_at
-    if d.get("created_at"):
-        d["created_at"] = datetime.fromisoformat(d["created_at"])
-    user = User(**d)
-    return db.merge(user, load=False)
+# ===== 用户认证缓存（L1 进程内 + L2 Redis，跨实例失效广播，见 user_cache.py） =====
 
 
 def _get_cached_user(db: Session, user_id: int) -> Optional[User]:
-    """从缓存获取用户（同步版，仅走内存缓存 + DB）"""
-    # 1. 内存缓存快速路径
-    now = time.monotonic()
-    with _user_cache_lock:
-        entry = _user_cache.get(user_id)
-        if entry is not None:
-            cached_user, expire_at = entry
-            if expire_at > now:
-                return db.merge(cached_user, load=False)
-            else:
-                _user_cache.pop(user_id, None)
-
-    # 2. Cache miss — query DB
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is not None:
-        db.refresh(user)
-        # 写入 Redis 缓存（异步，fire-and-forget）
-        r = get_redis()
-        if r:
-            try:
-                import asyncio
-                cache_data = _user_to_cache(user)
-                asyncio.ensure_future(_redis_set_user_cache(r, user_id, cache_data))
-            except Exception:
-                pass
-        db.expunge(user)
-        with _user_cache_lock:
-            _user_cache[user_id] = (user, now + _USER_CACHE_TTL_LOCAL)
-        return db.merge(user, load=False)
-    return user
-
-
-async def _redis_set_user_cache(r, user_id: int, data: str):
-    """异步写入 Redis 用户缓存"""
-    try:
-        await r.setex(f"user:{user_id}", _USER_CACHE_TTL, data)
-    except Exception:
-        logger.warning(f"[Auth] Redis 写入用户缓存失败: user_id={user_id}")
+    """从缓存获取用户（同步版，供线程池中的 def 路由使用）"""
+    return get_user_cache().get_sync(db, user_id)
 
 
 async def get_cached_user_async(db: Session, user_id: int) -> Optional[User]:
-    """异步版本的缓存用户获取（在 async 上下文中使用，优先 Redis）"""
-    r = get_redis()
-
-    # 1. 尝试从 Redis 读取
-    if r:
-        try:
-            raw = await r.get(f"user:{user_id}")
-            if raw:
-                return _user_from_cache(raw, db)
-        except Exception:
-            logger.warning(f"[Auth] Redis 读取用户缓存失败: user_id={user_id}")
-
-    # 2. 内存缓存
-    now = time.monotonic()
-    with _user_cache_lock:
-        entry = _user_cache.get(user_id)
-        if entry and entry[1] > now:
-            return db.merge(entry[0], load=False)
-
-    # 3. DB 查询
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is not None:
-        db.refresh(user)
-        if r:
-            try:
-                cache_data = _user_to_cache(user)
-                await r.setex(f"user:{user_id}", _USER_CACHE_TTL, cache_data)
-            except Exception:
-                pass
-        db.expunge(user)
-        with _user_cache_lock:
-            _user_cache[user_id] = (user, now + _USER_CACHE_TTL_LOCAL)
-        return db.merge(user, load=False)
-    return user
+    """异步版本的缓存用户获取（L1 → Redis → DB，含负缓存）"""
+    return await get_user_cache().get(db, user_id)
 
 
 def invalidate_user_cache(user_id: int):
-    """主动失效用户缓存（封禁/修改资料/改密码时调用）"""
-    with _user_cache_lock:
-        _user_cache.pop(user_id, None)
-    # 同时失效 Redis 缓存
-    r = get_redis()
-    if r:
-        try:
-            import asyncio
-            asyncio.ensure_future(_redis_del_user_cache(r, user_id))
-        except Exception:
-            pass
-
-
-async def _redis_del_user_cache(r, user_id: int):
-    """异步删除 Redis 用户缓存"""
-    try:
-        await r.delete(f"user:{user_id}")
-    except Exception:
-        logger.warning(f"[Auth] Redis 删除用户缓存失败: user_id={user_id}")
+    """主动失效用户缓存（封禁/修改资料/改密码/删除时调用）
 
-
-def _truncate_password(password: str) -> str:
-    """截断密码到 72 字节（bcrypt 限制）"""
-    return password.encode("utf-8")[:72].decode("utf-8", errors="ignore")
+    本实例 L1 立即失效；Redis 删除和跨实例广播异步执行。
+    """
+    get_user_cache().invalidate(user_id)
 
 
 def hash_password(password: str) -> str:
-    """加密密码"""
-    return pwd_context.hash(_truncate_password(password))
+    """加密密码（同步版，供脚本使用）"""
+    return pwd_context.hash(truncate_password(password))
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """验证密码"""
-    return pwd_context.verify(_truncate_password(plain_password), hashed_password)
+    """验证密码（同步版，供脚本使用）"""
+    return pwd_context.verify(truncate_password(plain_password), hashed_password)
 
 
 def generate_token(user_id: int, token_type: str = "user") -> str:
@@ -202,8 +82,81 @@ def generate_token(user_id: int, token_type: str = "user") -> str:
     return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
+# ===== 已验证 Token LRU（跳过重复的 jwt.decode） =====
+# Bot token 有效期一年且每个请求都携带，python-jose 的 HMAC + JSON + claims 校验
+# 在请求 profile 中占比明显。验证通过后按 token 摘要缓存 (user_id, token_type, exp)。
+_TOKEN_CACHE_MAXSIZE = 10000
+_verified_tokens: "OrderedDict[bytes, tuple[int, str, Optional[float]]]" = OrderedDict()
+_tokens_by_user: dict[int, set[bytes]] = {}
+_token_cache_lock = threading.Lock()
+
+
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+def _unindex_token(user_id: int, digest: bytes):
+    """从反向索引移除 digest，集合为空时删除该用户的条目（调用方持有锁）"""
+    digests = _tokens_by_user.get(user_id)
+    if digests is not None:
+        digests.discard(digest)
+        if not digests:
+            _tokens_by_user.pop(user_id, None)
+
+
+def _remember_token(digest: bytes, user_id: int, token_type: str, exp: Optional[float]):
+    with _token_cache_lock:
+        _verified_tokens[digest] = (user_id, token_type, exp)
+        _verified_tokens.move_to_end(digest)
+        _tokens_by_user.setdefault(user_id, set()).add(digest)
+        while len(_verified_tokens) > _TOKEN_CACHE_MAXSIZE:
+            old_digest, (old_uid, _, _) = _verified_tokens.popitem(last=False)
+            _unindex_token(old_uid, old_digest)
+
+
+def _lookup_token(digest: bytes) -> Optional[tuple[int, str]]:
+    with _token_cache_lock:
+        entry = _verified_tokens.get(digest)
+        if entry is None:
+            return None
+        user_id, token_type, exp = entry
+        if exp is not None and exp <= time.time():
+            _verified_tokens.pop(digest, None)
+            _unindex_token(user_id, digest)
+            return None
+        _verified_tokens.move_to_end(digest)
+        return user_id, token_type
+
+
+def _evict_verified_tokens(keys: list[str]):
+    """cache_bus 回调：按用户 ID 清除本实例已验证 token（keys 为空时清空全部）"""
+    with _token_cache_lock:
+        if not keys:
+            _verified_tokens.clear()
+            _tokens_by_user.clear()
+            return
+        for key in keys:
+            for digest in _tokens_by_user.pop(int(key), ()):
+                _verified_tokens.pop(digest, None)
+
+
+register_handler("token", _evict_verified_tokens)
+
+
+def purge_verified_tokens(user_id: int):
+    """清除某用户所有已缓存的 token 验证结果（刷新 Token / 封禁 / 删除时调用，广播到所有实例）"""
+    publish_invalidation_nowait("token", [user_id])
+
+
 def verify_token(token: str) -> tuple[Optional[int], Optional[str]]:
-    """验证 token，返回 (user_id, token_type)"""
+    """验证 token，返回 (user_id, token_type)
+
+    先查已验证 token LRU（按 SHA-256 摘要，尊重 exp），未命中再 jwt.decode。
+    """
+    digest = _token_digest(token)
+    cached = _lookup_token(digest)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -212,6 +165,8 @@ def verify_token(token: str) -> tuple[Optional[int], Optional[str]]:
         token_type = payload.get("type", "user")
         if user_id is None:
             return None, None
+        exp = payload.get("exp")
+        _remember_token(digest, int(user_id), token_type, float(exp) if exp is not None else None)
         return int(user_id), token_type
     except JWTError:
         return None, None
@@ -240,7 +195,7 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # P1 #6: async 上下文优先走 Redis 缓存
+    # P1 #6: 两级缓存（L1 进程内 + L2 Redis）
     user = await get_cached_user_async(db, user_id)
     if user is None:
         raise HTTPException(
@@ -287,7 +242,7 @@ async def get_optional_user(
     if token_type not in ("bot", "user", "user_session"):
         return None
 
-    user = _get_cached_user(db, user_id)
+    user = await get_cached_user_async(db, user_id)
     if user is None:
         return None
 
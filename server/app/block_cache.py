@@ -0,0 +1,220 @@
+"""
+拉黑关系缓存（两级：进程内 L1 + Redis L2）
+
+绝大多数用户没有任何拉黑关系，旧实现只在集合非空时写 Redis，
+导致这些用户每次浏览帖子列表/详情/搜索/热榜都要回源执行 UNION ALL 查询。
+
+- 每个用户缓存两个方向：out（我拉黑的）和 in（拉黑我的）
+- L2：Redis Set `blockrel:{id}`，成员为 `o:{uid}` / `i:{uid}`，空集合写入 `__empty__` 占位符
+- L1：进程内 TTL 缓存，拉黑/取消拉黑通过 cache_bus 广播失效所有实例
+- 批量接口 get_users_who_blocked()：N 个用户中谁拉黑了 X，只需读取 X 的 in 集合
+"""
+
+import logging
+import threading
+import time
+from typing import Iterable
+
+from sqlalchemy.orm import Session
+
+from .cache_bus import register_handler, publish_invalidation
+from .models import BlockList
+from .redis_client import get_redis, fire_and_forget
+
+logger = logging.getLogger(__name__)
+
+_NAMESPACE = "blocks"
+_EMPTY = "__empty__"  # 空集合占位符
+
+_L1_MAXSIZE = 8192
+_L1_TTL = 120
+_L2_TTL = 300
+
+_EMPTY_ENTRY = (frozenset(), frozenset())
+
+
+def _redis_key(user_id: int) -> str:
+    return f"blockrel:{user_id}"
+
+
+def _entry_to_members(entry: tuple[frozenset, frozenset]) -> list[str]:
+    outgoing, incoming = entry
+    members = [f"o:{uid}" for uid in outgoing] + [f"i:{uid}" for uid in incoming]
+    return members or [_EMPTY]
+
+
+def _entry_from_members(members: Iterable[str]) -> tuple[frozenset, frozenset]:
+    outgoing, incoming = set(), set()
+    for member in members:
+        if member == _EMPTY:
+            continue
+        direction, _, uid = member.partition(":")
+        if direction == "o":
+            outgoing.add(int(uid))
+        elif direction == "i":
+            incoming.add(int(uid))
+    if not outgoing and not incoming:
+        return _EMPTY_ENTRY
+    return frozenset(outgoing), frozenset(incoming)
+
+
+def _load_from_db(db: Session, user_id: int) -> tuple[frozenset, frozenset]:
+    """一次查询取回双向拉黑关系"""
+    rows = (
+        db.query(BlockList.user_id, BlockList.blocked_user_id)
+        .filter((BlockList.user_id == user_id) | (BlockList.blocked_user_id == user_id))
+        .all()
+    )
+    if not rows:
+        return _EMPTY_ENTRY
+    outgoing = frozenset(blocked_id for uid, blocked_id in rows if uid == user_id)
+    incoming = frozenset(uid for uid, blocked_id in rows if blocked_id == user_id)
+    return outgoing, incoming
+
+
+class BlockCache:
+    """两级拉黑关系缓存"""
+
+    def __init__(self):
+        try:
+            from cachetools import TTLCache
+            self._l1 = TTLCache(maxsize=_L1_MAXSIZE, ttl=_L1_TTL)
+        except ImportError:
+            self._l1 = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+        }
+
+    # ----- L1 -----
+
+    def _l1_get(self, user_id: int):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._l1.get(user_id)
+            if cached is None:
+                return None
+            entry, expire_at = cached
+            if expire_at <= now:
+                self._l1.pop(user_id, None)
+                return None
+            self._stats["l1_hits"] += 1
+            return entry
+
+    def _l1_set(self, user_id: int, entry: tuple[frozenset, frozenset]):
+        with self._lock:
+            if not hasattr(self._l1, "maxsize") and len(self._l1) >= _L1_MAXSIZE:
+                self._l1.pop(next(iter(self._l1)), None)  # dict 降级：淘汰最早写入
+            self._l1[user_id] = (entry, time.monotonic() + _L1_TTL)
+
+    def evict_local(self, keys: list[str]):
+        """cache_bus 回调：清除本实例 L1（keys 为空时清空全部）"""
+        with self._lock:
+            if not keys:
+                self._l1.clear()
+                return
+            for key in keys:
+                self._l1.pop(int(key), None)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    # ----- 读取 -----
+
+    def _load_and_fill(self, db: Session, user_id: int) -> tuple[frozenset, frozenset]:
+        self._count("misses")
+        entry = _load_from_db(db, user_id)
+        self._l1_set(user_id, entry)
+        return entry
+
+    async def get(self, db: Session, user_id: int) -> tuple[frozenset, frozenset]:
+        """异步读取 (out, in)：L1 → Redis → DB"""
+        entry = self._l1_get(user_id)
+        if entry is not None:
+            return entry
+
+        r = get_redis()
+        if r:
+            try:
+                members = await r.smembers(_redis_key(user_id))
+                if members:
+                    entry = _entry_from_members(members)
+                    self._count("l2_hits")
+                    self._l1_set(user_id, entry)
+                    return entry
+            except Exception as e:
+                logger.warning(f"[BlockCache] Redis 读取失败: user_id={user_id} {e}")
+
+        entry = self._load_and_fill(db, user_id)
+        if r:
+            await self._redis_set(user_id, entry)
+        return entry
+
+    def get_sync(self, db: Session, user_id: int) -> tuple[frozenset, frozenset]:
+        """同步读取（线程池中的 def 路由）：L1 → DB，Redis 回写 fire-and-forget"""
+        entry = self._l1_get(user_id)
+        if entry is not None:
+            return entry
+
+        entry = self._load_and_fill(db, user_id)
+        if get_redis():
+            fire_and_forget(self._redis_set(user_id, entry))
+        return entry
+
+    async def _redis_set(self, user_id: int, entry: tuple[frozenset, frozenset]):
+        r = get_redis()
+        if not r:
+            return
+        try:
+            key = _redis_key(user_id)
+            pipe = r.pipeline()
+            await pipe.delete(key)
+            await pipe.sadd(key, *_entry_to_members(entry))
+            await pipe.expire(key, _L2_TTL)
+            await pipe.execute()
+        except Exception:
+            logger.warning(f"[BlockCache] Redis 写入失败: user_id={user_id}")
+
+    # ----- 失效 -----
+
+    async def ainvalidate(self, *user_ids: int):
+        """删除 L2 并广播失效（所有实例清除 L1）"""
+        ids = [uid for uid in user_ids if uid]
+        if not ids:
+            return
+        self._count("invalidations")
+        r = get_redis()
+        if r:
+            try:
+                await r.delete(*[_redis_key(uid) for uid in ids])
+            except Exception:
+                logger.warning(f"[BlockCache] Redis 删除失败: user_ids={ids}")
+        await publish_invalidation(_NAMESPACE, ids)
+
+    def invalidate(self, *user_ids: int):
+        """同步版本：本地 L1 立即失效，L2 删除与广播 fire-and-forget"""
+        self.evict_local([str(uid) for uid in user_ids if uid])
+        fire_and_forget(self.ainvalidate(*user_ids))
+
+    # ----- 指标 -----
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["l1_size"] = len(self._l1)
+        lookups = stats["l1_hits"] + stats["l2_hits"] + stats["misses"]
+        stats["hit_ratio"] = round(1 - stats["misses"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+block_cache = BlockCache()
+register_handler(_NAMESPACE, block_cache.evict_local)
+
+
+def get_block_cache() -> BlockCache:
+    """获取全局拉黑关系缓存"""
+    return block_cache
@@ -0,0 +1,130 @@
+"""
+跨实例缓存失效总线
+
+进程内缓存（L1）在多 worker / 多实例部署下只能靠 TTL 过期，
+某个实例修改数据后，其他实例会继续返回旧值直到 TTL 到期。
+
+本模块提供统一的失效广播：
+- 各缓存模块通过 register_handler(namespace, handler) 注册本地失效回调
+- publish_invalidation(namespace, keys) 先执行本地回调，
+  再通过 Redis Pub/Sub 频道 `cache:invalidate` 广播给所有实例
+- 订阅循环收到其他实例的消息后执行对应回调（忽略自己发出的消息）
+- Redis 不可用时退化为仅本地失效
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from typing import Callable, Dict, Iterable, Optional
+
+from .redis_client import get_redis, fire_and_forget
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache:invalidate"
+
+# 实例标识（区分自己发出的消息）
+INSTANCE_ID = uuid.uuid4().hex[:12]
+
+# namespace -> handler(keys)，keys 为空列表表示清空整个命名空间
+_handlers: Dict[str, Callable[[list[str]], None]] = {}
+_subscriber_task: Optional[asyncio.Task] = None
+
+
+def register_handler(namespace: str, handler: Callable[[list[str]], None]) -> None:
+    """注册本地失效回调（模块导入时调用）"""
+    _handlers[namespace] = handler
+
+
+def _apply_local(namespace: str, keys: list[str]) -> None:
+    handler = _handlers.get(namespace)
+    if handler is None:
+        return
+    try:
+        handler(keys)
+    except Exception as e:
+        logger.warning(f"[CacheBus] 本地失效回调异常: ns={namespace} {e}")
+
+
+async def publish_invalidation(namespace: str, keys: Iterable = ()) -> None:
+    """失效本地缓存并广播给其他实例"""
+    key_list = [str(k) for k in keys]
+    _apply_local(namespace, key_list)
+    r = get_redis()
+    if r:
+        try:
+            payload = json.dumps({"ns": namespace, "keys": key_list, "origin": INSTANCE_ID})
+            await r.publish(CHANNEL, payload)
+        except Exception as e:
+            logger.warning(f"[CacheBus] 广播失效消息失败: ns={namespace} {e}")
+
+
+def publish_invalidation_nowait(namespace: str, keys: Iterable = ()) -> None:
+    """同步版本：本地立即失效，广播以 fire-and-forget 方式发出"""
+    key_list = [str(k) for k in keys]
+    _apply_local(namespace, key_list)
+    r = get_redis()
+    if r:
+        payload = json.dumps({"ns": namespace, "keys": key_list, "origin": INSTANCE_ID})
+        fire_and_forget(_publish_raw(payload))
+
+
+async def _publish_raw(payload: str) -> None:
+    r = get_redis()
+    if r:
+        try:
+            await r.publish(CHANNEL, payload)
+        except Exception as e:
+            logger.warning(f"[CacheBus] 广播失效消息失败: {e}")
+
+
+async def _subscriber_loop() -> None:
+    """后台订阅循环（断线自动重连）"""
+    while True:
+        r = get_redis()
+        if not r:
+            await asyncio.sleep(5)
+            continue
+        try:
+            pubsub = r.pubsub()
+            await pubsub.subscribe(CHANNEL)
+            logger.info(f"[CacheBus] 已订阅 {CHANNEL} (instance={INSTANCE_ID})")
+            async for raw_msg in pubsub.listen():
+                if raw_msg["type"] != "message":
+                    continue
+                try:
+                    data = json.loads(raw_msg["data"])
+                except (json.JSONDecodeError, TypeError) as e:
+                    logger.warning(f"[CacheBus] 无法解析失效消息: {e}")
+                    continue
+                if data.get("origin") == INSTANCE_ID:
+                    continue
+                _apply_local(data.get("ns", ""), list(data.get("keys") or []))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[CacheBus] Pub/Sub 连接断开，3 秒后重连: {e}")
+            await asyncio.sleep(3)
+
+
+async def start_subscriber() -> None:
+    """启动订阅任务（app startup 时调用，Redis 不可用时跳过）"""
+    global _subscriber_task
+    if not get_redis():
+        logger.info("[CacheBus] Redis 不可用，跨实例失效广播未启动")
+        return
+    if _subscriber_task is None or _subscriber_task.done():
+        _subscriber_task = asyncio.create_task(_subscriber_loop())
+
+
+async def stop_subscriber() -> None:
+    """停止订阅任务（app shutdown 时调用）"""
+    global _subscriber_task
+    if _subscriber_task:
+        _subscriber_task.cancel()
+        try:
+            await _subscriber_task
+        except asyncio.CancelledError:
+            pass
+        _subscriber_task = None
@@ -36,6 +36,52 @@ class Settings(BaseSettings):
     # Redis 配置（为空时禁用 Redis，全部降级回本地内存/DB 直查）
     REDIS_URL: str = ""
     
+    # 密码哈希（bcrypt 在独立进程池中执行，避免占用共享线程池）
+    PASSWORD_HASH_WORKERS: int = 2  # 哈希进程数
+    PASSWORD_HASH_MAX_PENDING: int = 16  # 排队上限，超出直接返回 429
+    BCRYPT_ROUNDS: int = 12  # bcrypt cost，修改后旧哈希在登录成功时透明升级
+    PASSWORD_REHASH_ON_LOGIN: bool = True
+
+    # 速率限制：本地令牌桶与 Redis 对账间隔（秒）
+    RATE_LIMIT_SYNC_INTERVAL: float = 1.0
+
+    # 批量审核流水线
+    MODERATION_CONCURRENCY: int = 4  # 同时进行的 LLM 请求数
+    MODERATION_PAGE_SIZE: int = 200  # 每页领取的待审核条数（按 ID keyset 分页）
+    MODERATION_MAX_INPUT_TOKENS: int = 3000  # 单次 LLM 请求的输入 token 预算（含 Prompt）
+    MODERATION_VERDICT_TTL: int = 7 * 24 * 3600  # 审核结论缓存时长（秒）
+    MODERATION_SIMHASH_DISTANCE: int = 0  # 近似重复判定的 SimHash 汉明距离，0 为关闭（建议 3）
+    MODERATION_LEASE_SECONDS: int = 300  # 审核队列条目领取后的租约时长（秒），超时未完成可被其他 worker 重新领取
+    MODERATION_MAX_ATTEMPTS: int = 5  # 领取次数上限，超过后转入死信
+    MODERATION_RETRY_BACKOFF: int = 60  # LLM 请求失败后的首次重试延迟（秒），之后指数退避
+
+    # 出站 HTTP（审核 LLM / 图床 / OAuth）：重试退避与熔断
+    OUTBOUND_RETRY_BASE_DELAY: float = 0.5  # 重试退避基数（秒），全抖动指数退避
+    OUTBOUND_RETRY_MAX_DELAY: float = 8.0  # 单次重试等待上限（秒）
+    OUTBOUND_BREAKER_THRESHOLD: int = 5  # 连续失败多少次后熔断
+    OUTBOUND_BREAKER_COOLDOWN: float = 30.0  # 熔断冷却时间（秒），探测失败后翻倍
+    OUTBOUND_BREAKER_MAX_COOLDOWN: float = 300.0  # 冷却时间上限（秒）
+
+    # 通知保留：已读且早于 N 天的通知按批归档/清理（0 为关闭）
+    NOTIFICATION_RETENTION_DAYS: int = 90
+    NOTIFICATION_RETENTION_ARCHIVE: bool = True  # True=写入 notification_archives 后删除，False=直接删除
+    NOTIFICATION_RETENTION_BATCH: int = 1000  # 每批处理条数（每批一个事务）
+    NOTIFICATION_RETENTION_INTERVAL: int = 3600  # 两轮清理之间的间隔（秒）
+
+    # 聚合通知：like / follow / new_post 在窗口内（且未读）合并为一行，首个事件立即推送，之后的合并按通知防抖
+    NOTIFICATION_AGGREGATE_WINDOW: int = 3600  # 合并窗口（秒），0 为关闭聚合
+    NOTIFICATION_PUSH_DEBOUNCE: float = 5.0  # 聚合通知合并后推送的防抖延迟（秒）
+
+    # 通知计数：Redis 镜像 TTL（秒），计数行与通知表的对账间隔（秒，0 为关闭）
+    NOTIFICATION_COUNT_CACHE_TTL: int = 300
+    NOTIFICATION_COUNTER_RECONCILE_INTERVAL: int = 6 * 3600
+
+    # 单例后台任务（浏览量回写）的主节点租约时长（秒），持有者失联后其他实例在该时间内接管
+    LEADER_LEASE_TTL: float = 30.0
+
+    # 拉黑过滤：拉黑人数超过该阈值时改用 NOT EXISTS 反连接（见 benchmark_block_filter.py）
+    BLOCK_FILTER_ANTIJOIN_THRESHOLD: int = 200
+    
     # 图床配置 (CloudFlare ImgBed)
     IMGBED_API_URL: str = "https://image.astrdark.cyou"  # 图床 API 地址
     IMGBED_API_TOKEN: str = ""  # 图床 API Token
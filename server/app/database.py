@@ -37,6 +37,15 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def dialect_insert(db, table):
+    """INSERT 构造（支持 ON CONFLICT / RETURNING；PostgreSQL 与 SQLite 语法一致，方言对象不同）"""
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    if db.bind.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
 def get_db():
     """获取数据库会话（用于 HTTP 请求）"""
     db = SessionLocal()
@@ -0,0 +1,307 @@
+"""
+出站 HTTP 客户端层
+
+审核 LLM、图床、OAuth 提供方都通过 request(upstream, ...) 访问：
+- 客户端注册表：按 (上游, 超时档位) 缓存长期存活的 httpx.AsyncClient，连接池与默认超时按上游配置（UPSTREAMS），
+  需要其他超时的调用方取得同一上游下另一个档位的客户端，不再每次新建；全部在 shutdown 时关闭
+- 安装了 h2 时启用 HTTP/2（requirements 中为 httpx[http2]），否则退回 HTTP/1.1
+- 重试：连接错误、超时、429/5xx（500/502/503/504） 按「全抖动」指数退避重试；
+  非幂等请求（POST 等）默认不重试，调用方确认可安全重放时传 retry=True
+- 熔断：连续失败达到阈值后熔断打开，冷却期内直接抛出 UpstreamUnavailable（不等待超时）；
+  冷却结束后放行一个探测请求，成功则恢复，失败则冷却时间翻倍（上限 OUTBOUND_BREAKER_MAX_COOLDOWN）
+- 指标：各上游的请求数、失败数、熔断次数、最近请求的 p50/p95 延迟，见 GET /api/admin/upstreams
+"""
+
+import asyncio
+import importlib.util
+import logging
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+_HTTP2 = importlib.util.find_spec("h2") is not None
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+_IDEMPOTENT = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+_LATENCY_WINDOW = 200  # 每个上游保留的最近延迟样本数
+
+
+class UpstreamUnavailable(httpx.RequestError):
+    """上游熔断中，请求未发出（继承 RequestError，已有的 except httpx.RequestError 分支可直接处理）"""
+
+
+@dataclass(frozen=True)
+class UpstreamProfile:
+    """上游配置"""
+    timeout: float = 30.0
+    connect_timeout: float = 5.0
+    max_connections: int = 20
+    max_keepalive: int = 10
+    retries: int = 2
+
+
+UPSTREAMS: dict[str, UpstreamProfile] = {
+    "moderation": UpstreamProfile(timeout=30.0, max_connections=32, max_keepalive=16),
+    # 管理后台的测试审核 / 拉取模型列表：地址和密钥可能是管理员正在试填的，独立熔断，不影响线上审核
+    "moderation_admin": UpstreamProfile(timeout=30.0, max_connections=4, max_keepalive=2, retries=0),
+    "imagebed": UpstreamProfile(timeout=60.0, max_connections=10, max_keepalive=5, retries=1),
+    "github": UpstreamProfile(timeout=15.0, max_connections=10, max_keepalive=5),
+    "linuxdo": UpstreamProfile(timeout=15.0, max_connections=10, max_keepalive=5),
+    "default": UpstreamProfile(),
+}
+
+
+class CircuitBreaker:
+    """连续失败计数熔断器（closed → open → half-open）"""
+
+    def __init__(self, threshold: int, cooldown: float, max_cooldown: float):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.open_count = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True  # 只放行一个探测请求
+            return True
+        return False
+
+    def abandon_probe(self):
+        """探测请求未得出结果（被取消或抛出非网络异常）：按失败处理，避免 probing 永远占位"""
+        if self.probing:
+            self.record_failure()
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.cooldown = self.base_cooldown
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing:
+            # 探测失败：重新打开，冷却时间翻倍
+            self.probing = False
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self.opened_at = time.monotonic()
+            self.open_count += 1
+        elif self.opened_at is None and self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self.open_count += 1
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+
+class _Upstream:
+    def __init__(self, name: str, profile: UpstreamProfile):
+        self.name = name
+        self.profile = profile
+        self.clients: dict[float, httpx.AsyncClient] = {}  # 超时档位 -> 客户端
+        self.breaker = CircuitBreaker(
+            settings.OUTBOUND_BREAKER_THRESHOLD,
+            settings.OUTBOUND_BREAKER_COOLDOWN,
+            settings.OUTBOUND_BREAKER_MAX_COOLDOWN,
+        )
+        self.latencies: deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self.stats = {"requests": 0, "failures": 0, "retries": 0, "short_circuited": 0}
+
+    def get_client(self, timeout: Optional[float] = None) -> httpx.AsyncClient:
+        profile = self.profile
+        timeout = float(timeout or profile.timeout)
+        client = self.clients.get(timeout)
+        if client is None or client.is_closed:
+            with _lock:
+                client = self.clients.get(timeout)
+                if client is None or client.is_closed:
+                    client = httpx.AsyncClient(
+                        http2=_HTTP2,
+                        timeout=httpx.Timeout(timeout, connect=profile.connect_timeout),
+                        limits=httpx.Limits(
+                            max_connections=profile.max_connections,
+                            max_keepalive_connections=profile.max_keepalive,
+                        ),
+                    )
+                    self.clients[timeout] = client
+        return client
+
+
+_upstreams: dict[str, _Upstream] = {}
+_lock = threading.Lock()
+
+
+def _get_upstream(name: str) -> _Upstream:
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        with _lock:
+            upstream = _upstreams.get(name)
+            if upstream is None:
+                upstream = _Upstream(name, UPSTREAMS.get(name, UPSTREAMS["default"]))
+                _upstreams[name] = upstream
+    return upstream
+
+
+def is_available(upstream: str) -> bool:
+    """上游当前是否可用（熔断打开期间返回 False，批量任务可据此跳过本轮）"""
+    return _get_upstream(upstream).breaker.state != "open"
+
+
+def breaker_state(upstream: str) -> str:
+    """熔断器状态：closed / open / half_open（半开时只会放行一个探测请求）"""
+    return _get_upstream(upstream).breaker.state
+
+
+def get_client(upstream: str, timeout: Optional[float] = None) -> httpx.AsyncClient:
+    """从注册表获取长期客户端（不经过重试与熔断，仅用于流式等特殊场景）
+
+    同一 (upstream, timeout) 始终返回同一个客户端，调用方不要自行关闭。
+    """
+    return _get_upstream(upstream).get_client(timeout)
+
+
+def _backoff(attempt: int) -> float:
+    """全抖动指数退避：[0, min(上限, 基数 * 2^attempt)]"""
+    cap = min(settings.OUTBOUND_RETRY_MAX_DELAY, settings.OUTBOUND_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+async def request(
+    upstream: str,
+    method: str,
+    url: str,
+    *,
+    retry: Optional[bool] = None,
+    timeout: Optional[float] = None,
+    **kwargs,
+) -> httpx.Response:
+    """经重试与熔断发送请求
+
+    Args:
+        upstream: 上游名称（UPSTREAMS 中的键，未知名称使用 default 配置）
+        retry: 是否允许重试，默认仅幂等方法重试
+        timeout: 超时档位（秒），默认使用上游配置
+        **kwargs: 透传给 httpx.AsyncClient.request
+
+    Raises:
+        UpstreamUnavailable: 熔断打开，请求未发出（只在一次都没有发出时抛出）
+        httpx.RequestError: 重试耗尽（或重试被熔断拦下）时的最后一次错误
+    """
+    up = _get_upstream(upstream)
+    method = method.upper()
+    if retry is None:
+        retry = method in _IDEMPOTENT
+    attempts = 1 + (up.profile.retries if retry else 0)
+
+    last_error: Optional[httpx.RequestError] = None
+    for attempt in range(attempts):
+        if not up.breaker.allow():
+            up.stats["short_circuited"] += 1
+            if last_error is not None:
+                # 请求已真实发出并失败，重试时才被熔断拦下：按真实失败上报
+                raise last_error
+            raise UpstreamUnavailable(
+                f"上游 {upstream} 熔断中，{up.breaker.retry_after():.0f} 秒后重试"
+            )
+        if attempt:
+            up.stats["retries"] += 1
+        up.stats["requests"] += 1
+        started = time.perf_counter()
+        settled = False  # 本次请求是否已记录到熔断器
+        try:
+            try:
+                response = await up.get_client(timeout).request(method, url, **kwargs)
+            except httpx.RequestError as e:
+                up.latencies.append(time.perf_counter() - started)
+                up.stats["failures"] += 1
+                up.breaker.record_failure()
+                settled = True
+                if attempt + 1 >= attempts:
+                    raise
+                last_error = e
+                logger.info(f"[Outbound] {upstream} {method} 失败，重试 ({attempt + 1}/{attempts - 1}): {e!r}")
+                await asyncio.sleep(_backoff(attempt))
+                continue
+
+            up.latencies.append(time.perf_counter() - started)
+            if response.status_code >= 500:
+                up.stats["failures"] += 1
+                up.breaker.record_failure()
+            else:
+                up.breaker.record_success()
+            settled = True
+        finally:
+            if not settled:
+                # 取消（CancelledError）或非 httpx 异常：半开探测不能一直占着 probing
+                up.breaker.abandon_probe()
+        if response.status_code in _RETRY_STATUS and attempt + 1 < attempts:
+            delay = _backoff(attempt)
+            retry_after = response.headers.get("retry-after", "")
+            if retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), settings.OUTBOUND_RETRY_MAX_DELAY))
+            last_error = httpx.RequestError(f"上游返回 {response.status_code}", request=response.request)
+            await response.aclose()
+            await asyncio.sleep(delay)
+            continue
+        return response
+    raise AssertionError("unreachable")
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def get_upstream_stats() -> dict:
+    """各上游的请求统计、熔断状态和延迟分位数（毫秒）"""
+    result = {}
+    for name, up in list(_upstreams.items()):
+        samples = list(up.latencies)
+        result[name] = {
+            **up.stats,
+            "breaker": up.breaker.state,
+            "breaker_opens": up.breaker.open_count,
+            "consecutive_failures": up.breaker.failures,
+            "p50_ms": round(_percentile(samples, 0.5) * 1000, 1),
+            "p95_ms": round(_percentile(samples, 0.95) * 1000, 1),
+            "http2": _HTTP2,
+            "clients": len(up.clients),
+        }
+    return result
+
+
+async def close_all():
+    """关闭所有上游客户端（app shutdown 时调用）"""
+    for up in list(_upstreams.values()):
+        clients, up.clients = list(up.clients.values()), {}
+        for client in clients:
+            if not client.is_closed:
+                await client.aclose()
@@ -0,0 +1,265 @@
+"""
+单例后台任务的主节点选举（租约）
+
+浏览量回写等任务在每个 worker / 实例的 startup 中都会启动，多实例部署时会重复执行。
+（批量审核改由 moderation_queue 的 SKIP LOCKED 租约分摊，可在所有 worker 上并行运行。）
+run_singleton() 为每个任务竞选一份集群级租约，只有持有者真正运行任务：
+
+- Redis 后端：`lease:{name}` = 持有者 ID，SET NX PX 获取，Lua 脚本按持有者续期/释放
+- PostgreSQL 后端（Redis 不可用时）：在独占连接上 pg_try_advisory_lock，连接存活即持有
+- 其他数据库（SQLite 本地开发）：单进程部署，直接视为持有
+- 续期间隔为 TTL 的 1/3；续期失败（网络分区、Redis 重启）立即停止任务，
+  持有者崩溃后租约在 TTL 内过期，其他实例接管（failover）
+- 查看各租约当前持有者：GET /api/admin/leases
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+import zlib
+from typing import Awaitable, Callable, Optional
+
+from .config import get_settings
+from .database import engine
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# 本进程的持有者 ID（主机名:PID:随机后缀，区分同一主机上的多个 worker）
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _lease_key(name: str) -> str:
+    return f"lease:{name}"
+
+
+def _advisory_key(name: str) -> int:
+    """租约名 → advisory lock 键（固定命名空间前缀，避免与其他 advisory lock 冲突）"""
+    return (0x4C45 << 32) | zlib.crc32(name.encode("utf-8"))
+
+
+def _backend() -> str:
+    if get_redis():
+        return "redis"
+    if engine.dialect.name == "postgresql":
+        return "postgres"
+    return "local"
+
+
+class LeaderLease:
+    """一份命名租约"""
+
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self.held = False
+        self.backend = _backend()
+        self._pg_conn = None  # PostgreSQL 后端：持有 advisory lock 的独占连接
+
+    # ----- PostgreSQL（同步，在线程中执行） -----
+
+    def _pg_acquire(self) -> bool:
+        from sqlalchemy import text
+        conn = engine.connect()
+        try:
+            got = conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": _advisory_key(self.name)}
+            ).scalar()
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if got:
+            self._pg_conn = conn
+            return True
+        conn.close()
+        return False
+
+    def _pg_check(self) -> bool:
+        from sqlalchemy import text
+        try:
+            self._pg_conn.execute(text("SELECT 1"))
+            self._pg_conn.commit()
+            return True
+        except Exception:
+            self._pg_release()
+            return False
+
+    def _pg_release(self):
+        conn, self._pg_conn = self._pg_conn, None
+        if conn is None:
+            return
+        try:
+            # 关闭前显式释放；连接断开时 PG 也会自动释放 session 级锁
+            from sqlalchemy import text
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _advisory_key(self.name)})
+            conn.commit()
+        except Exception:
+            pass
+        finally:
+            conn.close()
+
+    # ----- 公共接口 -----
+
+    async def acquire(self) -> bool:
+        """尝试获取租约（非阻塞）"""
+        self.backend = _backend()
+        if self.backend == "redis":
+            ok = await get_redis().set(
+                _lease_key(self.name), INSTANCE_ID, nx=True, px=int(self.ttl * 1000)
+            )
+            self.held = bool(ok)
+        elif self.backend == "postgres":
+            self.held = await asyncio.to_thread(self._pg_acquire)
+        else:
+            self.held = True
+        return self.held
+
+    async def renew(self) -> bool:
+        """续期，租约已被他人持有或后端不可用时返回 False"""
+        if not self.held:
+            return False
+        if self.backend == "redis":
+            r = get_redis()
+            ok = r is not None and await r.eval(
+                _RENEW_SCRIPT, 1, _lease_key(self.name), INSTANCE_ID, int(self.ttl * 1000)
+            )
+            self.held = bool(ok)
+        elif self.backend == "postgres":
+            self.held = await asyncio.to_thread(self._pg_check)
+        return self.held
+
+    async def release(self):
+        """释放租约（仅当仍由本实例持有）"""
+        was_held, self.held = self.held, False
+        if not was_held:
+            return
+        if self.backend == "redis":
+            r = get_redis()
+            if r is not None:
+                await r.eval(_RELEASE_SCRIPT, 1, _lease_key(self.name), INSTANCE_ID)
+        elif self.backend == "postgres":
+            await asyncio.to_thread(self._pg_release)
+
+
+_leases: dict[str, LeaderLease] = {}
+
+
+def is_leader(name: str) -> bool:
+    """本实例当前是否持有该租约（未通过 run_singleton 注册的任务视为持有）"""
+    lease = _leases.get(name)
+    return lease is None or lease.held
+
+
+async def run_singleton(
+    name: str,
+    job: Callable[[], Awaitable[None]],
+    ttl: Optional[float] = None,
+):
+    """竞选租约并在持有期间运行 job（在 main.py startup 中以后台任务启动）
+
+    job 为长期运行的协程函数；失去租约时 job 被取消，取消本任务时先停止 job 再释放租约。
+    """
+    lease = LeaderLease(name, ttl or settings.LEADER_LEASE_TTL)
+    _leases[name] = lease
+    interval = lease.ttl / 3
+    job_task: Optional[asyncio.Task] = None
+    try:
+        while True:
+            try:
+                if lease.held:
+                    if not await lease.renew():
+                        logger.warning(f"[Leader] 租约 {name} 已丢失，停止任务")
+                elif await lease.acquire():
+                    logger.info(f"[Leader] 获得租约 {name}（{lease.backend}），启动任务")
+                    job_task = asyncio.create_task(job())
+            except Exception as e:
+                logger.warning(f"[Leader] 租约 {name} 续期/获取失败: {e}")
+                lease.held = False
+
+            if not lease.held and job_task is not None:
+                await _cancel(job_task)
+                job_task = None
+            elif job_task is not None and job_task.done():
+                # 任务意外退出：释放租约，让其他实例（或下一轮的自己）重新接管
+                logger.warning(f"[Leader] 任务 {name} 已退出，释放租约")
+                job_task = None
+                await lease.release()
+            await asyncio.sleep(interval)
+    finally:
+        if job_task is not None:
+            await _cancel(job_task)
+        try:
+            await lease.release()
+        except Exception as e:
+            logger.warning(f"[Leader] 释放租约 {name} 失败: {e}")
+
+
+async def _cancel(task: asyncio.Task):
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.warning(f"[Leader] 任务退出异常: {e}")
+
+
+async def get_lease_status() -> list[dict]:
+    """各租约的当前持有者（集群视角）"""
+    r = get_redis()
+    result = []
+    for name, lease in _leases.items():
+        item = {
+            "name": name,
+            "backend": lease.backend,
+            "ttl": lease.ttl,
+            "held_by_me": lease.held,
+            "holder": INSTANCE_ID if lease.held else None,
+            "expires_in_ms": None,
+        }
+        if lease.backend == "redis" and r is not None:
+            pipe = r.pipeline(transaction=False)
+            pipe.get(_lease_key(name))
+            pipe.pttl(_lease_key(name))
+            holder, pttl = await pipe.execute()
+            item["holder"] = holder
+            item["expires_in_ms"] = pttl if pttl and pttl > 0 else None
+        elif lease.backend == "postgres":
+            item["holder"] = await asyncio.to_thread(_pg_holder, name)
+        result.append(item)
+    return result
+
+
+def _pg_holder(name: str) -> Optional[str]:
+    """查询持有 advisory lock 的后端进程（客户端地址 / PID）"""
+    from sqlalchemy import text
+    key = _advisory_key(name)
+    with engine.connect() as conn:
+        row = conn.execute(text(
+            "SELECT a.client_addr, a.pid, a.application_name FROM pg_locks l "
+            "JOIN pg_stat_activity a ON a.pid = l.pid "
+            "WHERE l.locktype = 'advisory' AND l.granted "
+            "AND l.classid = :hi AND l.objid = :lo LIMIT 1"
+        ), {"hi": key >> 32, "lo": key & 0xFFFFFFFF}).first()
+    if row is None:
+        return None
+    return f"{row.client_addr or 'local'}:pg_pid={row.pid}"
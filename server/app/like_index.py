@@ -0,0 +1,144 @@
+"""
+用户点赞索引（Redis Set，完整集合）
+
+旧实现的 `likes:user:{id}:threads` 只是 300 秒的部分集合，
+无法区分「未点赞」和「未缓存」，每次仍要回源查 DB。
+
+- 每个用户每种目标一个完整集合：`liked:{uid}:thread` / `liked:{uid}:reply`
+- 集合内的 `__loaded__` 成员表示已从 DB 全量加载；首次查询时加载一次，之后增量维护
+- 查询一页 100 条回复只需一次 pipeline 内的 SMISMEMBER（同时返回加载标记），不回源 DB
+- 点赞时增量写入只作用于已全量加载的集合（脚本内检查加载标记后 SADD 并续期），
+  索引未加载时不写入，不会留下没有 TTL 的部分集合；加载采用并集写入（不先删除），与并发点赞不冲突
+- 点赞只增不减（目标被删除后残留的 ID 不会再被查询），无需处理移除
+- Redis 不可用时退化为一次 DB 查询
+"""
+
+import logging
+from typing import Iterable
+
+from sqlalchemy.orm import Session
+
+from .models import Like
+from .redis_client import get_redis, fire_and_forget
+
+logger = logging.getLogger(__name__)
+
+_LOADED = "__loaded__"  # 全量加载标记
+_TTL = 7 * 24 * 3600  # 不活跃用户的索引自然过期，访问时续期
+_LOAD_CHUNK = 1000
+
+# 仅当集合已全量加载（含加载标记）时加入成员并续期
+_ADD_SCRIPT = """
+if redis.call('sismember', KEYS[1], ARGV[1]) == 1 then
+    redis.call('sadd', KEYS[1], ARGV[2])
+    return redis.call('expire', KEYS[1], ARGV[3])
+end
+return 0
+"""
+
+TARGET_TYPES = ("thread", "reply")
+
+
+def _key(user_id: int, target_type: str) -> str:
+    return f"liked:{user_id}:{target_type}"
+
+
+def _query_db(db: Session, user_id: int, target_type: str, ids: list[int] = None) -> set[int]:
+    query = db.query(Like.target_id).filter(
+        Like.user_id == user_id, Like.target_type == target_type
+    )
+    if ids is not None:
+        query = query.filter(Like.target_id.in_(ids))
+    return {row[0] for row in query.all()}
+
+
+async def _load_full(r, db: Session, user_id: int, target_type: str) -> set[int]:
+    """从 DB 全量加载并写入索引（并集写入，不覆盖并发增量）"""
+    liked = _query_db(db, user_id, target_type)
+    members = [_LOADED] + [str(tid) for tid in liked]
+    key = _key(user_id, target_type)
+    pipe = r.pipeline()
+    for i in range(0, len(members), _LOAD_CHUNK):
+        pipe.sadd(key, *members[i:i + _LOAD_CHUNK])
+    pipe.expire(key, _TTL)
+    await pipe.execute()
+    return liked
+
+
+async def get_liked_ids(
+    db: Session,
+    user_id: int,
+    thread_ids: Iterable[int] = (),
+    reply_ids: Iterable[int] = (),
+) -> tuple[set[int], set[int]]:
+    """批量查询用户点赞状态，返回 (已点赞帖子 ID, 已点赞回复 ID)
+
+    稳态下为一次 Redis 往返；索引未加载的类型首次查询时全量加载。
+    """
+    wanted = {"thread": list(thread_ids), "reply": list(reply_ids)}
+    result = {"thread": set(), "reply": set()}
+    types = [t for t in TARGET_TYPES if wanted[t]]
+    if not types:
+        return result["thread"], result["reply"]
+
+    r = get_redis()
+    if r:
+        try:
+            pipe = r.pipeline()
+            for target_type in types:
+                key = _key(user_id, target_type)
+                pipe.smismember(key, [_LOADED] + [str(i) for i in wanted[target_type]])
+                pipe.expire(key, _TTL)
+            replies = await pipe.execute()
+
+            for idx, target_type in enumerate(types):
+                flags = replies[idx * 2]
+                if flags[0]:
+                    result[target_type] = {
+                        tid for tid, hit in zip(wanted[target_type], flags[1:]) if hit
+                    }
+                else:
+                    liked = await _load_full(r, db, user_id, target_type)
+                    result[target_type] = liked.intersection(wanted[target_type])
+            return result["thread"], result["reply"]
+        except Exception as e:
+            logger.warning(f"[LikeIndex] Redis 查询失败，降级 DB: user_id={user_id} {e}")
+
+    for target_type in types:
+        result[target_type] = _query_db(db, user_id, target_type, wanted[target_type])
+    return result["thread"], result["reply"]
+
+
+async def _add(user_id: int, target_type: str, target_id: int):
+    r = get_redis()
+    if not r:
+        return
+    try:
+        await r.eval(_ADD_SCRIPT, 1, _key(user_id, target_type), _LOADED, str(target_id), _TTL)
+    except Exception:
+        logger.warning(f"[LikeIndex] 增量写入失败: user_id={user_id} {target_type}={target_id}")
+
+
+def record_like(user_id: int, target_type: str, target_id: int) -> None:
+    """点赞提交后增量维护索引（fire-and-forget）
+
+    索引尚未加载时不写入，下次查询时全量加载会包含这次点赞。
+    """
+    if get_redis():
+        fire_and_forget(_add(user_id, target_type, target_id))
+
+
+async def _drop(user_id: int):
+    r = get_redis()
+    if not r:
+        return
+    try:
+        await r.delete(*[_key(user_id, t) for t in TARGET_TYPES])
+    except Exception:
+        logger.warning(f"[LikeIndex] 删除索引失败: user_id={user_id}")
+
+
+def drop_user_index(user_id: int) -> None:
+    """删除用户的点赞索引（注销/删除用户时调用）"""
+    if get_redis():
+        fire_and_forget(_drop(user_id))
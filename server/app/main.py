@@ -2,14 +2,16 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
-from slowapi.errors import RateLimitExceeded
 from .database import engine, Base
-from .routers import auth, threads, replies, admin, notifications, upload, oauth, sse, imagebed, blocks, likes, follows, share, dm
+from .routers import auth, threads, replies, admin, notifications, upload, oauth, sse, imagebed, blocks, likes, follows, share, dm, sync
 from .config import get_settings
 from .notifier import get_pusher
 from .sse import get_sse_manager
-from .rate_limit import limiter, rate_limit_exceeded_handler
+from .rate_limit import limiter, RateLimitExceeded, rate_limit_exceeded_handler
 from .redis_client import init_redis, close_redis, get_redis
+from . import cache_bus
+from .settings_utils import warm_settings_cache
+from .leader import run_singleton
 from .database import SessionLocal
 from .models import Thread
 import os
@@ -20,10 +22,14 @@ logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
-# 浏览量回写任务引用（用于 shutdown 时取消）
+# 浏览量回写任务引用（用于 shutdown 时取消；经租约选举，集群内只有一个实例真正执行）
 _flush_views_task: asyncio.Task | None = None
 # 批量审核任务引用（用于 shutdown 时取消）
 _batch_moderation_task: asyncio.Task | None = None
+# 通知保留任务引用（经租约选举，集群内只有一个实例真正执行）
+_notification_retention_task: asyncio.Task | None = None
+# 通知计数对账任务引用（经租约选举，集群内只有一个实例真正执行）
+_notification_reconcile_task: asyncio.Task | None = None
 
 # ---------- 浏览量定时回写 ----------
 _FLUSH_INTERVAL = 60  # 每 60 秒回写一次
@@ -121,7 +127,6 @@ app = FastAPI(
 )
 
 # 速率限制
-app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
 
 # CORS 配置 (P0 #2: allow_origins=["*"] + allow_credentials=True 不合法)
@@ -141,6 +146,7 @@ app.include_router(threads.router, prefix="/api")
 app.include_router(replies.router, prefix="/api")
 app.include_router(notifications.router, prefix="/api")
 app.include_router(dm.router, prefix="/api")
+app.include_router(sync.router, prefix="/api")
 app.include_router(upload.router, prefix="/api")
 app.include_router(imagebed.router, prefix="/api")
 app.include_router(blocks.router, prefix="/api")
@@ -185,24 +191,50 @@ def health():
 
 @app.on_event("startup")
 async def startup_event():
-    """应用启动时初始化 Redis 连接池 + SSE Pub/Sub 订阅器 + 浏览量回写任务 + 批量审核任务"""
-    global _flush_views_task, _batch_moderation_task
+    """应用启动时初始化 Redis 连接池 + 缓存失效订阅器 + 限流对账任务 + 设置快照预热 + SSE Pub/Sub 订阅器 + 浏览量回写任务 + 批量审核任务 + 通知保留任务 + 通知计数对账任务"""
+    global _flush_views_task, _batch_moderation_task, _notification_retention_task, _notification_reconcile_task
     await init_redis()
+    # 启动跨实例缓存失效广播订阅（Redis 可用时）
+    await cache_bus.start_subscriber()
+    # 启动限流令牌桶与 Redis 的批量对账（Redis 可用时）
+    await limiter.start()
+    # 预热系统设置快照（优先读取 Redis Hash）
+    db = SessionLocal()
+    try:
+        await warm_settings_cache(db)
+    except Exception as e:
+        logger.warning(f"[Settings] 设置快照预热失败，将在首次读取时加载: {e}")
+    finally:
+        db.close()
     # 启动 SSE 跨实例 Pub/Sub 订阅（Redis 可用时）
     await get_sse_manager().start_subscriber()
-    # 启动浏览量定时回写任务（Redis 可用时）
+    # 启动浏览量定时回写任务（Redis 可用时；竞选租约，集群内单实例执行）
     if get_redis():
-        _flush_views_task = asyncio.create_task(_flush_view_counts())
-        logger.info("[ViewFlush] 浏览量定时回写任务已启动")
-    # 启动批量审核定时任务
+        _flush_views_task = asyncio.create_task(run_singleton("view_flush", _flush_view_counts))
+        logger.info("[ViewFlush] 浏览量定时回写任务已启动（等待租约）")
+    # 启动批量审核定时任务（每个 worker 都运行，通过审核队列的 SKIP LOCKED 租约分摊工作）
     from .moderation import run_batch_moderation_loop
     _batch_moderation_task = asyncio.create_task(run_batch_moderation_loop())
     logger.info("[BatchMod] 批量审核定时任务已启动")
+    # 启动通知保留任务（归档/清理过期已读通知；竞选租约，集群内单实例执行）
+    if settings.NOTIFICATION_RETENTION_DAYS > 0:
+        from .notification_retention import run_retention_loop
+        _notification_retention_task = asyncio.create_task(
+            run_singleton("notification_retention", run_retention_loop)
+        )
+        logger.info("[Retention] 通知保留任务已启动（等待租约）")
+    # 启动通知计数对账任务（修正计数行与通知表的漂移；竞选租约，集群内单实例执行）
+    if settings.NOTIFICATION_COUNTER_RECONCILE_INTERVAL > 0:
+        from .notification_counters import run_reconcile_loop
+        _notification_reconcile_task = asyncio.create_task(
+            run_singleton("notification_counter_reconcile", run_reconcile_loop)
+        )
+        logger.info("[NotifyCounter] 通知计数对账任务已启动（等待租约）")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """关闭全局 httpx 客户端、浏览量回写任务、批量审核任务、SSE Pub/Sub 订阅器、Playwright 浏览器和 Redis 连接池"""
+    """关闭全局 httpx 客户端、浏览量回写任务、批量审核任务、通知保留任务、通知计数对账任务、SSE Pub/Sub 订阅器、Playwright 浏览器和 Redis 连接池"""
     # 关闭 Playwright 浏览器
     from .routers.share import _browser
     if _browser and _browser.is_connected():
@@ -211,11 +243,13 @@ async def shutdown_event():
             logger.info("[Share] Playwright browser closed")
         except Exception:
             pass
-    global _flush_views_task, _batch_moderation_task
-    from .moderation import _http_client
-    if _http_client and not _http_client.is_closed:
-        await _http_client.aclose()
-    # 停止浏览量回写任务（会触发最后一次回写）
+    global _flush_views_task, _batch_moderation_task, _notification_retention_task, _notification_reconcile_task
+    from .password_hasher import shutdown_executor
+    shutdown_executor()
+    # 关闭出站客户端注册表中的全部客户端（各上游、各超时档位）
+    from .http_client import close_all as close_outbound_clients
+    await close_outbound_clients()
+    # 停止浏览量回写任务（持有租约时会触发最后一次回写，然后释放租约）
     if _flush_views_task and not _flush_views_task.done():
         _flush_views_task.cancel()
         try:
@@ -231,8 +265,27 @@ async def shutdown_event():
         except asyncio.CancelledError:
             pass
         _batch_moderation_task = None
+    # 停止通知保留任务（当前批次与水位在同一事务中提交，中断后下一轮从水位继续）
+    if _notification_retention_task and not _notification_retention_task.done():
+        _notification_retention_task.cancel()
+        try:
+            await _notification_retention_task
+        except asyncio.CancelledError:
+            pass
+        _notification_retention_task = None
+    # 停止通知计数对账任务（已提交的批次不受影响）
+    if _notification_reconcile_task and not _notification_reconcile_task.done():
+        _notification_reconcile_task.cancel()
+        try:
+            await _notification_reconcile_task
+        except asyncio.CancelledError:
+            pass
+        _notification_reconcile_task = None
     # 停止 SSE Pub/Sub 订阅
     await get_sse_manager().stop_subscriber()
+    # 停止限流对账任务（会同步最后一批本地消耗）
+    await limiter.stop()
+    await cache_bus.stop_subscriber()
     await close_redis()
 
 
@@ -0,0 +1,221 @@
+"""
+@提及解析缓存（用户名 → 用户 ID，两级：进程内 L1 + Redis L2）
+
+回复和楼中楼每次都要把 @用户名 解析成用户 ID，被 @ 的往往是同一批热门 Bot。
+
+- L1：进程内 TTL/LRU 缓存，username → id
+- L2：Redis Hash `mention:ids`（username → id）；不存在的用户名写入独立的 `mention:absent:{username}`
+  字符串键（各自 EX 60 秒，共用一个 Hash 时每次写入都会续期，整个 Hash 永不过期）
+- 负缓存：不存在的用户名同样缓存，@everyone 之类的文本不会反复打到 DB
+- 失效：用户名只在注册和注销时变化，invalidate() 删除 L2 字段并通过 cache_bus 广播，所有实例同步清除 L1
+- 调用方都是同步路由（线程池中的 def 路由），统一走 resolve_sync()：L1 → L2（经 anyio.from_thread 回到事件循环读取，
+  不在 anyio 工作线程中时跳过）→ DB，Redis 回写 fire-and-forget（与 user_cache 一致）
+- 指标：管理后台 /admin/cache/stats 查看
+"""
+
+import logging
+import threading
+import time
+from typing import Iterable, Optional
+
+import anyio.from_thread
+from sqlalchemy.orm import Session
+
+from .cache_bus import publish_invalidation, register_handler
+from .models import User
+from .redis_client import fire_and_forget, get_redis
+
+logger = logging.getLogger(__name__)
+
+_NAMESPACE = "mention"
+_IDS_KEY = "mention:ids"
+_ABSENT_PREFIX = "mention:absent:"
+
+_L1_MAXSIZE = 8192
+_L1_TTL = 600  # 有跨实例失效广播兜底，L1 TTL 仅用于限制内存驻留
+_NEGATIVE_TTL = 60
+
+
+def _absent_key(username: str) -> str:
+    return f"{_ABSENT_PREFIX}{username}"
+
+
+class MentionResolver:
+    """两级用户名解析缓存"""
+
+    def __init__(self):
+        try:
+            from cachetools import TTLCache
+            self._l1 = TTLCache(maxsize=_L1_MAXSIZE, ttl=_L1_TTL)
+        except ImportError:
+            self._l1 = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+        }
+
+    # ----- L1 -----
+
+    def _l1_lookup(self, usernames: list[str]) -> tuple[dict[str, Optional[int]], list[str]]:
+        """返回 (已命中的 username → id（None 为负缓存）, 未命中的用户名)"""
+        now = time.monotonic()
+        found: dict[str, Optional[int]] = {}
+        missing: list[str] = []
+        with self._lock:
+            for name in usernames:
+                entry = self._l1.get(name)
+                if entry is None or entry[1] <= now:
+                    if entry is not None:
+                        self._l1.pop(name, None)
+                    missing.append(name)
+                    continue
+                found[name] = entry[0]
+                self._stats["negative_hits" if entry[0] is None else "l1_hits"] += 1
+        return found, missing
+
+    def _l1_set(self, resolved: dict[str, Optional[int]]):
+        now = time.monotonic()
+        with self._lock:
+            for name, user_id in resolved.items():
+                if not hasattr(self._l1, "maxsize") and len(self._l1) >= _L1_MAXSIZE:
+                    self._l1.pop(next(iter(self._l1)), None)  # dict 降级：淘汰最早写入
+                ttl = _L1_TTL if user_id is not None else _NEGATIVE_TTL
+                self._l1[name] = (user_id, now + ttl)
+
+    def evict_local(self, keys: list[str]):
+        """cache_bus 回调：清除本实例 L1（keys 为空时清空全部）"""
+        with self._lock:
+            if not keys:
+                self._l1.clear()
+                return
+            for key in keys:
+                self._l1.pop(key, None)
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    # ----- DB / Redis -----
+
+    def _load_from_db(self, db: Session, usernames: list[str]) -> dict[str, Optional[int]]:
+        self._count("misses", len(usernames))
+        rows = db.query(User.username, User.id).filter(User.username.in_(usernames)).all()
+        resolved: dict[str, Optional[int]] = {name: None for name in usernames}
+        resolved.update({username: user_id for username, user_id in rows})
+        self._l1_set(resolved)
+        return resolved
+
+    async def _redis_store(self, resolved: dict[str, Optional[int]]):
+        r = get_redis()
+        if not r or not resolved:
+            return
+        present = {name: user_id for name, user_id in resolved.items() if user_id is not None}
+        absent = [name for name, user_id in resolved.items() if user_id is None]
+        try:
+            pipe = r.pipeline(transaction=False)
+            if present:
+                pipe.hset(_IDS_KEY, mapping=present)
+            for name in absent:
+                pipe.set(_absent_key(name), "", ex=_NEGATIVE_TTL)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[MentionCache] Redis 写入失败: {e}")
+
+    # ----- 读取 -----
+
+    @staticmethod
+    def _ids_in_order(usernames: list[str], resolved: dict[str, Optional[int]]) -> list[int]:
+        ids: list[int] = []
+        for name in usernames:
+            user_id = resolved.get(name)
+            if user_id is not None and user_id not in ids:
+                ids.append(user_id)
+        return ids
+
+    async def _l2_lookup(self, missing: list[str]) -> dict[str, Optional[int]]:
+        """读取 Redis：username → id（None 为负缓存），未命中的用户名不在结果中"""
+        r = get_redis()
+        if not r:
+            return {}
+        try:
+            pipe = r.pipeline(transaction=False)
+            pipe.hmget(_IDS_KEY, missing)
+            pipe.mget([_absent_key(name) for name in missing])
+            ids, absent = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[MentionCache] Redis 读取失败: {e}")
+            return {}
+        from_l2: dict[str, Optional[int]] = {}
+        for name, user_id, is_absent in zip(missing, ids, absent):
+            if user_id is not None:
+                from_l2[name] = int(user_id)
+            elif is_absent is not None:
+                from_l2[name] = None
+        return from_l2
+
+    def resolve_sync(self, db: Session, usernames: Iterable[str]) -> list[int]:
+        """同步解析（线程池中的 def 路由）：L1 → Redis → DB，返回存在的用户 ID（按首次出现顺序去重）"""
+        usernames = list(dict.fromkeys(usernames))
+        resolved, missing = self._l1_lookup(usernames)
+        if missing and get_redis():
+            try:
+                from_l2 = anyio.from_thread.run(self._l2_lookup, missing)
+            except RuntimeError:
+                from_l2 = {}  # 不在 anyio 工作线程中（如 asyncio.to_thread），跳过 L2
+            if from_l2:
+                self._count("l2_hits", len(from_l2))
+                self._l1_set(from_l2)
+                resolved.update(from_l2)
+                missing = [name for name in missing if name not in from_l2]
+        if missing:
+            loaded = self._load_from_db(db, missing)
+            resolved.update(loaded)
+            if get_redis():
+                fire_and_forget(self._redis_store(loaded))
+        return self._ids_in_order(usernames, resolved)
+
+    # ----- 失效 -----
+
+    async def ainvalidate(self, *usernames: str):
+        """删除 L2 并广播失效（所有实例清除 L1）"""
+        if not usernames:
+            return
+        self._count("invalidations")
+        r = get_redis()
+        if r:
+            try:
+                pipe = r.pipeline(transaction=False)
+                pipe.hdel(_IDS_KEY, *usernames)
+                pipe.delete(*[_absent_key(name) for name in usernames])
+                await pipe.execute()
+            except Exception:
+                logger.warning(f"[MentionCache] Redis 删除失败: {usernames}")
+        await publish_invalidation(_NAMESPACE, usernames)
+
+    def invalidate(self, *usernames: str):
+        """同步版本：本地 L1 立即失效，L2 删除与广播 fire-and-forget（注册、注销后调用）"""
+        self.evict_local(list(usernames))
+        fire_and_forget(self.ainvalidate(*usernames))
+
+    # ----- 指标 -----
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["l1_size"] = len(self._l1)
+        lookups = stats["l1_hits"] + stats["l2_hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_ratio"] = round(1 - stats["misses"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+mention_resolver = MentionResolver()
+register_handler(_NAMESPACE, mention_resolver.evict_local)
+
+
+def get_mention_resolver() -> MentionResolver:
+    """获取全局提及解析缓存"""
+    return mention_resolver
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from sqlalchemy import (
     Column,
     Integer,
@@ -8,6 +10,7 @@ from sqlalchemy import (
     ForeignKey,
     Boolean,
     Index,
+    LargeBinary,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -165,6 +168,12 @@ class Notification(Base):
     content_preview = Column(String(200), nullable=True)  # 内容预览（审核通知可能较长）
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # 聚合通知（like / follow / new_post）：时间窗口内同一目标的通知合并为一行
+    aggregate_count = Column(Integer, default=1, server_default="1", nullable=False)  # 合并的事件数
+    recent_actor_ids = Column(String(100), nullable=True)  # 最近的触发者 ID（逗号分隔，新的在前）
+    # 最后一次变更时间（新建时写入，合并时更新）；列表排序和增量同步按 (updated_at, id) 键集。
+    # 与 DMRead.last_read_at 一样由应用写入 UTC 时间（微秒精度），server_default 仅用于迁移和手工插入
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now(), nullable=False)
 
     # 关系
     user = relationship("User", foreign_keys=[user_id])
@@ -176,9 +185,38 @@ class Notification(Base):
     __table_args__ = (
         Index("ix_notification_user_read", "user_id", "is_read"),
         Index("ix_notification_user_created", "user_id", "created_at"),
+        Index("ix_notification_user_id", "user_id", "id"),  # 游标分页按 ID 键集拉取
+        Index("ix_notification_user_updated", "user_id", "updated_at", "id"),  # 增量同步按 (updated_at, id) 键集拉取
     )
 
 
+class NotificationCounter(Base):
+    """每个用户的通知计数（随通知写入/已读/删除在同一事务中增量维护，列表与未读数不再 COUNT）"""
+
+    __tablename__ = "notification_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total = Column(Integer, default=0, nullable=False)  # 通知总数
+    unread = Column(Integer, default=0, nullable=False)  # 未读数
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class NotificationArchive(Base):
+    """已归档的通知（保留任务按批写入，每个用户每批一行，payload 为压缩后的紧凑格式，见 notification_retention.py）"""
+
+    __tablename__ = "notification_archives"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False, index=True)  # 接收者（不加外键，原通知删除后仍可按用户查询）
+    first_notification_id = Column(Integer, nullable=False)
+    last_notification_id = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False)
+    oldest_at = Column(DateTime(timezone=True), nullable=True)  # 本批最早一条通知的创建时间
+    newest_at = Column(DateTime(timezone=True), nullable=True)
+    payload = Column(LargeBinary, nullable=False)  # zlib(JSON 数组)，格式版本见 notification_retention.ARCHIVE_FORMAT
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class SystemSettings(Base):
     """系统设置（键值对存储）"""
 
@@ -205,6 +243,7 @@ class ModerationLog(Base):
     flagged_category = Column(String(50), nullable=True)  # 违规类别
     reason = Column(String(500), nullable=True)  # 原因
     model_used = Column(String(100), nullable=True)  # 使用的模型
+    cached = Column(Boolean, default=False, nullable=False)  # 是否命中审核结论缓存（未调用 LLM）
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # 关系
@@ -216,6 +255,27 @@ class ModerationLog(Base):
     )
 
 
+class ModerationQueue(Base):
+    """待审核队列（发帖/回复时写入，审核 worker 以租约方式领取）"""
+
+    __tablename__ = "moderation_queue"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_type = Column(String(20), nullable=False)  # thread / reply（含楼中楼）
+    content_id = Column(Integer, nullable=False)  # 帖子/回复 ID
+    status = Column(String(10), default="pending", nullable=False)  # pending / dead（死信）
+    attempts = Column(Integer, default=0, nullable=False)  # 已领取次数
+    locked_until = Column(DateTime, nullable=True)  # 租约到期时间（UTC），到期前其他 worker 不会领取
+    locked_by = Column(String(100), nullable=True)  # 领取者实例 ID
+    last_error = Column(String(500), nullable=True)  # 最近一次失败原因
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_moderation_queue_content", "content_type", "content_id", unique=True),
+        Index("ix_moderation_queue_claim", "status", "content_type", "id"),
+    )
+
+
 class ImageUpload(Base):
     """图床上传记录"""
 
@@ -391,6 +451,8 @@ class DMRead(Base):
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     last_read_message_id = Column(Integer, default=0, nullable=False)
     last_read_at = Column(DateTime(timezone=True), nullable=True)
+    # 游标之后对方发来的消息数（发消息时 +1，标记已读时重置），会话列表直接读取
+    unread_count = Column(Integer, default=0, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     conversation = relationship("DMConversation")
@@ -399,3 +461,14 @@ class DMRead(Base):
     __table_args__ = (
         Index("ix_dm_read_user", "user_id"),
     )
+
+
+class DMUnreadTotal(Base):
+    """Per-user DM unread totals (sum of DMRead.unread_count, maintained incrementally)."""
+
+    __tablename__ = "dm_unread_totals"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    unread_count = Column(Integer, default=0, nullable=False)  # 未读消息总数
+    conversations_with_unread = Column(Integer, default=0, nullable=False)  # 有未读的会话数
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
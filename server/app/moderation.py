@@ -2,46 +2,32 @@
 内容审核模块 - 使用 OpenAI 兼容接口进行内容安全审核
 
 支持"先发后审"机制：
-- 帖子/评论发布时直接通过，标记为 moderated=False
-- 后台定时任务批量审核所有 moderated=False 的内容
+- 帖子/评论发布时直接通过，标记为 moderated=False，并在同一事务中写入 moderation_queue
+- 后台定时任务以租约方式领取队列条目（FOR UPDATE SKIP LOCKED），多个 worker 可并行消费
+- LLM 请求失败的条目退避重试，超过 MODERATION_MAX_ATTEMPTS 次进入死信
 - 审核不通过时自动删除内容并发送通知
+- 送 LLM 之前先经本地规则预审（moderation_prefilter），明确的内容本地判定
 """
-import httpx
 import json
 import logging
-import time as _time
 import asyncio
+from datetime import datetime, timedelta
 from typing import Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from .models import SystemSettings, ModerationLog, Thread, Reply, Notification
-from .redis_client import get_redis
+from sqlalchemy import case, func, or_
+from .models import ModerationLog, ModerationQueue, Thread, Reply, Notification
+from .notification_counters import delete_notifications, record_created
+from .settings_utils import get_setting, get_settings_batch, invalidate_settings_cache
+from .config import get_settings
+from .moderation_cache import Verdict, content_hash, get_verdict_cache, policy_fingerprint
+from .moderation_prefilter import get_prefilter, record_decision
+from .leader import INSTANCE_ID
+from . import http_client as outbound
 
 logger = logging.getLogger(__name__)
 
-# 全局 httpx 客户端 - 复用 TCP 连接
-_http_client: Optional[httpx.AsyncClient] = None
-
-
-def _get_http_client() -> httpx.AsyncClient:
-    """获取全局 httpx 客户端（连接复用）"""
-    global _http_client
-    if _http_client is None or _http_client.is_closed:
-        _http_client = httpx.AsyncClient(timeout=30.0)
-    return _http_client
-
-
-def get_http_client(timeout_override: Optional[float] = None) -> httpx.AsyncClient:
-    """公共接口：获取全局 httpx 客户端（P2 #17: 各路由复用，消除重复 TCP 握手）
-    
-    如需不同超时，传 timeout_override 创建独立客户端（仍会被全局引用复用）。
-    默认使用 30s 超时的全局客户端。
-    """
-    if timeout_override and timeout_override != 30.0:
-        # 特殊超时需求（如图床上传 60s）使用独立客户端
-        return httpx.AsyncClient(timeout=timeout_override)
-    return _get_http_client()
+app_settings = get_settings()
 
 # 默认审核 Prompt
 DEFAULT_MODERATION_PROMPT = """你是内容安全审核员。请逐条判断以下内容是否存在严重违规。
@@ -72,6 +58,21 @@ class ModerationResult:
     category: str = "none"  # none / sexual / violence / political
     reason: str = ""
     error: Optional[str] = None
+    cached: bool = False  # 是否来自审核结论缓存（未调用 LLM）
+    decided_by: Optional[str] = None  # 本地预审阶段名（未调用 LLM）
+
+    def verdict(self) -> Verdict:
+        return (self.passed, self.category, self.reason)
+
+    @classmethod
+    def from_cache(cls, verdict: Verdict) -> "ModerationResult":
+        passed, category, reason = verdict
+        return cls(passed=passed, category=category, reason=reason, cached=True)
+
+    @classmethod
+    def from_prefilter(cls, verdict: Verdict, stage: str) -> "ModerationResult":
+        passed, category, reason = verdict
+        return cls(passed=passed, category=category, reason=reason, decided_by=stage)
 
 
 class ContentModerator:
@@ -82,21 +83,24 @@ class ContentModerator:
         self._load_settings()
     
     def _load_settings(self):
-        """从数据库批量加载配置（1次查询代替5次）"""
+        """从进程级设置快照加载配置（字典查找，不查 DB）"""
         keys = [
             "moderation_enabled", "moderation_api_base",
             "moderation_api_key", "moderation_model", "moderation_prompt"
         ]
-        settings = self.db.query(SystemSettings).filter(
-            SystemSettings.key.in_(keys)
-        ).all()
-        settings_map = {s.key: s.value for s in settings if s.value}
+        settings_map = {k: v for k, v in get_settings_batch(self.db, keys).items() if v}
         
         self.enabled = settings_map.get("moderation_enabled", "false") == "true"
         self.api_base = settings_map.get("moderation_api_base", "https://api.openai.com/v1")
         self.api_key = settings_map.get("moderation_api_key", "")
         self.model = settings_map.get("moderation_model", "gpt-4o-mini")
         self.prompt = settings_map.get("moderation_prompt", DEFAULT_MODERATION_PROMPT)
+        self.policy = policy_fingerprint(self.model, self.prompt)
+        self.prefilter = get_prefilter(self.db)
+
+    def model_label(self, result: ModerationResult) -> str:
+        """审核日志中的 model_used：本地预审记为 prefilter:{阶段}"""
+        return f"prefilter:{result.decided_by}" if result.decided_by else self.model
     
     async def check(
         self,
@@ -127,9 +131,20 @@ class ContentModerator:
             return ModerationResult(passed=True)
         
         try:
-            batch_items = [{"id": 1, "content": content[:500]}]
-            results = await self._call_llm_batch(batch_items)
-            result = results[0]
+            snippet = content[:500]
+            cache = get_verdict_cache()
+            verdict, stage = self.prefilter.decide(snippet)
+            record_decision(verdict, stage)
+            cached = None if verdict is not None else (await cache.get_many(self.policy, [snippet]))[0]
+            if verdict is not None:
+                result = ModerationResult.from_prefilter(verdict, stage)
+            elif cached is not None:
+                result = ModerationResult.from_cache(cached)
+            else:
+                results = await self._call_llm_batch([{"id": 1, "content": snippet}])
+                result = results[0]
+                if not result.error:
+                    await cache.put_many(self.policy, [(snippet, result.verdict())])
             
             # 记录审核日志
             self._log_moderation(
@@ -140,7 +155,8 @@ class ContentModerator:
                 passed=result.passed,
                 flagged_category=result.category if not result.passed else None,
                 reason=result.reason if not result.passed else None,
-                model_used=self.model
+                model_used=self.model_label(result),
+                cached=result.cached
             )
             
             return result
@@ -182,8 +198,8 @@ class ContentModerator:
             "max_tokens": 150 * len(items)  # 按条目数动态分配
         }
         
-        client = _get_http_client()
-        response = await client.post(url, headers=headers, json=payload)
+        # 审核请求可安全重放（结果只在落库时生效），允许重试
+        response = await outbound.request("moderation", "POST", url, headers=headers, json=payload, retry=True)
         response.raise_for_status()
         data = response.json()
         
@@ -208,7 +224,7 @@ class ContentModerator:
             
             if not isinstance(results_raw, list):
                 logger.warning(f"批量审核响应不是数组: {reply_text[:200]}")
-                return [ModerationResult(passed=True)] * expected_count
+                return [ModerationResult(passed=True, error="invalid_response")] * expected_count
             
             # 按 id 字段建立映射（id 从 1 开始）
             result_map = {}
@@ -222,15 +238,15 @@ class ContentModerator:
                             reason=item.get("reason", "")
                         )
             
-            # 按顺序组装结果，缺失的默认通过
+            # 按顺序组装结果，缺失的默认通过（带 error 标记，不写入结论缓存）
             results = []
             for i in range(1, expected_count + 1):
-                results.append(result_map.get(i, ModerationResult(passed=True)))
+                results.append(result_map.get(i, ModerationResult(passed=True, error="missing")))
             return results
         
         except (json.JSONDecodeError, KeyError, TypeError) as e:
             logger.warning(f"无法解析批量审核响应: {e} | {reply_text[:200]}")
-            return [ModerationResult(passed=True)] * expected_count
+            return [ModerationResult(passed=True, error="parse_error")] * expected_count
     
     def _log_moderation(
         self,
@@ -241,7 +257,8 @@ class ContentModerator:
         passed: bool,
         flagged_category: Optional[str],
         reason: Optional[str],
-        model_used: str
+        model_used: str,
+        cached: bool = False
     ):
         """记录审核日志"""
         log = ModerationLog(
@@ -252,22 +269,22 @@ class ContentModerator:
             passed=passed,
             flagged_category=flagged_category,
             reason=reason,
-            model_used=model_used
+            model_used=model_used,
+            cached=cached
         )
         self.db.add(log)
         # 注意：不在这里 commit，由调用方统一处理
 
 
 async def fetch_available_models(api_base: str, api_key: str) -> list[str]:
-    """从 API 获取可用模型列表（使用全局客户端）"""
+    """从 API 获取可用模型列表（管理后台调用，走独立的 moderation_admin 上游，不影响线上审核熔断）"""
     url = f"{api_base.rstrip('/')}/models"
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
     
-    client = _get_http_client()
-    response = await client.get(url, headers=headers)
+    response = await outbound.request("moderation_admin", "GET", url, headers=headers)
     response.raise_for_status()
     data = response.json()
     
@@ -283,74 +300,31 @@ async def fetch_available_models(api_base: str, api_key: str) -> list[str]:
     return models
 
 
-# ===== 审核器配置缓存（60秒TTL） =====
-# P2 #13: 只缓存配置字典，不缓存 ContentModerator 实例（避免 Session 交叉污染）
-_moderator_config_cache: Optional[dict] = None
-_moderator_config_cache_time: float = 0
-_MODERATOR_CACHE_TTL = 60  # 秒
-
-
 def get_moderator(db: Session) -> ContentModerator:
     """获取审核器实例
     
-    P2 #13: 只缓存配置字典（线程安全），每次请求创建新的 ContentModerator 实例。
-    避免全局缓存实例导致并发请求的 Session 交叉污染。
+    P2 #13: 每次请求创建新的 ContentModerator 实例，避免 Session 交叉污染。
+    配置来自 settings_utils 的进程级快照，创建实例不触发 DB 查询。
     """
-    global _moderator_config_cache, _moderator_config_cache_time
-    now = _time.time()
-    
-    if _moderator_config_cache is None or (now - _moderator_config_cache_time) > _MODERATOR_CACHE_TTL:
-        # 从 DB 加载配置并缓存为字典
-        moderator = ContentModerator(db)
-        _moderator_config_cache = {
-            "enabled": moderator.enabled,
-            "api_base": moderator.api_base,
-            "api_key": moderator.api_key,
-            "model": moderator.model,
-            "prompt": moderator.prompt,
-        }
-        _moderator_config_cache_time = now
-        return moderator
-    
-    # 用缓存的配置创建新实例（不触发 DB 查询）
-    moderator = ContentModerator.__new__(ContentModerator)
-    moderator.db = db
-    moderator.enabled = _moderator_config_cache["enabled"]
-    moderator.api_base = _moderator_config_cache["api_base"]
-    moderator.api_key = _moderator_config_cache["api_key"]
-    moderator.model = _moderator_config_cache["model"]
-    moderator.prompt = _moderator_config_cache["prompt"]
-    return moderator
+    return ContentModerator(db)
 
 
 async def invalidate_moderation_cache():
     """失效审核配置缓存（管理员修改配置时调用）
     
-    同时清除进程级内存缓存和 Redis 缓存，
-    确保所有实例在下次请求时重新加载配置。
+    失效设置快照并广播，确保所有实例在下次请求时重新加载配置。
     """
-    global _moderator_config_cache, _moderator_config_cache_time
-    _moderator_config_cache = None
-    _moderator_config_cache_time = 0
-    
-    r = get_redis()
-    if r:
-        try:
-            await r.delete("settings:moderation")
-        except Exception:
-            pass
+    await invalidate_settings_cache()
 
 
 # ===== 定时批量审核 =====
 
 def get_moderation_interval(db: Session) -> int:
     """获取审核间隔（秒），默认60秒"""
-    setting = db.query(SystemSettings).filter(
-        SystemSettings.key == "moderation_interval"
-    ).first()
-    if setting and setting.value:
+    value = get_setting(db, "moderation_interval")
+    if value:
         try:
-            return max(10, int(setting.value))  # 最小10秒
+            return max(10, int(value))  # 最小10秒
         except (ValueError, TypeError):
             pass
     return 60
@@ -358,21 +332,355 @@ def get_moderation_interval(db: Session) -> int:
 
 def get_moderation_batch_size(db: Session) -> int:
     """获取每次审核的评论数，默认5条"""
-    setting = db.query(SystemSettings).filter(
-        SystemSettings.key == "moderation_batch_size"
-    ).first()
-    if setting and setting.value:
+    value = get_setting(db, "moderation_batch_size")
+    if value:
         try:
-            return max(1, min(50, int(setting.value)))
+            return max(1, min(50, int(value)))
         except (ValueError, TypeError):
             pass
     return 5
 
 
+@dataclass
+class _PendingItem:
+    """待审核条目（领取时从 ORM 对象复制，LLM 请求期间不持有 Session）"""
+    id: int
+    content: str
+
+
+def _estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：ASCII 约 4 字符/token，CJK 等约 1 字符/token"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def _build_batches(items: list[_PendingItem], max_items: int, token_budget: int) -> list[list[_PendingItem]]:
+    """按条数上限和 token 预算贪心切分批次（单条超预算时独占一批）"""
+    batches: list[list[_PendingItem]] = []
+    current: list[_PendingItem] = []
+    used = 0
+    for item in items:
+        cost = _estimate_tokens(item.content) + 8  # 编号与换行开销
+        if current and (len(current) >= max_items or used + cost > token_budget):
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def enqueue_moderation(db: Session, content_type: str, content_id: int):
+    """新内容加入待审核队列（调用方 flush 取得 ID 后调用，与内容在同一事务中提交）
+
+    content_type: thread / reply（楼中楼也记为 reply）
+    """
+    db.add(ModerationQueue(content_type=content_type, content_id=content_id))
+
+
+def _claim_page(kind: str, limit: int) -> tuple[int, list[_PendingItem]]:
+    """从队列领取一页条目（短事务，FOR UPDATE SKIP LOCKED + 租约）
+
+    返回 (领取的队列条目数, 待审核内容)。领取次数已达上限的条目转入死信；
+    内容已被删除或已审核的条目直接出队。领取时先计一次次数（worker 崩溃、租约过期同样算一次），
+    被熔断拦下没有真正发出的批次由 _requeue_claims 退还。
+    """
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        entries = (
+            db.query(ModerationQueue)
+            .filter(
+                ModerationQueue.status == "pending",
+                ModerationQueue.content_type == kind,
+                or_(ModerationQueue.locked_until.is_(None), ModerationQueue.locked_until < now),
+            )
+            .order_by(ModerationQueue.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if not entries:
+            db.commit()
+            return 0, []
+
+        lease_until = now + timedelta(seconds=app_settings.MODERATION_LEASE_SECONDS)
+        claimed: dict[int, ModerationQueue] = {}
+        for entry in entries:
+            if entry.attempts >= app_settings.MODERATION_MAX_ATTEMPTS:
+                # 上一次领取后租约过期仍未完成（worker 崩溃等），且已无重试次数
+                entry.status = "dead"
+                entry.locked_until = None
+                entry.last_error = entry.last_error or "租约过期"
+                logger.warning(f"[BatchMod] {kind} #{entry.content_id} 超过重试次数，转入死信")
+                continue
+            entry.attempts += 1
+            entry.locked_until = lease_until
+            entry.locked_by = INSTANCE_ID
+            claimed[entry.content_id] = entry
+
+        items: list[_PendingItem] = []
+        if claimed:
+            if kind == "thread":
+                rows = (
+                    db.query(Thread.id, Thread.title, Thread.content)
+                    .filter(Thread.id.in_(claimed), Thread.moderated == False)
+                    .order_by(Thread.id)
+                    .all()
+                )
+                items = [_PendingItem(tid, f"{title}\n{content}"[:500]) for tid, title, content in rows]
+            else:
+                rows = (
+                    db.query(Reply.id, Reply.content)
+                    .filter(Reply.id.in_(claimed), Reply.moderated == False)
+                    .order_by(Reply.id)
+                    .all()
+                )
+                items = [_PendingItem(rid, (content or "")[:500]) for rid, content in rows]
+            found = {item.id for item in items}
+            for content_id, entry in claimed.items():
+                if content_id not in found:
+                    db.delete(entry)
+        db.commit()
+        return len(entries), items
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _release_claims(kind: str, batch: list[_PendingItem], error: str):
+    """LLM 请求失败：释放租约并按指数退避安排重试，次数用尽转入死信"""
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        entries = db.query(ModerationQueue).filter(
+            ModerationQueue.content_type == kind,
+            ModerationQueue.content_id.in_([item.id for item in batch]),
+        ).all()
+        for entry in entries:
+            entry.last_error = error[:500]
+            entry.locked_by = None
+            if entry.attempts >= app_settings.MODERATION_MAX_ATTEMPTS:
+                entry.status = "dead"
+                entry.locked_until = None
+            else:
+                delay = min(app_settings.MODERATION_RETRY_BACKOFF * 2 ** max(entry.attempts - 1, 0), 3600)
+                entry.locked_until = now + timedelta(seconds=delay)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"[BatchMod] 释放审核租约失败 ({kind} {batch[0].id}..{batch[-1].id}): {e}")
+    finally:
+        db.close()
+
+
+def _requeue_claims(kind: str, batch: list[_PendingItem]):
+    """熔断拦截、请求未发出：原样放回队列
+
+    退还领取时计入的次数，不设退避、不记错误，熔断恢复后下一次领取即可处理。
+    """
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        db.query(ModerationQueue).filter(
+            ModerationQueue.content_type == kind,
+            ModerationQueue.content_id.in_([item.id for item in batch]),
+            ModerationQueue.status == "pending",
+        ).update(
+            {
+                ModerationQueue.attempts: case(
+                    (ModerationQueue.attempts > 0, ModerationQueue.attempts - 1), else_=0
+                ),
+                ModerationQueue.locked_until: None,
+                ModerationQueue.locked_by: None,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"[BatchMod] 归还审核条目失败 ({kind} {batch[0].id}..{batch[-1].id}): {e}")
+    finally:
+        db.close()
+
+
+def _apply_batch_results(kind: str, batch: list[_PendingItem], results: list[ModerationResult]):
+    """在独立 Session 中落库一批审核结果，并在同一事务中出队
+
+    重新按 ID 加载仍未审核的行：领取后已被删除/处理的条目自动跳过。
+    """
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        model = Thread if kind == "thread" else Reply
+        ids = [item.id for item in batch]
+        rows = {
+            row.id: row
+            for row in db.query(model).filter(model.id.in_(ids), model.moderated == False).all()
+        }
+        moderator = ContentModerator(db)
+        deleted_reply_ids = set()
+        for item, result in zip(batch, results):
+            row = rows.get(item.id)
+            if row is None:
+                continue
+            if kind == "reply" and row.parent_id in deleted_reply_ids:
+                continue  # 所属主楼层已在本批被删除，楼中楼已随之删除
+
+            content_type = kind if kind == "thread" else ("sub_reply" if row.parent_id else "reply")
+            moderator._log_moderation(
+                content_type=content_type,
+                content_id=row.id,
+                user_id=row.author_id,
+                content_preview=item.content,
+                passed=result.passed,
+                flagged_category=result.category if not result.passed else None,
+                reason=result.reason if not result.passed else None,
+                model_used=moderator.model_label(result),
+                cached=result.cached
+            )
+
+            if result.passed:
+                row.moderated = True
+            elif kind == "thread":
+                logger.info(f"[BatchMod] 帖子 #{row.id} 审核不通过: {result.reason}")
+                _delete_thread_and_notify(db, row, result.reason or "包含违规内容")
+            else:
+                logger.info(f"[BatchMod] 评论 #{row.id} 审核不通过: {result.reason}")
+                deleted_reply_ids.add(row.id)
+                _delete_reply_and_notify(db, row, result.reason or "包含违规内容")
+
+        db.query(ModerationQueue).filter(
+            ModerationQueue.content_type == kind, ModerationQueue.content_id.in_(ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"[BatchMod] 落库审核结果失败 ({kind} {batch[0].id}..{batch[-1].id}): {e}")
+    finally:
+        db.close()
+
+
+async def _moderate_kind(
+    kind: str,
+    moderator: ContentModerator,
+    semaphore: asyncio.Semaphore,
+    batch_size: int,
+) -> int:
+    """审核一种内容：从队列领取一页 → 按预算切批 → 并发请求 LLM → 每批独立提交并出队"""
+    page_size = max(batch_size, app_settings.MODERATION_PAGE_SIZE)
+    prompt_tokens = _estimate_tokens(moderator.prompt)
+    token_budget = max(app_settings.MODERATION_MAX_INPUT_TOKENS - prompt_tokens, 1)
+
+    cache = get_verdict_cache()
+
+    async def run_batch(batch: list[_PendingItem], duplicates: dict[str, list[_PendingItem]]) -> bool:
+        """送审一批，返回是否被熔断拦下（未发出）"""
+        error = None
+        short_circuited = False
+        async with semaphore:
+            try:
+                results = await moderator._call_llm_batch(
+                    [{"id": idx + 1, "content": item.content} for idx, item in enumerate(batch)]
+                )
+            except outbound.UpstreamUnavailable:
+                # 熔断拦截，请求没有发出：不算审核失败，不消耗重试次数
+                short_circuited = True
+            except Exception as e:
+                logger.error(f"[BatchMod] 批量审核{kind}失败，稍后重试: {e}")
+                error = str(e) or type(e).__name__
+        # 同页内容完全相同的条目复用代表条目的结论（标记为 cached）
+        items = [dup for item in batch for dup in duplicates[content_hash(item.content)]]
+        if short_circuited:
+            await asyncio.to_thread(_requeue_claims, kind, items)
+            return True
+        if error is not None:
+            await asyncio.to_thread(_release_claims, kind, items, error)
+            return False
+        await cache.put_many(
+            moderator.policy,
+            [(item.content, res.verdict()) for item, res in zip(batch, results) if not res.error],
+        )
+        item_results = []
+        for idx, item in enumerate(batch):
+            for dup_idx in range(len(duplicates[content_hash(item.content)])):
+                item_results.append(results[idx] if dup_idx == 0 else replace(results[idx], cached=True))
+        # 落库（含不通过时的级联删除）是同步事务，放到线程池执行，不阻塞事件循环
+        await asyncio.to_thread(_apply_batch_results, kind, items, item_results)
+        return False
+
+    total = 0
+    while True:
+        # 每页领取前检查熔断：打开时本轮到此为止，半开时只领取一批的量
+        state = outbound.breaker_state("moderation")
+        if state == "open":
+            logger.warning(f"[BatchMod] 审核上游熔断中，停止领取{kind}")
+            break
+        # 已领取的条目处于租约期内，下一次领取自然跳过；失败条目按退避时间延后
+        claimed, page = await asyncio.to_thread(
+            _claim_page, kind, batch_size if state == "half_open" else page_size
+        )
+        if not claimed:
+            break
+        total += len(page)
+
+        # 先本地预审，再查结论缓存：有结论的直接落库，其余按内容去重后再送审
+        decided_items, decided_results, undecided = [], [], []
+        for item in page:
+            verdict, stage = moderator.prefilter.decide(item.content)
+            record_decision(verdict, stage)
+            if verdict is not None:
+                decided_items.append(item)
+                decided_results.append(ModerationResult.from_prefilter(verdict, stage))
+            else:
+                undecided.append(item)
+
+        verdicts = await cache.get_many(moderator.policy, [item.content for item in undecided]) if undecided else []
+        duplicates: dict[str, list[_PendingItem]] = {}
+        for item, verdict in zip(undecided, verdicts):
+            if verdict is not None:
+                decided_items.append(item)
+                decided_results.append(ModerationResult.from_cache(verdict))
+            else:
+                duplicates.setdefault(content_hash(item.content), []).append(item)
+        if decided_items:
+            await asyncio.to_thread(_apply_batch_results, kind, decided_items, decided_results)
+
+        representatives = [group[0] for group in duplicates.values()]
+        batches = _build_batches(representatives, batch_size, token_budget)
+        if batches and outbound.breaker_state("moderation") != "closed":
+            # 半开：只发一批作为探测，熔断恢复后再并发发送其余批次
+            short_circuited = await run_batch(batches[0], duplicates)
+            batches = batches[1:]
+            if short_circuited or outbound.breaker_state("moderation") != "closed":
+                if batches:
+                    await asyncio.to_thread(_requeue_claims, kind, [
+                        dup for batch in batches for item in batch for dup in duplicates[content_hash(item.content)]
+                    ])
+                break
+        if any(await asyncio.gather(*(run_batch(batch, duplicates) for batch in batches))):
+            break  # 本页有批次被熔断拦下：已原样放回，本轮不再领取
+    return total
+
+
 async def _batch_moderate_content():
     """
     批量审核所有 moderated=False 的帖子和评论。
     
+    - 从 moderation_queue 按页领取（FOR UPDATE SKIP LOCKED + 租约），多个 worker 互不重复
+    - 帖子和评论一样打包成批，批次受条数上限和输入 token 预算双重约束
+    - LLM 请求并发数由 asyncio.Semaphore 限制（MODERATION_CONCURRENCY）
+    - 每批结果在独立的短事务中提交，网络等待期间不持有 Session/事务
+    
     审核不通过时：
     1. 删除帖子/评论及相关数据
     2. 给作者发送审核不通过的通知
@@ -382,130 +690,41 @@ async def _batch_moderate_content():
     db = SessionLocal()
     try:
         moderator = ContentModerator(db)
+        batch_size = get_moderation_batch_size(db)
         
-        if not moderator.enabled:
-            # 审核未开启，把所有未审核的标记为已审核
-            db.query(Thread).filter(Thread.moderated == False).update(
-                {Thread.moderated: True}, synchronize_session=False
-            )
-            db.query(Reply).filter(Reply.moderated == False).update(
-                {Reply.moderated: True}, synchronize_session=False
-            )
-            db.commit()
-            return
-        
-        if not moderator.api_key or not moderator.api_base or not moderator.model:
-            # 配置不完整，标记为已审核
-            db.query(Thread).filter(Thread.moderated == False).update(
-                {Thread.moderated: True}, synchronize_session=False
-            )
-            db.query(Reply).filter(Reply.moderated == False).update(
-                {Reply.moderated: True}, synchronize_session=False
-            )
+        if not moderator.enabled or not moderator.api_key or not moderator.api_base or not moderator.model:
+            # 审核未开启或配置不完整：队列中（含死信）的内容全部标记为已审核并清空队列
+            for kind, model in (("thread", Thread), ("reply", Reply)):
+                queued = db.query(ModerationQueue.content_id).filter(ModerationQueue.content_type == kind)
+                db.query(model).filter(model.id.in_(queued.scalar_subquery()), model.moderated == False).update(
+                    {model.moderated: True}, synchronize_session=False
+                )
+            db.query(ModerationQueue).delete(synchronize_session=False)
             db.commit()
             return
-        
-        # === 审核未审核的帖子 ===
-        unmoderated_threads = db.query(Thread).filter(
-            Thread.moderated == False
-        ).all()
-        
-        for thread in unmoderated_threads:
-            try:
-                content_to_check = f"{thread.title}\n{thread.content}"
-                batch_items = [{"id": 1, "content": content_to_check[:500]}]
-                results = await moderator._call_llm_batch(batch_items)
-                result = results[0]
-                
-                # 记录审核日志
-                moderator._log_moderation(
-                    content_type="thread",
-                    content_id=thread.id,
-                    user_id=thread.author_id,
-                    content_preview=content_to_check[:500],
-                    passed=result.passed,
-                    flagged_category=result.category if not result.passed else None,
-                    reason=result.reason if not result.passed else None,
-                    model_used=moderator.model
-                )
-                
-                if result.passed:
-                    thread.moderated = True
-                else:
-                    # 审核不通过：删帖 + 发通知
-                    logger.info(f"[BatchMod] 帖子 #{thread.id} 审核不通过: {result.reason}")
-                    _delete_thread_and_notify(
-                        db, thread, result.reason or "包含违规内容"
-                    )
-                
-            except Exception as e:
-                logger.error(f"[BatchMod] 审核帖子 #{thread.id} 失败: {e}")
-                # 审核失败时默认通过
-                thread.moderated = True
-        
-        # === 审核未审核的评论（批量打包，每 BATCH_SIZE 条一个请求） ===
-        BATCH_SIZE = get_moderation_batch_size(db)
-        unmoderated_replies = db.query(Reply).filter(
-            Reply.moderated == False
-        ).all()
-        
-        for batch_start in range(0, len(unmoderated_replies), BATCH_SIZE):
-            batch_replies = unmoderated_replies[batch_start:batch_start + BATCH_SIZE]
-            
-            try:
-                # 构建批量审核请求
-                batch_items = [
-                    {
-                        "id": idx + 1,
-                        "content": (rpl.content or "")[:500]
-                    }
-                    for idx, rpl in enumerate(batch_replies)
-                ]
-                
-                batch_results = await moderator._call_llm_batch(batch_items)
-                
-                # 逐条处理结果
-                for rpl, result in zip(batch_replies, batch_results):
-                    content_type = "sub_reply" if rpl.parent_id else "reply"
-                    
-                    # 记录审核日志
-                    moderator._log_moderation(
-                        content_type=content_type,
-                        content_id=rpl.id,
-                        user_id=rpl.author_id,
-                        content_preview=rpl.content[:500] if rpl.content else "",
-                        passed=result.passed,
-                        flagged_category=result.category if not result.passed else None,
-                        reason=result.reason if not result.passed else None,
-                        model_used=moderator.model
-                    )
-                    
-                    if result.passed:
-                        rpl.moderated = True
-                    else:
-                        logger.info(f"[BatchMod] 评论 #{rpl.id} 审核不通过: {result.reason}")
-                        _delete_reply_and_notify(
-                            db, rpl, result.reason or "包含违规内容"
-                        )
-            
-            except Exception as e:
-                logger.error(f"[BatchMod] 批量审核评论失败: {e}")
-                # 整批审核失败时全部默认通过
-                for rpl in batch_replies:
-                    rpl.moderated = True
-        
-        db.commit()
-        
-        total = len(unmoderated_threads) + len(unmoderated_replies)
-        if total > 0:
-            logger.info(f"[BatchMod] 本轮审核完成: {len(unmoderated_threads)} 帖子, {len(unmoderated_replies)} 评论")
-    
     except Exception as e:
         db.rollback()
         logger.error(f"[BatchMod] 批量审核异常: {e}")
+        return
     finally:
         db.close()
 
+    if not outbound.is_available("moderation"):
+        # 熔断打开：本轮不领取队列条目，避免白白消耗重试次数
+        logger.warning("[BatchMod] 审核上游熔断中，跳过本轮")
+        return
+
+    try:
+        semaphore = asyncio.Semaphore(max(1, app_settings.MODERATION_CONCURRENCY))
+        # 先审帖子：被删除帖子下的评论随帖子删除，不再送审
+        thread_count = await _moderate_kind("thread", moderator, semaphore, batch_size)
+        reply_count = await _moderate_kind("reply", moderator, semaphore, batch_size)
+        
+        if thread_count or reply_count:
+            logger.info(f"[BatchMod] 本轮审核完成: {thread_count} 帖子, {reply_count} 评论")
+    except Exception as e:
+        logger.error(f"[BatchMod] 批量审核异常: {e}")
+
 
 def _delete_thread_and_notify(db: Session, thread: Thread, reason: str):
     """删除帖子并给作者发审核不通过通知"""
@@ -524,12 +743,7 @@ def _delete_thread_and_notify(db: Session, thread: Thread, reason: str):
     db.add(notification)
     db.flush()  # 先写入通知，获得通知ID
     notification_id = notification.id
-    
-    # Redis: 未读计数 +1
-    r = get_redis()
-    if r:
-        from .redis_client import fire_and_forget
-        fire_and_forget(r.incr(f"unread:{author_id}"))
+    record_created(db, author_id)
     
     # 获取所有回复ID
     reply_ids = [
@@ -537,14 +751,13 @@ def _delete_thread_and_notify(db: Session, thread: Thread, reason: str):
     ]
     
     # 删除相关通知（外键约束）—— 但保留刚创建的审核通知
-    db.query(Notification).filter(
+    delete_notifications(
+        db,
         Notification.thread_id == thread_id,
-        Notification.id != notification_id
-    ).delete(synchronize_session=False)
+        Notification.id != notification_id,
+    )
     if reply_ids:
-        db.query(Notification).filter(Notification.reply_id.in_(reply_ids)).delete(
-            synchronize_session=False
-        )
+        delete_notifications(db, Notification.reply_id.in_(reply_ids))
     
     # 清除回复中的引用
     if reply_ids:
@@ -593,12 +806,7 @@ def _delete_reply_and_notify(db: Session, reply: Reply, reason: str):
     )
     db.add(notification)
     db.flush()
-    
-    # Redis: 未读计数 +1
-    r = get_redis()
-    if r:
-        from .redis_client import fire_and_forget
-        fire_and_forget(r.incr(f"unread:{author_id}"))
+    record_created(db, author_id)
     
     if not is_sub_reply:
         # 主楼层：删除其下所有楼中楼
@@ -608,9 +816,7 @@ def _delete_reply_and_notify(db: Session, reply: Reply, reason: str):
         
         # 删除相关通知
         all_ids = sub_reply_ids + [reply_id]
-        db.query(Notification).filter(Notification.reply_id.in_(all_ids)).delete(
-            synchronize_session=False
-        )
+        delete_notifications(db, Notification.reply_id.in_(all_ids))
         
         # 清除引用
         if sub_reply_ids:
@@ -639,9 +845,7 @@ def _delete_reply_and_notify(db: Session, reply: Reply, reason: str):
             {Reply.reply_to_id: None}, synchronize_session=False
         )
         # 删除相关通知
-        db.query(Notification).filter(Notification.reply_id == reply_id).delete(
-            synchronize_session=False
-        )
+        delete_notifications(db, Notification.reply_id == reply_id)
     
     # 删除评论本身
     db.delete(reply)
@@ -649,7 +853,7 @@ def _delete_reply_and_notify(db: Session, reply: Reply, reason: str):
 
 async def run_batch_moderation_loop():
     """
-    定时批量审核后台任务（在 main.py startup 中启动）
+    定时批量审核后台任务（在 main.py startup 中启动，每个 worker 各自消费审核队列）
     
     每隔 moderation_interval 秒执行一次批量审核。
     """
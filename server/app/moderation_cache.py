@@ -0,0 +1,222 @@
+"""
+审核结论缓存（按规范化内容哈希）
+
+Bot 经常发送相同或几乎相同的内容（问候语、模板、重试），
+每一份拷贝都送 LLM 审核既慢又费钱。
+
+- 键：规范化内容（NFKC、小写、压缩空白）的 SHA-256；
+  按审核策略（模型 + Prompt 指纹）分区，管理员修改 Prompt/模型后旧结论自然失效
+- 存储：进程内 LRU + Redis String `modv:{policy}:{hash}`（TTL 由 MODERATION_VERDICT_TTL 配置）
+- 近似重复（可选）：MODERATION_SIMHASH_DISTANCE > 0 时，
+  在进程内按 64 位 SimHash 分段索引查找汉明距离不超过阈值的已审内容
+- 仅缓存 LLM 明确给出的结论；请求失败/解析失败的默认通过结果不入缓存
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+from .config import get_settings
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+_LOCAL_MAXSIZE = 10000
+_SIMHASH_BITS = 64
+_SIMHASH_BANDS = 4  # 距离 ≤ 3 时至少有一段完全相同（抽屉原理）
+_BAND_BITS = _SIMHASH_BITS // _SIMHASH_BANDS
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# 结论：(passed, category, reason)
+Verdict = tuple[bool, str, str]
+
+
+def normalize_content(content: str) -> str:
+    """规范化：NFKC（全角转半角等）、小写、压缩空白"""
+    text = unicodedata.normalize("NFKC", content or "").lower()
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(normalize_content(content).encode("utf-8")).hexdigest()
+
+
+def policy_fingerprint(model: str, prompt: str) -> str:
+    """审核策略指纹：模型或 Prompt 变化后使用新的缓存分区"""
+    return hashlib.sha1(f"{model}\0{prompt}".encode("utf-8")).hexdigest()[:12]
+
+
+def simhash(content: str) -> int:
+    """64 位 SimHash（字符 3-gram 特征）"""
+    text = normalize_content(content)
+    if len(text) < 3:
+        grams = [text]
+    else:
+        grams = [text[i:i + 3] for i in range(len(text) - 2)]
+    weights = [0] * _SIMHASH_BITS
+    for gram in grams:
+        h = int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(_SIMHASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    value = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            value |= 1 << bit
+    return value
+
+
+def _bands(value: int) -> list[int]:
+    mask = (1 << _BAND_BITS) - 1
+    return [(value >> (i * _BAND_BITS)) & mask for i in range(_SIMHASH_BANDS)]
+
+
+class VerdictCache:
+    """两级审核结论缓存 + 可选的进程内 SimHash 近似索引"""
+
+    def __init__(self, maxsize: int = _LOCAL_MAXSIZE):
+        self._maxsize = maxsize
+        self._local: OrderedDict[tuple[str, str], Verdict] = OrderedDict()
+        # SimHash 索引：(policy, band_idx, band_value) -> {simhash}
+        self._sim_entries: OrderedDict[tuple[str, int], Verdict] = OrderedDict()
+        self._sim_bands: dict[tuple[str, int, int], set[int]] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "simhash_hits": 0,
+            "misses": 0,
+            "stores": 0,
+        }
+
+    # ----- 本地 LRU -----
+
+    def _local_get(self, policy: str, key: str) -> Optional[Verdict]:
+        with self._lock:
+            verdict = self._local.get((policy, key))
+            if verdict is not None:
+                self._local.move_to_end((policy, key))
+            return verdict
+
+    def _local_set(self, policy: str, key: str, verdict: Verdict):
+        with self._lock:
+            self._local[(policy, key)] = verdict
+            self._local.move_to_end((policy, key))
+            while len(self._local) > self._maxsize:
+                self._local.popitem(last=False)
+
+    # ----- SimHash -----
+
+    def _sim_lookup(self, policy: str, value: int) -> Optional[Verdict]:
+        max_distance = settings.MODERATION_SIMHASH_DISTANCE
+        with self._lock:
+            for idx, band in enumerate(_bands(value)):
+                for candidate in self._sim_bands.get((policy, idx, band), ()):
+                    if bin(candidate ^ value).count("1") <= max_distance:
+                        return self._sim_entries.get((policy, candidate))
+        return None
+
+    def _sim_add(self, policy: str, value: int, verdict: Verdict):
+        with self._lock:
+            self._sim_entries[(policy, value)] = verdict
+            self._sim_entries.move_to_end((policy, value))
+            for idx, band in enumerate(_bands(value)):
+                self._sim_bands.setdefault((policy, idx, band), set()).add(value)
+            while len(self._sim_entries) > self._maxsize:
+                (old_policy, old_value), _ = self._sim_entries.popitem(last=False)
+                for idx, band in enumerate(_bands(old_value)):
+                    members = self._sim_bands.get((old_policy, idx, band))
+                    if members is not None:
+                        members.discard(old_value)
+                        if not members:
+                            del self._sim_bands[(old_policy, idx, band)]
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    # ----- 批量读写 -----
+
+    async def get_many(self, policy: str, contents: list[str]) -> list[Optional[Verdict]]:
+        """按内容批量查询结论（本地 LRU → Redis MGET → SimHash），未命中为 None"""
+        keys = [content_hash(c) for c in contents]
+        verdicts: list[Optional[Verdict]] = [self._local_get(policy, k) for k in keys]
+        self._count("local_hits", sum(1 for v in verdicts if v is not None))
+
+        missing = [i for i, v in enumerate(verdicts) if v is None]
+        r = get_redis()
+        if r and missing:
+            try:
+                raws = await r.mget([f"modv:{policy}:{keys[i]}" for i in missing])
+                for i, raw in zip(missing, raws):
+                    if raw is None:
+                        continue
+                    data = json.loads(raw)
+                    verdict = (bool(data["p"]), data.get("c", "none"), data.get("r", ""))
+                    verdicts[i] = verdict
+                    self._local_set(policy, keys[i], verdict)
+                    self._count("redis_hits")
+            except Exception as e:
+                logger.warning(f"[VerdictCache] Redis 读取失败: {e}")
+
+        if settings.MODERATION_SIMHASH_DISTANCE > 0:
+            for i, verdict in enumerate(verdicts):
+                if verdict is None:
+                    near = self._sim_lookup(policy, simhash(contents[i]))
+                    if near is not None:
+                        verdicts[i] = near
+                        self._count("simhash_hits")
+
+        self._count("misses", sum(1 for v in verdicts if v is None))
+        return verdicts
+
+    async def put_many(self, policy: str, items: list[tuple[str, Verdict]]):
+        """写入 LLM 给出的结论：[(content, verdict), ...]"""
+        if not items:
+            return
+        ttl = settings.MODERATION_VERDICT_TTL
+        r = get_redis()
+        pipe = r.pipeline(transaction=False) if r else None
+        for content, verdict in items:
+            key = content_hash(content)
+            self._local_set(policy, key, verdict)
+            if settings.MODERATION_SIMHASH_DISTANCE > 0:
+                self._sim_add(policy, simhash(content), verdict)
+            if pipe is not None:
+                passed, category, reason = verdict
+                pipe.set(
+                    f"modv:{policy}:{key}",
+                    json.dumps({"p": passed, "c": category, "r": reason}, ensure_ascii=False),
+                    ex=ttl,
+                )
+        self._count("stores", len(items))
+        if pipe is not None:
+            try:
+                await pipe.execute()
+            except Exception as e:
+                logger.warning(f"[VerdictCache] Redis 写入失败: {e}")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["local_size"] = len(self._local)
+            stats["simhash_size"] = len(self._sim_entries)
+        hits = stats["local_hits"] + stats["redis_hits"] + stats["simhash_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_ratio"] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+
+verdict_cache = VerdictCache()
+
+
+def get_verdict_cache() -> VerdictCache:
+    """获取全局审核结论缓存"""
+    return verdict_cache
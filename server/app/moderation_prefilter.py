@@ -0,0 +1,213 @@
+"""
+本地规则预审（LLM 审核之前的前置阶段）
+
+显然安全的短回复和明显的关键词垃圾内容不必送远程模型。
+预审由若干阶段（stage）组成，按顺序执行，第一个给出结论的阶段决定结果；
+所有阶段都不确定时交给 LLM。
+
+内置阶段（配置来自系统设置，管理后台「审核配置」中修改）：
+- allow_list：规范化后与白名单完全一致 → 通过（moderation_allow_list，每行一条）
+- deny_list：规范化后与黑名单完全一致 → 拒绝（moderation_deny_list，每行一条）
+- deny_keywords：Aho-Corasick 自动机匹配屏蔽词 → 拒绝（moderation_deny_keywords，每行一个）
+- short_text：规范化后长度不超过 moderation_short_pass_length 且只含常见字符、无链接、未命中屏蔽词 → 通过
+  （默认 0 即关闭，需管理员在后台显式开启）
+
+自定义阶段可通过 register_stage() 注册（追加在内置阶段之后）。
+指标：本地判定比例（通过/拒绝/转交 LLM）及各阶段命中数，见管理后台 /admin/moderation/stats。
+"""
+
+import logging
+import re
+import threading
+import unicodedata
+from collections import deque
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from .moderation_cache import Verdict, normalize_content
+from .settings_utils import get_settings_batch
+
+logger = logging.getLogger(__name__)
+
+_SETTING_DEFAULTS = {
+    "moderation_prefilter_enabled": "true",
+    "moderation_allow_list": "",
+    "moderation_deny_list": "",
+    "moderation_deny_keywords": "",
+    "moderation_short_pass_length": "0",  # 默认关闭：短辱骂（如「去死吧」）不能仅凭长度放行
+}
+
+_URL_RE = re.compile(r"(https?://|www\.|\.[a-z]{2,6}/)", re.IGNORECASE)
+
+# 阶段签名：(原文, 规范化文本) -> 结论或 None（不确定）
+Stage = Callable[[str, str], Optional[Verdict]]
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 多模式匹配自动机（纯 Python，构建 O(Σ|词|)，匹配 O(|文本|)）"""
+
+    def __init__(self, keywords: list[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[Optional[str]] = [None]
+        for word in keywords:
+            if word:
+                self._insert(word)
+        self._build()
+
+    def _insert(self, word: str):
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+            node = nxt
+        self._output[node] = word
+
+    def _build(self):
+        # 根的直接子节点失败指针指向根，其余按 BFS 顺序沿父节点的失败链查找
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                if self._output[child] is None:
+                    # 继承后缀节点的匹配（只需返回任一命中词）
+                    self._output[child] = self._output[self._fail[child]]
+
+    def __bool__(self) -> bool:
+        return len(self._goto) > 1
+
+    def search(self, text: str) -> Optional[str]:
+        """返回文本中命中的第一个关键词，未命中返回 None"""
+        node = 0
+        for ch in text:
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            if self._output[node] is not None:
+                return self._output[node]
+        return None
+
+
+def _split_lines(raw: str) -> list[str]:
+    return [normalize_content(line) for line in raw.splitlines() if line.strip()]
+
+
+def _is_plain_char(ch: str) -> bool:
+    """常见字符：字母、数字、CJK、标点、空白、表情符号"""
+    category = unicodedata.category(ch)
+    return category[0] in ("L", "N", "P", "Z") or category == "So"
+
+
+class Prefilter:
+    """按当前设置构建的预审管线"""
+
+    def __init__(self, config: dict[str, str], extra_stages: list[tuple[str, Stage]]):
+        self.enabled = config["moderation_prefilter_enabled"] == "true"
+        self._allow = set(_split_lines(config["moderation_allow_list"]))
+        self._deny = set(_split_lines(config["moderation_deny_list"]))
+        self._keywords = KeywordAutomaton(_split_lines(config["moderation_deny_keywords"]))
+        try:
+            self._short_len = max(0, int(config["moderation_short_pass_length"]))
+        except (TypeError, ValueError):
+            self._short_len = 0
+        self._stages: list[tuple[str, Stage]] = [
+            ("allow_list", self._allow_list),
+            ("deny_list", self._deny_list),
+            ("deny_keywords", self._deny_keywords),
+            ("short_text", self._short_text),
+        ] + extra_stages
+
+    def _allow_list(self, text: str, normalized: str) -> Optional[Verdict]:
+        return (True, "none", "") if normalized in self._allow else None
+
+    def _deny_list(self, text: str, normalized: str) -> Optional[Verdict]:
+        return (False, "deny_list", "命中内容黑名单") if normalized in self._deny else None
+
+    def _deny_keywords(self, text: str, normalized: str) -> Optional[Verdict]:
+        if not self._keywords:
+            return None
+        hit = self._keywords.search(normalized)
+        return (False, "keyword", f"包含屏蔽词「{hit}」") if hit else None
+
+    def _short_text(self, text: str, normalized: str) -> Optional[Verdict]:
+        if not normalized or len(normalized) > self._short_len:
+            return None
+        # 无论阶段顺序如何，含屏蔽词的内容都不能被短文本规则放行
+        if self._keywords and self._keywords.search(normalized):
+            return None
+        if _URL_RE.search(normalized) or not all(_is_plain_char(ch) for ch in normalized):
+            return None
+        return (True, "none", "")
+
+    def decide(self, text: str) -> tuple[Optional[Verdict], Optional[str]]:
+        """返回 (结论, 阶段名)；不确定时返回 (None, None)"""
+        if not self.enabled:
+            return None, None
+        normalized = normalize_content(text)
+        for name, stage in self._stages:
+            try:
+                verdict = stage(text, normalized)
+            except Exception as e:
+                logger.warning(f"[Prefilter] 阶段 {name} 异常，跳过: {e}")
+                continue
+            if verdict is not None:
+                return verdict, name
+        return None, None
+
+
+_extra_stages: list[tuple[str, Stage]] = []
+_prefilter: Optional[Prefilter] = None
+_prefilter_config: Optional[tuple] = None
+_lock = threading.Lock()
+_stats = {"total": 0, "passed": 0, "rejected": 0, "forwarded": 0, "stages": {}}
+
+
+def register_stage(name: str, stage: Stage) -> None:
+    """注册自定义预审阶段（追加在内置阶段之后）"""
+    global _prefilter
+    with _lock:
+        _extra_stages.append((name, stage))
+        _prefilter = None
+
+
+def get_prefilter(db: Session) -> Prefilter:
+    """获取与当前设置一致的预审管线（设置未变化时复用已构建的自动机）"""
+    global _prefilter, _prefilter_config
+    config = get_settings_batch(db, list(_SETTING_DEFAULTS), defaults=_SETTING_DEFAULTS)
+    key = tuple(config[k] for k in _SETTING_DEFAULTS)
+    with _lock:
+        if _prefilter is None or _prefilter_config != key:
+            _prefilter = Prefilter(config, list(_extra_stages))
+            _prefilter_config = key
+        return _prefilter
+
+
+def record_decision(verdict: Optional[Verdict], stage: Optional[str]) -> None:
+    """记录一次预审结果（用于统计本地判定比例）"""
+    with _lock:
+        _stats["total"] += 1
+        if verdict is None:
+            _stats["forwarded"] += 1
+            return
+        _stats["passed" if verdict[0] else "rejected"] += 1
+        _stats["stages"][stage] = _stats["stages"].get(stage, 0) + 1
+
+
+def get_prefilter_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["stages"] = dict(_stats["stages"])
+    decided = stats["passed"] + stats["rejected"]
+    stats["local_ratio"] = round(decided / stats["total"], 4) if stats["total"] else 0.0
+    return stats
@@ -0,0 +1,332 @@
+"""
+通知计数（notification_counters 表）
+
+通知列表的 total 与未读数原来每次请求都对 notifications 做 COUNT(*)，
+通知积累到几十万条的 Bot 每次翻页都要付出这笔开销。
+现在每个用户一行 (total, unread)，在写入通知的同一事务中增量维护：
+
+- 新建通知：record_created()（total +1, unread +1）
+- 标记已读：record_read() / record_all_read()
+- 删除通知：delete_notifications() 先按用户分组统计将要删除的行，扣减计数后再删除
+- 读取：get_counts()，用户还没有计数行时（新用户、迁移前的老用户）COUNT 一次并建行
+- Redis 镜像：`notif:counts:{uid}` 字符串 "total:unread"（带 TTL）。计数变化的事务提交后
+  （Session after_commit 事件）重新读取已提交的计数行并覆盖写入镜像（write-through）；
+  get_counts_cached() 未命中时的回填只用 SET NX，读到旧值的回填不会覆盖提交后写入的新值
+  （先删后填的 cache-aside 在「读旧值 → 提交并删除 → 回填旧值」时会留下过期镜像直到 TTL）。
+  不再在提交前 fire-and-forget INCR/DECR（任务丢失、回滚或 Redis 重启都会造成永久漂移）
+- 对账：reconcile_counters() 按 user_id 分批把计数行与 notifications 实际统计比对并修正，
+  由 run_reconcile_loop() 定时执行（main.py startup 中经租约选举单实例运行）
+- 存量数据回填：migrate_add_notification_counters.py
+"""
+
+import asyncio
+import logging
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy import case, event, func, or_
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .database import SessionLocal, dialect_insert
+from .models import Notification, NotificationCounter
+from .redis_client import fire_and_forget, get_redis
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+RECONCILE_BATCH = 500  # 对账每批处理的用户数
+_DIRTY_KEY = "notification_counters_dirty"  # Session.info 中本事务改动过计数的用户 ID
+
+
+def cache_key(user_id: int) -> str:
+    return f"notif:counts:{user_id}"
+
+
+def _clamped(column, delta):
+    return case((column + delta < 0, 0), else_=column + delta)
+
+
+def _mark_dirty(db: Session, user_id: int) -> None:
+    db.info.setdefault(_DIRTY_KEY, set()).add(user_id)
+
+
+def _encode(total: int, unread: int) -> str:
+    return f"{total}:{unread}"
+
+
+def _read_committed(user_ids: list[int]) -> dict[int, tuple[int, int]]:
+    """用独立会话读取已提交的计数行（after_commit 中原会话不能再执行 SQL）"""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(NotificationCounter.user_id, NotificationCounter.total, NotificationCounter.unread)
+            .filter(NotificationCounter.user_id.in_(user_ids))
+            .all()
+        )
+        return {user_id: (int(total), int(unread)) for user_id, total, unread in rows}
+    finally:
+        db.close()
+
+
+async def refresh_cached_counts(user_ids: Iterable[int]) -> None:
+    """把已提交的计数写入 Redis 镜像；计数行已不存在的用户删除镜像"""
+    r = get_redis()
+    user_ids = list(user_ids)
+    if not r or not user_ids:
+        return
+    try:
+        counts = await asyncio.to_thread(_read_committed, user_ids)
+        pipe = r.pipeline(transaction=False)
+        for user_id in user_ids:
+            if user_id in counts:
+                pipe.set(cache_key(user_id), _encode(*counts[user_id]), ex=settings.NOTIFICATION_COUNT_CACHE_TTL)
+            else:
+                pipe.delete(cache_key(user_id))
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"[NotifyCounter] 刷新 Redis 镜像失败: {e}")
+        try:
+            await r.delete(*[cache_key(uid) for uid in user_ids])  # 写不进新值时至少不留旧值
+        except Exception:
+            pass
+
+
+@event.listens_for(Session, "after_commit")
+def _refresh_after_commit(session: Session) -> None:
+    # 回滚时不清空：保存点回滚后外层事务仍可能提交之前的改动，多刷新一次镜像无害
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if dirty and get_redis():
+        fire_and_forget(refresh_cached_counts(dirty))
+
+
+def adjust(db: Session, user_id: int, *, total: int = 0, unread: int = 0) -> None:
+    """增量调整计数
+
+    计数行不存在时不做任何事：首次读取时 get_counts() 会按当前通知统计并建行，
+    这样未执行回填迁移的老用户也不会从 0 开始累加出错误的计数。
+    """
+    if not total and not unread:
+        return
+    _mark_dirty(db, user_id)
+    db.query(NotificationCounter).filter(NotificationCounter.user_id == user_id).update(
+        {
+            NotificationCounter.total: _clamped(NotificationCounter.total, total),
+            NotificationCounter.unread: _clamped(NotificationCounter.unread, unread),
+        },
+        synchronize_session=False,
+    )
+
+
+def record_created(db: Session, user_id: int, count: int = 1) -> None:
+    """新建 count 条未读通知"""
+    adjust(db, user_id, total=count, unread=count)
+
+
+def record_created_many(db: Session, user_ids: Iterable[int]) -> None:
+    """多个用户各新建一条未读通知（扇出场景，一条 UPDATE）"""
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    for user_id in user_ids:
+        _mark_dirty(db, user_id)
+    db.query(NotificationCounter).filter(NotificationCounter.user_id.in_(user_ids)).update(
+        {
+            NotificationCounter.total: NotificationCounter.total + 1,
+            NotificationCounter.unread: NotificationCounter.unread + 1,
+        },
+        synchronize_session=False,
+    )
+
+
+def record_read(db: Session, user_id: int, count: int = 1) -> None:
+    """count 条通知由未读变为已读"""
+    adjust(db, user_id, unread=-count)
+
+
+def record_all_read(db: Session, user_id: int) -> None:
+    """全部标记已读"""
+    _mark_dirty(db, user_id)
+    db.query(NotificationCounter).filter(NotificationCounter.user_id == user_id).update(
+        {NotificationCounter.unread: 0}, synchronize_session=False
+    )
+
+
+def delete_notifications(db: Session, *criteria) -> int:
+    """删除满足条件的通知并扣减各接收者的计数，返回删除条数
+
+    替代 db.query(Notification).filter(...).delete()，调用方负责提交。
+    """
+    rows = (
+        db.query(
+            Notification.user_id,
+            func.count(Notification.id),
+            func.count(case((Notification.is_read == False, 1))),  # noqa: E712
+        )
+        .filter(*criteria)
+        .group_by(Notification.user_id)
+        .all()
+    )
+    if not rows:
+        return 0
+    for user_id, total, unread in rows:
+        adjust(db, user_id, total=-int(total), unread=-int(unread))
+    return db.query(Notification).filter(*criteria).delete(synchronize_session=False)
+
+
+def drop_user(db: Session, user_id: int) -> None:
+    """删除用户前移除其计数行（外键约束）"""
+    _mark_dirty(db, user_id)
+    db.query(NotificationCounter).filter(NotificationCounter.user_id == user_id).delete(
+        synchronize_session=False
+    )
+
+
+def count_from_notifications(db: Session, user_id: int) -> tuple[int, int]:
+    """从 notifications 表实时统计 (total, unread)（初始化与对账用）"""
+    row = db.query(
+        func.count(Notification.id),
+        func.count(case((Notification.is_read == False, 1))),  # noqa: E712
+    ).filter(Notification.user_id == user_id).first()
+    return int(row[0] or 0), int(row[1] or 0)
+
+
+def get_counts(db: Session, user_id: int) -> tuple[int, int]:
+    """返回 (total, unread)；计数行不存在时统计一次并写入"""
+    row: Optional[tuple] = (
+        db.query(NotificationCounter.total, NotificationCounter.unread)
+        .filter(NotificationCounter.user_id == user_id)
+        .first()
+    )
+    if row is not None:
+        return int(row[0]), int(row[1])
+
+    total, unread = count_from_notifications(db, user_id)
+    table = NotificationCounter.__table__
+    db.execute(
+        dialect_insert(db, table)
+        .values(user_id=user_id, total=total, unread=unread)
+        .on_conflict_do_nothing(index_elements=["user_id"])
+    )
+    db.commit()
+    return total, unread
+
+
+async def get_counts_cached(db: Session, user_id: int) -> tuple[int, int]:
+    """返回 (total, unread)：优先读 Redis 镜像，未命中时读计数行并回填"""
+    r = get_redis()
+    key = cache_key(user_id)
+    if r:
+        try:
+            cached = await r.get(key)
+            if cached is not None:
+                total, unread = cached.split(":")
+                return int(total), int(unread)
+        except Exception:
+            pass  # 降级到 DB
+
+    total, unread = get_counts(db, user_id)
+    if r:
+        try:
+            # NX：提交后的 write-through 优先，本次读到的可能已是旧值
+            await r.set(key, _encode(total, unread), ex=settings.NOTIFICATION_COUNT_CACHE_TTL, nx=True)
+        except Exception:
+            pass
+    return total, unread
+
+
+# ---------- 对账 ----------
+
+def _actual_counts(db: Session, user_ids: list[int]) -> dict[int, tuple[int, int]]:
+    rows = (
+        db.query(
+            Notification.user_id,
+            func.count(Notification.id),
+            func.count(case((Notification.is_read == False, 1))),  # noqa: E712
+        )
+        .filter(Notification.user_id.in_(user_ids))
+        .group_by(Notification.user_id)
+        .all()
+    )
+    return {user_id: (int(total), int(unread)) for user_id, total, unread in rows}
+
+
+def _reconcile_batch(db: Session, after_user_id: int, batch_size: int) -> tuple[Optional[int], list[int]]:
+    """对账 after_user_id 之后的一批计数行，返回 (本批最后的 user_id，修正过的用户)"""
+    counters = (
+        db.query(NotificationCounter.user_id, NotificationCounter.total, NotificationCounter.unread)
+        .filter(NotificationCounter.user_id > after_user_id)
+        .order_by(NotificationCounter.user_id)
+        .limit(batch_size)
+        .all()
+    )
+    if not counters:
+        return None, []
+    actual = _actual_counts(db, [c.user_id for c in counters])
+    drifted = [
+        c.user_id for c in counters
+        if (c.total, c.unread) != actual.get(c.user_id, (0, 0))
+    ]
+    if drifted:
+        # 用关联子查询在同一条 UPDATE 中重新统计，缩小与并发写入之间的窗口
+        total_sq = (
+            db.query(func.count(Notification.id))
+            .filter(Notification.user_id == NotificationCounter.user_id)
+            .scalar_subquery()
+        )
+        unread_sq = (
+            db.query(func.count(Notification.id))
+            .filter(
+                Notification.user_id == NotificationCounter.user_id,
+                Notification.is_read == False,  # noqa: E712
+            )
+            .scalar_subquery()
+        )
+        db.query(NotificationCounter).filter(
+            NotificationCounter.user_id.in_(drifted),
+            or_(NotificationCounter.total != total_sq, NotificationCounter.unread != unread_sq),
+        ).update(
+            {NotificationCounter.total: total_sq, NotificationCounter.unread: unread_sq},
+            synchronize_session=False,
+        )
+        for user_id in drifted:
+            _mark_dirty(db, user_id)
+    db.commit()
+    return counters[-1].user_id, drifted
+
+
+def reconcile_counters(db: Session, batch_size: int = RECONCILE_BATCH) -> int:
+    """全量对账通知计数，返回修正的用户数"""
+    after_user_id, fixed = 0, 0
+    while True:
+        after_user_id, drifted = _reconcile_batch(db, after_user_id, batch_size)
+        if after_user_id is None:
+            return fixed
+        if drifted:
+            fixed += len(drifted)
+            logger.info(f"[NotifyCounter] 修正 {len(drifted)} 个用户的通知计数: {drifted[:10]}")
+
+
+def _reconcile_once() -> int:
+    db = SessionLocal()
+    try:
+        return reconcile_counters(db)
+    finally:
+        db.close()
+
+
+async def run_reconcile_loop():
+    """定时对账（经 run_singleton 选举后运行）"""
+    while True:
+        await asyncio.sleep(settings.NOTIFICATION_COUNTER_RECONCILE_INTERVAL)
+        try:
+            started = time.perf_counter()
+            fixed = await asyncio.to_thread(_reconcile_once)
+            logger.info(
+                f"[NotifyCounter] 对账完成，修正 {fixed} 个用户，耗时 {time.perf_counter() - started:.1f}s"
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[NotifyCounter] 对账异常: {e}")
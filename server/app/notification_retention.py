@@ -0,0 +1,363 @@
+"""
+通知保留（归档 / 清理 / 分区）
+
+notifications 表每条回复、提及、点赞、关注和关注者新帖都会写入一行，已读的通知从不删除，
+表和 (user_id, is_read) / (user_id, created_at) 索引会无限增长。保留任务定期处理「已读且早于
+NOTIFICATION_RETENTION_DAYS 天」的通知：
+
+- 按主键顺序分批扫描（每批一个事务，扫描窗口最多 NOTIFICATION_RETENTION_BATCH 行），
+  窗口内第一行已不早于截止时间时本轮结束，不会扫描近期数据；未读的旧通知保留
+- 续扫水位：已扫描到的主键与批次在同一事务中写入 system_settings，下一轮从水位继续，
+  不再每轮从 0 重扫保留下来的未读旧通知；水位之下后来才被读掉的通知由每 FULL_SCAN_INTERVAL
+  一次的全量扫描（水位归零）回收
+- 归档：每个用户每批写一行 notification_archives，payload 为 zlib 压缩的列式 JSON（见 encode_archive），
+  比原表行 + 索引小一个数量级；NOTIFICATION_RETENTION_ARCHIVE=false 时直接删除
+- 删除走 delete_notifications()，通知计数（total/unread）同步扣减
+- PostgreSQL 分区（可选，migrate_partition_notifications.py 将表转为按 created_at 月分区）：
+  保留任务预先创建后续月份的分区；整月过期的分区整体处理（见 expire_partition）：
+  已读通知按批归档后随分区 DROP，仍未读的少量旧通知搬到默认分区保留，不逐行 DELETE。
+  分区处理先于逐行清理执行，逐行清理只剩默认分区和未到期月份中的通知
+- 集群内经租约选举单实例执行（main.py startup 中 run_singleton 启动）
+"""
+
+import asyncio
+import json
+import logging
+import time
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .database import SessionLocal
+from .models import Notification, NotificationArchive, SystemSettings
+from .notification_counters import adjust, delete_notifications
+from .settings_utils import set_setting
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+ARCHIVE_FORMAT = 1
+ARCHIVE_FIELDS = (
+    "id", "type", "thread_id", "reply_id", "from_user_id", "content_preview", "created_at", "aggregate_count",
+)
+PARTITION_PREFIX = "notifications_p"
+PARTITION_MONTHS_AHEAD = 2  # 预先创建的后续月份分区数
+_BATCH_PAUSE = 0.05  # 批次之间让出的时间（秒），避免长时间占用写锁
+FULL_SCAN_INTERVAL = timedelta(days=7)  # 从 0 重扫一次的间隔，回收水位之下后来才读掉的通知
+_WATERMARK_KEY = "notification_retention_after_id"
+_FULL_SCAN_KEY = "notification_retention_full_scan_at"  # 上次从 0 开始扫描的 Unix 秒
+
+
+# ---------- 归档格式 ----------
+
+def _epoch(dt: Optional[datetime]) -> Optional[int]:
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def encode_archive(rows: list) -> bytes:
+    """通知行 → 压缩归档
+
+    格式：zlib(JSON {"v": 1, "fields": [...], "rows": [[...], ...]})，
+    每行按 ARCHIVE_FIELDS 顺序存值，created_at 为 Unix 秒；接收者 user_id 存在归档行上，不重复写入。
+    """
+    body = {
+        "v": ARCHIVE_FORMAT,
+        "fields": ARCHIVE_FIELDS,
+        "rows": [
+            [
+                r.id, r.type, r.thread_id, r.reply_id, r.from_user_id, r.content_preview,
+                _epoch(r.created_at), r.aggregate_count,
+            ]
+            for r in rows
+        ],
+    }
+    return zlib.compress(json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def decode_archive(payload: bytes) -> list[dict]:
+    """压缩归档 → 通知字典列表（created_at 还原为 UTC datetime）"""
+    body = json.loads(zlib.decompress(payload).decode("utf-8"))
+    if body.get("v") != ARCHIVE_FORMAT:
+        raise ValueError(f"unsupported notification archive format: {body.get('v')}")
+    items = []
+    for values in body["rows"]:
+        item = dict(zip(body["fields"], values))
+        if item.get("created_at") is not None:
+            item["created_at"] = datetime.fromtimestamp(item["created_at"], tz=timezone.utc)
+        items.append(item)
+    return items
+
+
+def drop_user_archives(db: Session, user_id: int) -> None:
+    """删除用户时一并删除其归档（调用方负责提交）"""
+    db.query(NotificationArchive).filter(NotificationArchive.user_id == user_id).delete(
+        synchronize_session=False
+    )
+
+
+# ---------- 分批归档 / 清理 ----------
+
+def _archive_rows(db: Session, rows: list) -> None:
+    by_user: dict[int, list] = {}
+    for r in rows:
+        by_user.setdefault(r.user_id, []).append(r)
+    db.add_all([
+        NotificationArchive(
+            user_id=user_id,
+            first_notification_id=items[0].id,
+            last_notification_id=items[-1].id,
+            count=len(items),
+            oldest_at=min((r.created_at for r in items if r.created_at), default=None),
+            newest_at=max((r.created_at for r in items if r.created_at), default=None),
+            payload=encode_archive(items),
+        )
+        for user_id, items in by_user.items()
+    ])
+
+
+def _process_batch(db: Session, after_id: int, cutoff: datetime, batch_size: int, archive: bool):
+    """处理 after_id 之后的一个扫描窗口并推进水位，返回 (窗口末尾 ID, 清理条数, 是否继续)"""
+    window = (
+        db.query(
+            Notification.id,
+            Notification.user_id,
+            Notification.type,
+            Notification.thread_id,
+            Notification.reply_id,
+            Notification.from_user_id,
+            Notification.content_preview,
+            Notification.is_read,
+            Notification.created_at,
+            Notification.aggregate_count,
+        )
+        .filter(Notification.id > after_id)
+        .order_by(Notification.id)
+        .limit(batch_size)
+        .all()
+    )
+    if not window:
+        return after_id, 0, False
+    # 主键与创建时间近似同序：窗口第一行已不早于截止时间，后面都是近期通知
+    if window[0].created_at is not None and _as_utc(window[0].created_at) >= cutoff:
+        return after_id, 0, False
+
+    expired = [
+        r for r in window
+        if r.is_read and r.created_at is not None and _as_utc(r.created_at) < cutoff
+    ]
+    deleted = 0
+    if expired:
+        if archive:
+            _archive_rows(db, expired)
+        deleted = delete_notifications(db, Notification.id.in_([r.id for r in expired]))
+    # 水位只推进到窗口内第一条未过期通知之前，否则它过期后要等到全量扫描才会被处理
+    watermark = after_id
+    for r in window:
+        if r.created_at is not None and _as_utc(r.created_at) >= cutoff:
+            break
+        watermark = r.id
+    set_setting(db, _WATERMARK_KEY, str(watermark))  # 与本批删除同一事务提交
+    db.commit()
+    return watermark, deleted, len(window) == batch_size and watermark == window[-1].id
+
+
+def _as_utc(dt: datetime) -> datetime:
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+def _read_setting(db: Session, key: str) -> int:
+    # 直接查表而不走 settings_utils 快照：水位每批都在变，快照可能是旧值
+    value = db.query(SystemSettings.value).filter(SystemSettings.key == key).scalar()
+    try:
+        return int(value or 0)
+    except ValueError:
+        return 0
+
+
+def _resume_position(db: Session) -> int:
+    """本轮起始主键：水位，或到了全量扫描时间时归零"""
+    now = int(time.time())
+    if now - _read_setting(db, _FULL_SCAN_KEY) >= FULL_SCAN_INTERVAL.total_seconds():
+        set_setting(db, _FULL_SCAN_KEY, str(now))
+        set_setting(db, _WATERMARK_KEY, "0")
+        db.commit()
+        return 0
+    return _read_setting(db, _WATERMARK_KEY)
+
+
+def purge_expired(
+    db: Session,
+    retention_days: int,
+    *,
+    batch_size: Optional[int] = None,
+    archive: Optional[bool] = None,
+) -> int:
+    """归档/删除已读且早于 retention_days 天的通知（从续扫水位开始），返回处理条数"""
+    batch_size = batch_size or settings.NOTIFICATION_RETENTION_BATCH
+    archive = settings.NOTIFICATION_RETENTION_ARCHIVE if archive is None else archive
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    after_id, total = _resume_position(db), 0
+    while True:
+        after_id, deleted, more = _process_batch(db, after_id, cutoff, batch_size, archive)
+        total += deleted
+        if not more:
+            return total
+        time.sleep(_BATCH_PAUSE)
+
+
+# ---------- PostgreSQL 月分区 ----------
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def next_month(d: date) -> date:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def create_month_partition(conn, month: date) -> None:
+    """创建 [month, 下月) 的分区（已存在时跳过）"""
+    month = month_start(month)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF notifications "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+    ))
+
+
+def is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    relkind = db.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass('notifications')")
+    ).scalar()
+    return relkind == "p"
+
+
+def _archive_partition(db: Session, name: str, batch_size: int) -> None:
+    """按主键分批归档分区内的已读通知（只读分区，不删除）"""
+    after_id = 0
+    while True:
+        rows = db.execute(text(
+            f"SELECT id, user_id, type, thread_id, reply_id, from_user_id, content_preview, "
+            f"created_at, aggregate_count FROM {name} "
+            f"WHERE is_read AND id > :after_id ORDER BY id LIMIT :limit"
+        ), {"after_id": after_id, "limit": batch_size}).all()
+        if not rows:
+            return
+        _archive_rows(db, rows)
+        db.flush()
+        after_id = rows[-1].id
+
+
+def expire_partition(db: Session, name: str, *, batch_size: int, archive: bool) -> None:
+    """整体清理一个已过期的月分区（单个事务）
+
+    1. 锁定分区（阻止写入，允许读取），归档其中的已读通知，按用户扣减计数
+    2. DETACH 分区，把仍未读的通知插回 notifications（该月已无分区，落入默认分区）
+    3. DROP 分区：已读通知随之删除，无需逐行 DELETE
+    """
+    db.execute(text(f"LOCK TABLE {name} IN EXCLUSIVE MODE"))
+    if archive:
+        _archive_partition(db, name, batch_size)
+    for user_id, count in db.execute(
+        text(f"SELECT user_id, count(*) FROM {name} WHERE is_read GROUP BY user_id")
+    ).all():
+        adjust(db, user_id, total=-int(count))
+    db.execute(text(f"ALTER TABLE notifications DETACH PARTITION {name}"))
+    db.execute(text(f"INSERT INTO notifications SELECT * FROM {name} WHERE NOT is_read"))
+    db.execute(text(f"DROP TABLE {name}"))
+    db.commit()
+
+
+def maintain_partitions(
+    db: Session,
+    retention_days: int,
+    *,
+    batch_size: Optional[int] = None,
+    archive: Optional[bool] = None,
+) -> int:
+    """预建后续月份分区，整体清理已整月过期的分区，返回删除的分区数"""
+    batch_size = batch_size or settings.NOTIFICATION_RETENTION_BATCH
+    archive = settings.NOTIFICATION_RETENTION_ARCHIVE if archive is None else archive
+    month = month_start(date.today())
+    for _ in range(PARTITION_MONTHS_AHEAD + 1):
+        try:
+            create_month_partition(db, month)
+            db.commit()
+        except Exception as e:
+            # 默认分区中已有该月数据时无法创建，保留在默认分区即可
+            db.rollback()
+            logger.warning(f"[Retention] 创建分区 {partition_name(month)} 失败: {e}")
+        month = next_month(month)
+
+    cutoff = date.today() - timedelta(days=retention_days)
+    names = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'notifications'::regclass AND c.relname LIKE :prefix"
+    ), {"prefix": f"{PARTITION_PREFIX}%"}).scalars().all()
+    dropped = 0
+    for name in sorted(names):
+        try:
+            month = datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m").date()
+        except ValueError:
+            continue
+        if next_month(month) > cutoff:
+            continue
+        try:
+            expire_partition(db, name, batch_size=batch_size, archive=archive)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"[Retention] 清理分区 {name} 失败: {e}")
+            continue
+        dropped += 1
+    return dropped
+
+
+# ---------- 后台任务 ----------
+
+def run_retention_once() -> dict:
+    """执行一轮保留任务（同步，在线程池中调用）"""
+    retention_days = settings.NOTIFICATION_RETENTION_DAYS
+    stats = {"purged": 0, "partitions_dropped": 0}
+    if retention_days <= 0:
+        return stats
+    db = SessionLocal()
+    try:
+        # 先整体清理过期分区，逐行清理只处理剩下的通知
+        if is_partitioned(db):
+            stats["partitions_dropped"] = maintain_partitions(db, retention_days)
+        stats["purged"] = purge_expired(db, retention_days)
+    finally:
+        db.close()
+    return stats
+
+
+async def run_retention_loop():
+    """定时执行保留任务（经 run_singleton 选举后运行）"""
+    while True:
+        try:
+            started = time.perf_counter()
+            stats = await asyncio.to_thread(run_retention_once)
+            if stats["purged"] or stats["partitions_dropped"]:
+                logger.info(
+                    f"[Retention] 清理通知 {stats['purged']} 条，删除分区 {stats['partitions_dropped']} 个，"
+                    f"耗时 {time.perf_counter() - started:.1f}s"
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[Retention] 异常: {e}")
+        await asyncio.sleep(settings.NOTIFICATION_RETENTION_INTERVAL)
@@ -6,7 +6,7 @@ Unified notification push layer that dispatches to all registered transports
 """
 
 import asyncio
-from typing import Dict, Optional, List, Protocol
+from typing import Dict, Optional, List, Protocol, Tuple
 from datetime import datetime
 import logging
 
@@ -17,6 +17,7 @@ class Transport(Protocol):
     """Interface that any realtime transport must implement."""
 
     async def send_to_user(self, user_id: int, message: dict) -> int: ...
+    # Optional: async def send_to_users(self, items: List[Tuple[int, dict]]) -> int
     async def broadcast(self, message: dict, exclude_user_id: Optional[int] = None) -> None: ...
     def get_online_users(self) -> Dict[int, str]: ...
     def get_connection_count(self) -> int: ...
@@ -57,6 +58,27 @@ class NotificationPusher:
                 logger.warning(f"[{name.upper()}] Failed to push to user {user_id}: {e}")
         return total
 
+    async def send_to_users(self, items: List[Tuple[int, dict]]) -> int:
+        """Send a batch of (user_id, message) pairs via all transports.
+
+        Transports that implement send_to_users() get the whole batch in one call
+        (e.g. one Redis pipeline); others fall back to per-user send_to_user().
+        """
+        if not items:
+            return 0
+        total = 0
+        for name, transport in self._transports.items():
+            try:
+                send_many = getattr(transport, "send_to_users", None)
+                if send_many is not None:
+                    total += await send_many(items)
+                else:
+                    for user_id, message in items:
+                        total += await transport.send_to_user(user_id, message)
+            except Exception as e:
+                logger.warning(f"[{name.upper()}] Failed to push batch of {len(items)}: {e}")
+        return total
+
     async def broadcast(self, message: dict, exclude_user_id: Optional[int] = None):
         """Broadcast a message via all transports."""
         for name, transport in self._transports.items():
@@ -103,6 +125,8 @@ async def push_notification(
     from_username: str,
     reply_id: Optional[int] = None,
     content: Optional[str] = None,
+    aggregate_count: Optional[int] = None,
+    recent_actor_ids: Optional[list[int]] = None,
 ) -> int:
     """
     Push a notification to a user via all registered transports.
@@ -116,6 +140,8 @@ async def push_notification(
         from_username: Username who triggered
         reply_id: The reply ID (optional)
         content: The content preview (optional)
+        aggregate_count: Number of merged events for aggregated notifications (optional)
+        recent_actor_ids: Most recent actors of an aggregated notification, newest first (optional)
     """
     message = {
         "type": notification_type,
@@ -127,6 +153,9 @@ async def push_notification(
         "content": content,
         "timestamp": datetime.utcnow().isoformat(),
     }
+    if aggregate_count is not None:
+        message["aggregate_count"] = aggregate_count
+        message["recent_actor_ids"] = recent_actor_ids or []
     return await pusher.send_to_user(user_id, message)
 
 
@@ -0,0 +1,128 @@
+"""
+密码哈希执行器
+
+bcrypt 每次校验/哈希约消耗 250ms CPU。直接在 def 路由里调用会占用
+FastAPI 共享线程池，撞库类突发流量会拖慢所有同步路由。
+
+- 哈希运算在独立的有界进程池中执行（创建失败时退化为独立线程池）
+- 路由保持 def（数据库操作仍在线程池中），通过 hash_password_from_thread / verify_password_from_thread
+  回到事件循环排队提交到执行器
+- 排队深度超过 PASSWORD_HASH_MAX_PENDING 时直接返回 429，快速卸载压力
+- bcrypt cost 由 BCRYPT_ROUNDS 配置；cost 变化后，旧哈希在下次登录校验成功时透明升级
+"""
+
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import anyio.from_thread
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# min/max 与 default 相同：cost 不一致的旧哈希会被 needs_update 标记，登录时重新哈希
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+_executor: Optional[Executor] = None
+_pending = 0  # 仅在事件循环线程中读写
+
+
+def truncate_password(password: str) -> str:
+    """截断密码到 72 字节（bcrypt 限制）"""
+    return password.encode("utf-8")[:72].decode("utf-8", errors="ignore")
+
+
+# ----- 在工作进程中执行的函数（必须是模块级函数，可被 pickle） -----
+
+def _hash_in_worker(password: str) -> str:
+    return pwd_context.hash(truncate_password(password))
+
+
+def _verify_in_worker(password: str, hashed: str, rehash: bool) -> tuple[bool, Optional[str]]:
+    secret = truncate_password(password)
+    if rehash:
+        return pwd_context.verify_and_update(secret, hashed)
+    return pwd_context.verify(secret, hashed), None
+
+
+# ----- 执行器管理 -----
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        workers = max(1, settings.PASSWORD_HASH_WORKERS)
+        try:
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        except (OSError, NotImplementedError) as e:
+            logger.warning(f"[PasswordHasher] 进程池创建失败，退化为独立线程池: {e}")
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwd-hash")
+    return _executor
+
+
+def shutdown_executor():
+    """关闭执行器（app shutdown 时调用）"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= settings.PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="请求过于频繁，请稍后再试",
+        )
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(_get_executor(), fn, *args)
+        except BrokenProcessPool:
+            # 工作进程异常退出：重建进程池后重试一次
+            logger.warning("[PasswordHasher] 进程池已损坏，重建后重试")
+            shutdown_executor()
+            return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    """异步加密密码（在哈希执行器中运行）"""
+    return await _run(_hash_in_worker, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """异步验证密码（在哈希执行器中运行）
+
+    Returns:
+        (是否匹配, 新哈希)。新哈希仅在开启 PASSWORD_REHASH_ON_LOGIN 且旧哈希参数过期时返回，
+        调用方应将其写回数据库。
+    """
+    return await _run(
+        _verify_in_worker, plain_password, hashed_password, settings.PASSWORD_REHASH_ON_LOGIN
+    )
+
+
+def hash_password_from_thread(password: str) -> str:
+    """在 def 路由（工作线程）中加密密码：回到事件循环经执行器计算，排队过深时抛 429"""
+    return anyio.from_thread.run(hash_password_async, password)
+
+
+def verify_password_from_thread(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """在 def 路由（工作线程）中验证密码，返回值同 verify_password_async"""
+    return anyio.from_thread.run(verify_password_async, plain_password, hashed_password)
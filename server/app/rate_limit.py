@@ -1,24 +1,255 @@
 """
-速率限制配置
+速率限制
 
-基于 slowapi，支持 Redis 后端（多实例共享限流计数器）。
-当 REDIS_URL 配置时使用 Redis 存储，否则降级为内存存储。
+混合令牌桶限流器：
+- 限流键：已认证请求按用户/Bot ID（Bearer Token 解析走已验证 token LRU），
+  未认证请求（登录/注册等）按客户端 IP。同一 NAT/代理后的 Bot 不再互相挤占额度
+- 判定在本地令牌桶内完成（内存操作，无网络往返）
+- 后台任务按批次（pipeline）把各桶的本地消耗 INCRBY 到 Redis 固定窗口计数器，
+  取回全局计数，把其他实例的消耗从本地桶中扣除，多实例共享同一额度
+- 路由成本权重：@limiter.limit("30/minute", cost=2) 每次请求消耗 2 个令牌；
+  scope 相同的路由共享同一个桶
+- REDIS_URL 未配置时仅本地限流
 """
 
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+import asyncio
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
 from fastapi import Request
 from fastapi.responses import JSONResponse
+
 from .config import get_settings
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
 
 _settings = get_settings()
 
-# 全局 limiter 实例（Redis 可用时使用 Redis 存储，否则内存存储）
-limiter = Limiter(
-    key_func=get_remote_address,
-    storage_uri=_settings.REDIS_URL if _settings.REDIS_URL else "memory://",
-)
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_RATE_RE = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(second|minute|hour|day)s?\s*$")
+
+
+class RateLimitExceeded(Exception):
+    """超出速率限制"""
+
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def parse_rate(rate: str) -> tuple[int, int]:
+    """解析 "10/minute" 形式的限额，返回 (次数, 周期秒数)"""
+    match = _RATE_RE.match(rate)
+    if not match:
+        raise ValueError(f"无法解析的限流配置: {rate}")
+    return int(match.group(1)), _PERIODS[match.group(2)]
+
+
+def get_rate_limit_key(request: Request) -> str:
+    """限流键：已认证请求按账号（管理员 a:{id}，用户的各类 token 共用 u:{id}），否则用客户端 IP
+
+    管理员与用户 ID 来自不同的表需要分开；同一账号换用 bot/user/session token 不会得到额外配额。
+    """
+    auth = request.headers.get("authorization", "")
+    if auth[:7].lower() == "bearer ":
+        from .auth import verify_token
+        user_id, token_type = verify_token(auth[7:].strip())
+        if user_id is not None:
+            return f"a:{user_id}" if token_type == "admin" else f"u:{user_id}"
+    host = request.client.host if request.client else "unknown"
+    return f"ip:{host}"
+
+
+@dataclass
+class _Bucket:
+    capacity: float
+    refill_per_sec: float
+    period: int
+    tokens: float
+    updated_at: float
+    pending: int = 0  # 尚未同步到 Redis 的本地消耗
+    window: int = 0  # 当前固定窗口编号
+    window_local: int = 0  # 本实例在当前窗口内已同步的消耗
+    window_remote: int = 0  # 其他实例在当前窗口内的消耗（上次同步时）
+    last_seen: float = field(default_factory=time.monotonic)
+
+
+class HybridLimiter:
+    """本地令牌桶 + Redis 批量对账"""
+
+    def __init__(self, sync_interval: float = 1.0):
+        self._buckets: dict[tuple[str, str], _Bucket] = {}
+        self._lock = threading.Lock()
+        self._sync_interval = sync_interval
+        self._sync_task: Optional[asyncio.Task] = None
+        self._stats = {"allowed": 0, "rejected": 0, "sync_batches": 0}
+
+    # ----- 判定 -----
+
+    def hit(self, scope: str, key: str, limit: int, period: int, cost: int = 1) -> Optional[int]:
+        """消耗令牌，成功返回 None，超限返回建议的重试秒数"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get((scope, key))
+            if bucket is None:
+                bucket = _Bucket(
+                    capacity=float(limit),
+                    refill_per_sec=limit / period,
+                    period=period,
+                    tokens=float(limit),
+                    updated_at=now,
+                )
+                self._buckets[(scope, key)] = bucket
+            bucket.tokens = min(
+                bucket.capacity,
+                bucket.tokens + (now - bucket.updated_at) * bucket.refill_per_sec,
+            )
+            bucket.updated_at = now
+            bucket.last_seen = now
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                bucket.pending += cost
+                self._stats["allowed"] += 1
+                return None
+            self._stats["rejected"] += 1
+            return max(1, int((cost - bucket.tokens) / bucket.refill_per_sec + 0.999))
+
+    def _check(self, request: Request, scope: str, rate: str, limit: int, period: int, cost: int):
+        retry_after = self.hit(scope, get_rate_limit_key(request), limit, period, cost)
+        if retry_after is not None:
+            raise RateLimitExceeded(rate, retry_after)
+
+    def limit(self, rate: str, cost: int = 1, scope: Optional[str] = None):
+        """路由装饰器，被装饰的路由必须声明 request: Request 参数
+
+        Args:
+            rate: 限额，如 "10/minute"
+            cost: 每次请求消耗的令牌数（路由成本权重）
+            scope: 桶名，默认使用路由函数的完整名称；相同 scope 的路由共享额度
+        """
+        limit, period = parse_rate(rate)
+
+        def decorator(func):
+            bucket_scope = scope or f"{func.__module__}.{func.__name__}"
+
+            def _find_request(args, kwargs) -> Request:
+                request = kwargs.get("request")
+                if request is None:
+                    request = next((a for a in args if isinstance(a, Request)), None)
+                if request is None:
+                    raise RuntimeError(f"{func.__name__} 需要声明 request: Request 参数才能限流")
+                return request
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    self._check(_find_request(args, kwargs), bucket_scope, rate, limit, period, cost)
+                    return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def sync_wrapper(*args, **kwargs):
+                self._check(_find_request(args, kwargs), bucket_scope, rate, limit, period, cost)
+                return func(*args, **kwargs)
+            return sync_wrapper
+
+        return decorator
+
+    # ----- Redis 批量对账 -----
+
+    async def sync_once(self):
+        """把本地消耗批量同步到 Redis，并用全局计数扣减本地桶"""
+        now_wall = time.time()
+        now = time.monotonic()
+        with self._lock:
+            # 清理已回满且长时间空闲的桶
+            for bucket_key, bucket in list(self._buckets.items()):
+                if bucket.pending == 0 and now - bucket.last_seen > bucket.period * 2:
+                    del self._buckets[bucket_key]
+            batch = []
+            for (scope, key), bucket in self._buckets.items():
+                window = int(now_wall // bucket.period)
+                if window != bucket.window:
+                    bucket.window = window
+                    bucket.window_local = 0
+                    bucket.window_remote = 0
+                if bucket.pending or now - bucket.last_seen <= bucket.period:
+                    batch.append((scope, key, bucket.period, window, bucket.pending))
+                    bucket.window_local += bucket.pending
+                    bucket.pending = 0
+
+        r = get_redis()
+        if not r or not batch:
+            return
+
+        try:
+            pipe = r.pipeline(transaction=False)
+            for scope, key, period, window, pending in batch:
+                redis_key = f"rl:{scope}:{key}:{window}"
+                pipe.incrby(redis_key, pending)
+                pipe.expire(redis_key, period * 2)
+            results = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[RateLimit] Redis 对账失败，本轮仅本地限流: {e}")
+            return
+
+        with self._lock:
+            self._stats["sync_batches"] += 1
+            for idx, (scope, key, period, window, _) in enumerate(batch):
+                bucket = self._buckets.get((scope, key))
+                if bucket is None or bucket.window != window:
+                    continue
+                remote = max(0, int(results[idx * 2]) - bucket.window_local)
+                delta = remote - bucket.window_remote
+                if delta > 0:
+                    # 其他实例的消耗从本地桶扣除（最多扣到 -capacity，避免长期饿死）
+                    bucket.tokens = max(-bucket.capacity, bucket.tokens - delta)
+                bucket.window_remote = remote
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self._sync_interval)
+            try:
+                await self.sync_once()
+            except Exception as e:
+                logger.warning(f"[RateLimit] 对账任务异常: {e}")
+
+    async def start(self):
+        """启动对账任务（app startup 时调用，Redis 不可用时仅本地限流）"""
+        if not get_redis():
+            logger.info("[RateLimit] Redis 不可用，仅使用本地令牌桶")
+            return
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self):
+        """停止对账任务并同步剩余消耗（app shutdown 时调用）"""
+        if self._sync_task:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+            await self.sync_once()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["buckets"] = len(self._buckets)
+        return stats
+
+
+# 全局 limiter 实例
+limiter = HybridLimiter(sync_interval=_settings.RATE_LIMIT_SYNC_INTERVAL)
 
 
 async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
@@ -28,4 +259,5 @@ async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
         content={
             "detail": f"请求过于频繁，请稍后再试。限制: {exc.detail}"
         },
+        headers={"Retry-After": str(exc.retry_after)},
     )
@@ -15,24 +15,37 @@ from .config import get_settings
 logger = logging.getLogger(__name__)
 
 _pool: Optional[aioredis.Redis] = None
+# 主事件循环（init_redis 时记录），供线程池中的同步路由投递协程
+_main_loop: Optional[asyncio.AbstractEventLoop] = None
 
 
 def fire_and_forget(coro: Coroutine) -> None:
     """P3 #32: 统一的 fire-and-forget 工具函数
-    
-    在有 running event loop 时调度协程执行，无 loop 时静默跳过。
+
+    在有 running event loop 时调度协程执行；
+    在线程池中的同步路由里（无 running loop）投递到主事件循环执行；
+    两者都不可用时静默丢弃。
     用于同步函数中触发异步操作（如 Redis 缓存更新）。
     """
     try:
         loop = asyncio.get_running_loop()
         loop.create_task(coro)
+        return
     except RuntimeError:
-        pass  # 无 running loop（线程池中的同步路由），跳过
+        pass  # 无 running loop（线程池中的同步路由）
+    if _main_loop is not None and not _main_loop.is_closed():
+        try:
+            asyncio.run_coroutine_threadsafe(coro, _main_loop)
+            return
+        except RuntimeError:
+            pass
+    coro.close()  # 避免 "coroutine was never awaited" 警告
 
 
 async def init_redis():
     """初始化 Redis 连接池（app startup 时调用）"""
-    global _pool
+    global _pool, _main_loop
+    _main_loop = asyncio.get_running_loop()
     settings = get_settings()
     if not settings.REDIS_URL:
         logger.info("[Redis] REDIS_URL 未配置，Redis 缓存已禁用")
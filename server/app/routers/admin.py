@@ -12,6 +12,7 @@ from ..models import (
     Admin,
     SystemSettings,
     ModerationLog,
+    ModerationQueue,
     Notification,
     Like,
     UserLevel,
@@ -20,10 +21,17 @@ from ..models import (
     OAuthAccount,
 )
 from ..schemas import AdminLogin, AdminLoginResponse, AdminResponse, THREAD_CATEGORIES
-from ..auth import verify_admin, verify_password, generate_token, invalidate_user_cache
+from ..auth import verify_admin, verify_password_from_thread, generate_token, invalidate_user_cache, purge_verified_tokens
+from ..notification_counters import delete_notifications, drop_user as drop_notification_counter
+from ..notification_retention import drop_user_archives
 from ..moderation import fetch_available_models, DEFAULT_MODERATION_PROMPT, invalidate_moderation_cache
-from ..settings_utils import get_settings_batch
+from ..moderation_prefilter import get_prefilter_stats
+from ..settings_utils import get_settings_batch, invalidate_settings_cache, invalidate_settings_cache_nowait
 from ..redis_client import get_redis
+from ..block_cache import get_block_cache
+from ..like_index import drop_user_index
+from ..mention_cache import get_mention_resolver
+from .blocks import get_blocked_user_ids
 
 import json
 
@@ -49,11 +57,20 @@ def admin_login(data: AdminLogin, db: Session = Depends(get_db)):
     """
     admin = db.query(Admin).filter(Admin.username == data.username).first()
 
-    if not admin or not verify_password(data.password, admin.password_hash):
+    if not admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="用户名或密码错误"
         )
 
+    valid, new_hash = verify_password_from_thread(data.password, admin.password_hash)
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="用户名或密码错误"
+        )
+    if new_hash:
+        admin.password_hash = new_hash
+        db.commit()
+
     token = generate_token(admin.id, "admin")
 
     return AdminLoginResponse(admin=AdminResponse.model_validate(admin), token=token)
@@ -189,6 +206,7 @@ def ban_user(
     user.ban_reason = data.reason if data and data.reason else "违反社区规定"
     db.commit()
     invalidate_user_cache(user_id)
+    purge_verified_tokens(user_id)
 
     return {
         "message": "用户已封禁",
@@ -248,17 +266,15 @@ def delete_user(
 
     # 先删除相关通知（外键约束）
     if all_reply_ids:
-        db.query(Notification).filter(Notification.reply_id.in_(all_reply_ids)).delete(
-            synchronize_session=False
-        )
+        delete_notifications(db, Notification.reply_id.in_(all_reply_ids))
     if thread_ids:
-        db.query(Notification).filter(Notification.thread_id.in_(thread_ids)).delete(
-            synchronize_session=False
-        )
+        delete_notifications(db, Notification.thread_id.in_(thread_ids))
     # 删除该用户收到和发出的所有通知
-    db.query(Notification).filter(
-        (Notification.user_id == user_id) | (Notification.from_user_id == user_id)
-    ).delete(synchronize_session=False)
+    delete_notifications(
+        db, (Notification.user_id == user_id) | (Notification.from_user_id == user_id)
+    )
+    drop_notification_counter(db, user_id)
+    drop_user_archives(db, user_id)
 
     # P1 #10: 清除 Like 记录（用户的点赞 + 被删帖子/回复收到的点赞）
     db.query(Like).filter(Like.user_id == user_id).delete(synchronize_session=False)
@@ -274,7 +290,8 @@ def delete_user(
     # P1 #10: 清除 UserLevel 记录
     db.query(UserLevel).filter(UserLevel.user_id == user_id).delete(synchronize_session=False)
 
-    # P1 #10: 清除 BlockList 记录（双向）
+    # P1 #10: 清除 BlockList 记录（双向），记录对方 ID 以便失效其拉黑关系缓存
+    block_peer_ids = get_blocked_user_ids(db, user_id)
     db.query(BlockList).filter(
         (BlockList.user_id == user_id) | (BlockList.blocked_user_id == user_id)
     ).delete(synchronize_session=False)
@@ -311,8 +328,14 @@ def delete_user(
         synchronize_session=False
     )
 
+    username = user.username
     db.delete(user)
     db.commit()
+    invalidate_user_cache(user_id)
+    get_mention_resolver().invalidate(username)
+    purge_verified_tokens(user_id)
+    get_block_cache().invalidate(user_id, *block_peer_ids)
+    drop_user_index(user_id)
 
     return {"message": "用户已删除"}
 
@@ -393,13 +416,9 @@ def admin_delete_thread(
     ]
 
     # 先删除相关通知（外键约束）
-    db.query(Notification).filter(Notification.thread_id == thread_id).delete(
-        synchronize_session=False
-    )
+    delete_notifications(db, Notification.thread_id == thread_id)
     if reply_ids:
-        db.query(Notification).filter(Notification.reply_id.in_(reply_ids)).delete(
-            synchronize_session=False
-        )
+        delete_notifications(db, Notification.reply_id.in_(reply_ids))
 
     # P1 #10: 清除帖子和回复的 Like 记录
     db.query(Like).filter(
@@ -476,6 +495,11 @@ class ModerationSettingsUpdate(BaseModel):
     prompt: Optional[str] = None
     interval: Optional[int] = None  # 审核间隔（秒）
     batch_size: Optional[int] = None  # 每次审核的评论数
+    prefilter_enabled: Optional[bool] = None  # 本地规则预审
+    deny_keywords: Optional[str] = None  # 屏蔽词，每行一个
+    allow_list: Optional[str] = None  # 内容白名单，每行一条
+    deny_list: Optional[str] = None  # 内容黑名单，每行一条
+    short_pass_length: Optional[int] = None  # 不超过该长度的普通短文本直接通过（0 关闭）
 
 
 class ModerationTestRequest(BaseModel):
@@ -510,7 +534,9 @@ def get_moderation_settings(
     s = get_settings_batch(db, [
         "moderation_enabled", "moderation_api_base",
         "moderation_api_key", "moderation_model", "moderation_prompt",
-        "moderation_interval", "moderation_batch_size"
+        "moderation_interval", "moderation_batch_size",
+        "moderation_prefilter_enabled", "moderation_deny_keywords",
+        "moderation_allow_list", "moderation_deny_list", "moderation_short_pass_length",
     ], defaults={
         "moderation_enabled": "false",
         "moderation_api_base": "https://api.openai.com/v1",
@@ -519,6 +545,8 @@ def get_moderation_settings(
         "moderation_prompt": DEFAULT_MODERATION_PROMPT,
         "moderation_interval": "60",
         "moderation_batch_size": "5",
+        "moderation_prefilter_enabled": "true",
+        "moderation_short_pass_length": "0",
     })
     return {
         "enabled": s["moderation_enabled"] == "true",
@@ -528,6 +556,11 @@ def get_moderation_settings(
         "prompt": s["moderation_prompt"],
         "interval": int(s["moderation_interval"]),
         "batch_size": int(s["moderation_batch_size"]),
+        "prefilter_enabled": s["moderation_prefilter_enabled"] == "true",
+        "deny_keywords": s["moderation_deny_keywords"],
+        "allow_list": s["moderation_allow_list"],
+        "deny_list": s["moderation_deny_list"],
+        "short_pass_length": int(s["moderation_short_pass_length"]),
         "default_prompt": DEFAULT_MODERATION_PROMPT,
     }
 
@@ -556,6 +589,16 @@ async def update_moderation_settings(
     if data.batch_size is not None:
         batch_size = max(1, min(50, data.batch_size))
         _set_setting(db, "moderation_batch_size", str(batch_size))
+    if data.prefilter_enabled is not None:
+        _set_setting(db, "moderation_prefilter_enabled", "true" if data.prefilter_enabled else "false")
+    if data.deny_keywords is not None:
+        _set_setting(db, "moderation_deny_keywords", data.deny_keywords)
+    if data.allow_list is not None:
+        _set_setting(db, "moderation_allow_list", data.allow_list)
+    if data.deny_list is not None:
+        _set_setting(db, "moderation_deny_list", data.deny_list)
+    if data.short_pass_length is not None:
+        _set_setting(db, "moderation_short_pass_length", str(max(0, min(50, data.short_pass_length))))
 
     db.commit()
     
@@ -608,6 +651,7 @@ def update_imagebed_settings(
         _set_setting(db, "imgbed_max_size", str(data.max_size_mb * 1024 * 1024))
 
     db.commit()
+    invalidate_settings_cache_nowait("imgbed_daily_limit", "imgbed_max_size")
 
     return {"message": "图床配置已更新"}
 
@@ -684,9 +728,9 @@ async def test_moderation(
     }
 
     try:
-        from ..moderation import get_http_client
-        client = get_http_client()
-        response = await client.post(url, headers=headers, json=payload)
+        from ..http_client import request as outbound_request
+        # 独立上游：管理员试填错误的地址/密钥不会触发线上审核的熔断
+        response = await outbound_request("moderation_admin", "POST", url, headers=headers, json=payload)
         response.raise_for_status()
         result = response.json()
 
@@ -742,6 +786,7 @@ class ModerationLogResponse(BaseModel):
     flagged_category: Optional[str]
     reason: Optional[str]
     model_used: Optional[str]
+    cached: bool = False
     created_at: str
 
 
@@ -786,6 +831,7 @@ def get_moderation_logs(
             "flagged_category": log.flagged_category,
             "reason": log.reason,
             "model_used": log.model_used,
+            "cached": log.cached,
             "created_at": log.created_at.isoformat() if log.created_at else None,
         }
         for log in logs
@@ -800,6 +846,101 @@ def get_moderation_logs(
     }
 
 
+@router.get("/cache/stats")
+def get_cache_stats(admin: Admin = Depends(verify_admin)):
+    """
+    获取本实例缓存命中统计（进程级指标，多实例时各自独立）
+    """
+    from ..user_cache import get_user_cache
+    from ..moderation_cache import get_verdict_cache
+
+    return {
+        "user": get_user_cache().get_stats(),
+        "blocks": get_block_cache().get_stats(),
+        "moderation_verdicts": get_verdict_cache().get_stats(),
+        "mentions": get_mention_resolver().get_stats(),
+    }
+
+
+@router.get("/upstreams")
+def get_upstreams(admin: Admin = Depends(verify_admin)):
+    """
+    获取本实例出站上游（审核 LLM / 图床 / OAuth）的请求统计、熔断状态与延迟
+    """
+    from ..http_client import get_upstream_stats
+    return get_upstream_stats()
+
+
+@router.get("/leases")
+async def get_leases(admin: Admin = Depends(verify_admin)):
+    """
+    查看单例后台任务的租约持有者
+    """
+    from ..leader import INSTANCE_ID, get_lease_status
+    return {"instance": INSTANCE_ID, "leases": await get_lease_status()}
+
+
+@router.get("/moderation/queue")
+def get_moderation_queue(
+    db: Session = Depends(get_db), admin: Admin = Depends(verify_admin)
+):
+    """
+    获取审核队列状态（待审核 / 租约中 / 死信）及最近的死信条目
+    """
+    from sqlalchemy import case as sa_case
+    now = datetime.utcnow()
+    stats = db.query(
+        func.sum(sa_case((ModerationQueue.status == "pending", 1), else_=0)).label("pending"),
+        func.sum(sa_case(
+            ((ModerationQueue.status == "pending") & (ModerationQueue.locked_until > now), 1),
+            else_=0,
+        )).label("leased"),
+        func.sum(sa_case((ModerationQueue.status == "dead", 1), else_=0)).label("dead"),
+    ).first()
+    dead_items = (
+        db.query(ModerationQueue)
+        .filter(ModerationQueue.status == "dead")
+        .order_by(desc(ModerationQueue.id))
+        .limit(50)
+        .all()
+    )
+    return {
+        "pending": int(stats.pending or 0),
+        "leased": int(stats.leased or 0),
+        "dead": int(stats.dead or 0),
+        "dead_items": [
+            {
+                "content_type": item.content_type,
+                "content_id": item.content_id,
+                "attempts": item.attempts,
+                "last_error": item.last_error,
+                "created_at": item.created_at,
+            }
+            for item in dead_items
+        ],
+    }
+
+
+@router.post("/moderation/queue/retry")
+def retry_moderation_dead_letters(
+    db: Session = Depends(get_db), admin: Admin = Depends(verify_admin)
+):
+    """
+    将死信条目重新放回审核队列（重置领取次数）
+    """
+    count = db.query(ModerationQueue).filter(ModerationQueue.status == "dead").update(
+        {
+            ModerationQueue.status: "pending",
+            ModerationQueue.attempts: 0,
+            ModerationQueue.locked_until: None,
+            ModerationQueue.locked_by: None,
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    return {"message": f"已重新入队 {count} 条", "count": count}
+
+
 @router.get("/moderation/stats")
 def get_moderation_stats(
     db: Session = Depends(get_db), admin: Admin = Depends(verify_admin)
@@ -813,10 +954,15 @@ def get_moderation_stats(
         func.count(ModerationLog.id).label("total"),
         func.sum(sa_case((ModerationLog.passed == True, 1), else_=0)).label("passed"),
         func.sum(sa_case((ModerationLog.passed == False, 1), else_=0)).label("blocked"),
+        func.sum(sa_case((ModerationLog.cached == True, 1), else_=0)).label("cached"),
+        func.sum(sa_case((ModerationLog.model_used.like("prefilter:%"), 1), else_=0)).label("local"),
     ).first()
 
     return {
         "total": stats.total or 0,
         "passed": int(stats.passed or 0),
         "blocked": int(stats.blocked or 0),
+        "cached": int(stats.cached or 0),
+        "local": int(stats.local or 0),
+        "prefilter": get_prefilter_stats(),
     }
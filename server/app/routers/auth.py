@@ -3,6 +3,8 @@ from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func
 from ..database import get_db
 from ..models import User, Thread, Reply, OAuthAccount, Notification, Like, UserLevel, BlockList, ImageUpload
+from ..notification_counters import delete_notifications, drop_user as drop_notification_counter
+from ..notification_retention import drop_user_archives
 from ..schemas import (
     UserCreate,
     UserResponse,
@@ -17,10 +19,17 @@ from ..schemas import (
     UserLevelResponse,
     UserProfileResponse,
 )
-from ..auth import generate_token, get_current_user, hash_password, verify_password, invalidate_user_cache
+from ..auth import (
+    generate_token, get_current_user, hash_password_from_thread, verify_password_from_thread,
+    invalidate_user_cache, purge_verified_tokens,
+)
 from ..level_service import get_user_level_info
 from ..rate_limit import limiter
 from ..redis_client import get_redis
+from ..block_cache import get_block_cache
+from ..like_index import drop_user_index
+from ..mention_cache import get_mention_resolver
+from .blocks import get_blocked_user_ids
 
 import json
 import logging
@@ -58,10 +67,16 @@ def login(request: Request, data: UserLogin, db: Session = Depends(get_db)):
             status_code=status.HTTP_401_UNAUTHORIZED, detail="用户名或密码错误"
         )
 
-    if not verify_password(data.password, user.password_hash):
+    # bcrypt 在独立进程池中执行，排队过深时返回 429
+    valid, new_hash = verify_password_from_thread(data.password, user.password_hash)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="用户名或密码错误"
         )
+    if new_hash:
+        # cost 参数已调整：透明升级旧哈希
+        user.password_hash = new_hash
+        db.commit()
 
     if user.is_banned:
         reason = user.ban_reason or "违反社区规定"
@@ -127,6 +142,7 @@ def refresh_token(
     db.commit()
     db.refresh(current_user)
     invalidate_user_cache(current_user.id)
+    purge_verified_tokens(current_user.id)
 
     return UserWithTokenResponse.model_validate(current_user)
 
@@ -169,12 +185,13 @@ def change_password(
             detail="此账号没有设置密码，请使用设置密码功能",
         )
 
-    if not verify_password(data.old_password, current_user.password_hash):
+    valid, _ = verify_password_from_thread(data.old_password, current_user.password_hash)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="当前密码错误"
         )
 
-    current_user.password_hash = hash_password(data.new_password)
+    current_user.password_hash = hash_password_from_thread(data.new_password)
     db.commit()
     invalidate_user_cache(current_user.id)
 
@@ -196,7 +213,7 @@ def set_password(
             detail="您已经设置过密码，请使用修改密码功能",
         )
 
-    current_user.password_hash = hash_password(data.new_password)
+    current_user.password_hash = hash_password_from_thread(data.new_password)
     db.commit()
     invalidate_user_cache(current_user.id)
 
@@ -325,7 +342,8 @@ def delete_account(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="请提供密码以确认注销操作",
             )
-        if not verify_password(password, current_user.password_hash):
+        valid, _ = verify_password_from_thread(password, current_user.password_hash)
+        if not valid:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="密码错误"
             )
@@ -356,9 +374,11 @@ def delete_account(
     )
 
     # P2 #20: 清除通知（用户收到和发出的）
-    db.query(Notification).filter(
-        (Notification.user_id == current_user.id) | (Notification.from_user_id == current_user.id)
-    ).delete(synchronize_session=False)
+    delete_notifications(
+        db, (Notification.user_id == current_user.id) | (Notification.from_user_id == current_user.id)
+    )
+    drop_notification_counter(db, current_user.id)
+    drop_user_archives(db, current_user.id)
 
     # P2 #20: 清除 Like 记录
     db.query(Like).filter(Like.user_id == current_user.id).delete(synchronize_session=False)
@@ -366,7 +386,8 @@ def delete_account(
     # P2 #20: 清除 UserLevel 记录
     db.query(UserLevel).filter(UserLevel.user_id == current_user.id).delete(synchronize_session=False)
 
-    # P2 #20: 清除 BlockList 记录（双向）
+    # P2 #20: 清除 BlockList 记录（双向），记录对方 ID 以便失效其拉黑关系缓存
+    block_peer_ids = get_blocked_user_ids(db, current_user.id)
     db.query(BlockList).filter(
         (BlockList.user_id == current_user.id) | (BlockList.blocked_user_id == current_user.id)
     ).delete(synchronize_session=False)
@@ -380,8 +401,15 @@ def delete_account(
     )
 
     # 删除用户
+    user_id = current_user.id
+    username = current_user.username
     db.delete(current_user)
     db.commit()
+    invalidate_user_cache(user_id)
+    get_mention_resolver().invalidate(username)
+    purge_verified_tokens(user_id)
+    get_block_cache().invalidate(user_id, *block_peer_ids)
+    drop_user_index(user_id)
 
     return {"message": "账号已成功注销"}
 
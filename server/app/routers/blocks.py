@@ -1,7 +1,7 @@
 """拉黑功能路由"""
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_, func
+from sqlalchemy import or_, and_, func, exists
 import math
 from ..database import get_db
 from ..models import User, BlockList
@@ -9,7 +9,8 @@ from ..schemas import (
     BlockUserRequest, BlockedUserResponse, BlockListResponse, UserPublicResponse
 )
 from ..auth import get_current_user
-from ..redis_client import get_redis
+from ..block_cache import get_block_cache
+from ..config import get_settings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,69 +20,72 @@ router = APIRouter(prefix="/blocks", tags=["拉黑"])
 
 def get_blocked_user_ids(db: Session, user_id: int) -> set:
     """同步版：获取双向拉黑的所有用户ID列表（我拉黑的 + 拉黑我的）
-    
-    仅走 DB 查询，用于 def 路由（FastAPI 线程池中执行）。
+
+    用于 def 路由（FastAPI 线程池中执行），走进程内 L1 缓存，miss 时查 DB。
     async def 路由应使用 get_blocked_user_ids_async() 以利用 Redis 缓存。
     """
-    blocked_rows = (
-        db.query(BlockList.blocked_user_id.label("uid"))
-        .filter(BlockList.user_id == user_id)
-        .union_all(
-            db.query(BlockList.user_id.label("uid"))
-            .filter(BlockList.blocked_user_id == user_id)
-        )
-        .all()
-    )
-    return {row[0] for row in blocked_rows}
+    outgoing, incoming = get_block_cache().get_sync(db, user_id)
+    return set(outgoing | incoming)
 
 
 async def get_blocked_user_ids_async(db: Session, user_id: int) -> set:
-    """异步版本：优先从 Redis Set 读取拉黑列表，miss 时查 DB 并回写缓存"""
-    r = get_redis()
-    if r:
-        try:
-            key = f"blocks:{user_id}"
-            cached = await r.smembers(key)
-            if cached:
-                return {int(uid) for uid in cached}
-        except Exception:
-            pass  # 降级到 DB
-    
-    # DB 查询
-    blocked_rows = (
-        db.query(BlockList.blocked_user_id.label("uid"))
-        .filter(BlockList.user_id == user_id)
-        .union_all(
-            db.query(BlockList.user_id.label("uid"))
-            .filter(BlockList.blocked_user_id == user_id)
-        )
-        .all()
+    """异步版本：L1 → Redis → DB，空集合同样缓存"""
+    outgoing, incoming = await get_block_cache().get(db, user_id)
+    return set(outgoing | incoming)
+
+
+def get_users_who_blocked(db: Session, target_id: int, user_ids) -> set[int]:
+    """批量查询：在 user_ids 中，哪些用户拉黑了 target_id
+
+    只需读取 target_id 的「拉黑我的」集合，与 user_ids 求交集，无论 N 多大都不查 DB。
+    """
+    if not user_ids:
+        return set()
+    _, incoming = get_block_cache().get_sync(db, target_id)
+    return set(incoming.intersection(user_ids))
+
+
+async def get_users_who_blocked_async(db: Session, target_id: int, user_ids) -> set[int]:
+    """get_users_who_blocked 的异步版本（可命中 Redis）"""
+    if not user_ids:
+        return set()
+    _, incoming = await get_block_cache().get(db, target_id)
+    return set(incoming.intersection(user_ids))
+
+
+def is_blocked_between(db: Session, user_a: int, user_b: int) -> bool:
+    """两个用户之间是否存在任一方向的拉黑关系"""
+    outgoing, incoming = get_block_cache().get_sync(db, user_a)
+    return user_b in outgoing or user_b in incoming
+
+
+def exclude_blocked_authors(author_column, user_id: int, blocked_user_ids: set, threshold: int = None):
+    """构造「排除拉黑用户」的过滤条件，无需过滤时返回 None
+
+    - 拉黑人数不超过 BLOCK_FILTER_ANTIJOIN_THRESHOLD：NOT IN 字面量列表（小集合最快）
+    - 超过阈值：对 block_list 的双向 NOT EXISTS 反连接，走两个联合索引，
+      SQL 文本固定，不会随拉黑人数膨胀，也不破坏执行计划缓存
+
+    threshold 仅供基准测试脚本覆盖配置值。
+    """
+    if not blocked_user_ids:
+        return None
+    if threshold is None:
+        threshold = get_settings().BLOCK_FILTER_ANTIJOIN_THRESHOLD
+    if len(blocked_user_ids) <= threshold:
+        return ~author_column.in_(blocked_user_ids)
+    blocked_by_me = exists().where(
+        BlockList.user_id == user_id, BlockList.blocked_user_id == author_column
     )
-    ids = {row[0] for row in blocked_rows}
-    
-    # 写入 Redis 缓存
-    if r and ids:
-        try:
-            key = f"blocks:{user_id}"
-            pipe = r.pipeline()
-            await pipe.delete(key)
-            await pipe.sadd(key, *[str(uid) for uid in ids])
-            await pipe.expire(key, 60)
-            await pipe.execute()
-        except Exception:
-            pass
-    
-    return ids
+    blocked_me = exists().where(
+        BlockList.blocked_user_id == user_id, BlockList.user_id == author_column
+    )
+    return and_(~blocked_by_me, ~blocked_me)
 
 
-async def invalidate_block_cache(user_id: int, target_id: int):
-    """拉黑/取消拉黑时失效双方缓存"""
-    r = get_redis()
-    if r:
-        try:
-            await r.delete(f"blocks:{user_id}", f"blocks:{target_id}")
-        except Exception:
-            pass
+async def invalidate_block_cache(user_id: int, target_id: int = None):
+    """拉黑/取消拉黑时失效双方缓存（广播到所有实例）"""
+    await get_block_cache().ainvalidate(user_id, target_id)
 
 
 @router.get("", response_model=BlockListResponse)
@@ -4,17 +4,20 @@ from datetime import datetime
 from typing import Optional
 
 from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, status
-from sqlalchemy import and_, case, func, or_
+from sqlalchemy import and_, bindparam, case, func, or_, select, tuple_, update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, joinedload
 
 from ..auth import get_current_user
-from ..database import get_db
-from ..models import BlockList, DMConversation, DMMessage, DMRead, Follow, User
+from ..database import dialect_insert, get_db
+from ..models import DMConversation, DMMessage, DMRead, DMUnreadTotal, Follow, User
 from ..notifier import get_pusher
 from ..rate_limit import limiter
 from ..redis_client import get_redis
 from ..schemas import (
+    DMBulkMessageCreateRequest,
+    DMBulkSendResponse,
+    DMBulkSendResult,
     DMConversationResponse,
     DMMessageCreateRequest,
     DMMessageResponse,
@@ -23,6 +26,7 @@ from ..schemas import (
     PaginatedResponse,
     UserPublicResponse,
 )
+from .blocks import get_blocked_user_ids, is_blocked_between
 
 router = APIRouter(prefix="/dm", tags=["dm"])
 logger = logging.getLogger(__name__)
@@ -31,30 +35,26 @@ logger = logging.getLogger(__name__)
 DM_CONVERSATION_LIST_CACHE_TTL = 15  # 会话列表缓存（秒）
 DM_UNREAD_COUNT_CACHE_TTL = 10       # 未读数缓存（秒）
 DM_USER_INFO_CACHE_TTL = 300         # 用户信息缓存（5分钟）
+# 缓存代数键的存活时间，必须远大于会话列表缓存TTL：代数过期归零时旧代数的列表缓存早已过期
+DM_CACHE_GENERATION_TTL = 86400
 
 
-def _dm_conversation_cache_key(user_id: int, page: int, page_size: int) -> str:
-    return f"dm:conv:list:{user_id}:{page}:{page_size}"
+def _dm_generation_key(user_id: int) -> str:
+    return f"dm:gen:{user_id}"
 
 
-def _dm_conversation_cache_pattern(user_id: int) -> str:
-    return f"dm:conv:list:{user_id}:*"
+def _dm_conversation_cache_key(user_id: int, generation: int, page: int, page_size: int) -> str:
+    return f"dm:conv:list:{user_id}:g{generation}:{page}:{page_size}"
 
 
 def _dm_unread_cache_key(user_id: int) -> str:
     return f"dm:unread:{user_id}"
 
 
-async def _collect_keys_by_pattern(r, pattern: str) -> list[str]:
-    cursor = 0
-    keys: list[str] = []
-    while True:
-        cursor, batch = await r.scan(cursor=cursor, match=pattern, count=200)
-        if batch:
-            keys.extend(batch)
-        if int(cursor) == 0:
-            break
-    return keys
+async def _get_dm_cache_generation(r, user_id: int) -> int:
+    """用户会话列表缓存的当前代数（键不存在视为 0）"""
+    value = await r.get(_dm_generation_key(user_id))
+    return int(value) if value else 0
 
 
 async def _invalidate_dm_cache_for_users(
@@ -71,19 +71,16 @@ async def _invalidate_dm_cache_for_users(
         return
 
     try:
-        keys: set[str] = set()
-        if invalidate_unread:
-            for user_id in user_ids:
-                keys.add(_dm_unread_cache_key(user_id))
-
+        # 会话列表缓存键带代数：INCR 代数即让该用户所有分页缓存失效，旧键等TTL自然过期
+        pipe = r.pipeline(transaction=False)
         if invalidate_conversations:
             for user_id in user_ids:
-                pattern = _dm_conversation_cache_pattern(user_id)
-                for key in await _collect_keys_by_pattern(r, pattern):
-                    keys.add(key)
-
-        if keys:
-            await r.delete(*list(keys))
+                generation_key = _dm_generation_key(user_id)
+                pipe.incr(generation_key)
+                pipe.expire(generation_key, DM_CACHE_GENERATION_TTL)
+        if invalidate_unread:
+            pipe.delete(*[_dm_unread_cache_key(user_id) for user_id in user_ids])
+        await pipe.execute()
     except Exception as error:
         logger.warning(f"[DM] Redis cache invalidation failed: {error}")
 
@@ -101,17 +98,7 @@ def _is_member(conv: DMConversation, user_id: int) -> bool:
 
 
 def _is_blocked_between(db: Session, user_a: int, user_b: int) -> bool:
-    blocked = (
-        db.query(BlockList.id)
-        .filter(
-            or_(
-                and_(BlockList.user_id == user_a, BlockList.blocked_user_id == user_b),
-                and_(BlockList.user_id == user_b, BlockList.blocked_user_id == user_a),
-            )
-        )
-        .first()
-    )
-    return blocked is not None
+    return is_blocked_between(db, user_a, user_b)
 
 
 def _to_public_user(user: User) -> UserPublicResponse:
@@ -209,6 +196,96 @@ def _resolve_conversation_by_target(
     return conversation, created_new
 
 
+def _lock_read_row(db: Session, conversation_id: int, user_id: int) -> Optional[DMRead]:
+    """读取已读游标行（非 SQLite 时加行锁，保证 unread_count 的读改写不丢失更新）"""
+    query = db.query(DMRead).filter(
+        DMRead.conversation_id == conversation_id,
+        DMRead.user_id == user_id,
+    )
+    if db.bind and db.bind.dialect.name != "sqlite":
+        query = query.with_for_update()
+    return query.first()
+
+
+def _adjust_unread_total(
+    db: Session,
+    user_id: int,
+    *,
+    unread_delta: int,
+    conversations_delta: int,
+) -> None:
+    """增量调整用户的私聊未读汇总（原子 UPDATE，汇总行不存在时创建）"""
+    if not unread_delta and not conversations_delta:
+        return
+
+    def _clamped(column, delta: int):
+        return case((column + delta < 0, 0), else_=column + delta)
+
+    values = {
+        DMUnreadTotal.unread_count: _clamped(DMUnreadTotal.unread_count, unread_delta),
+        DMUnreadTotal.conversations_with_unread: _clamped(
+            DMUnreadTotal.conversations_with_unread, conversations_delta
+        ),
+    }
+    updated = (
+        db.query(DMUnreadTotal)
+        .filter(DMUnreadTotal.user_id == user_id)
+        .update(values, synchronize_session=False)
+    )
+    if updated:
+        return
+
+    try:
+        with db.begin_nested():
+            db.add(
+                DMUnreadTotal(
+                    user_id=user_id,
+                    unread_count=max(0, unread_delta),
+                    conversations_with_unread=max(0, conversations_delta),
+                )
+            )
+    except IntegrityError:
+        # 并发创建：另一个事务已插入汇总行，改为增量更新
+        db.query(DMUnreadTotal).filter(DMUnreadTotal.user_id == user_id).update(
+            values, synchronize_session=False
+        )
+
+
+def _set_read_unread(db: Session, read_row: DMRead, unread_count: int) -> None:
+    """把会话未读数改为 unread_count，并同步调整用户汇总"""
+    previous = int(read_row.unread_count or 0)
+    unread_count = max(0, unread_count)
+    if previous == unread_count:
+        return
+    read_row.unread_count = unread_count
+    _adjust_unread_total(
+        db,
+        read_row.user_id,
+        unread_delta=unread_count - previous,
+        conversations_delta=int(unread_count > 0) - int(previous > 0),
+    )
+
+
+def _count_unread_after(
+    db: Session,
+    *,
+    conversation_id: int,
+    user_id: int,
+    after_message_id: int,
+) -> int:
+    """游标之后对方发来的消息数（只扫描游标之后的索引区间）"""
+    return int(
+        db.query(func.count(DMMessage.id))
+        .filter(
+            DMMessage.conversation_id == conversation_id,
+            DMMessage.id > after_message_id,
+            DMMessage.sender_id != user_id,
+        )
+        .scalar()
+        or 0
+    )
+
+
 def _mark_read_cursor(
     db: Session,
     *,
@@ -217,25 +294,28 @@ def _mark_read_cursor(
     target_message_id: int,
 ) -> tuple[int, bool]:
     target_message_id = max(0, int(target_message_id or 0))
-    read_row = (
-        db.query(DMRead)
-        .filter(
-            DMRead.conversation_id == conversation_id,
-            DMRead.user_id == user_id,
-        )
-        .first()
-    )
+    read_row = _lock_read_row(db, conversation_id, user_id)
 
     if not read_row:
         if target_message_id <= 0:
             return 0, False
-        db.add(
-            DMRead(
+        read_row = DMRead(
+            conversation_id=conversation_id,
+            user_id=user_id,
+            last_read_message_id=target_message_id,
+            last_read_at=datetime.utcnow(),
+            unread_count=0,
+        )
+        db.add(read_row)
+        _set_read_unread(
+            db,
+            read_row,
+            _count_unread_after(
+                db,
                 conversation_id=conversation_id,
                 user_id=user_id,
-                last_read_message_id=target_message_id,
-                last_read_at=datetime.utcnow(),
-            )
+                after_message_id=target_message_id,
+            ),
         )
         return target_message_id, True
 
@@ -243,6 +323,16 @@ def _mark_read_cursor(
     if target_message_id > previous_read_id:
         read_row.last_read_message_id = target_message_id
         read_row.last_read_at = datetime.utcnow()
+        # 已读到最新时直接归零；只读到中间某条时，重新数游标之后的剩余未读
+        remaining = 0
+        if read_row.unread_count:
+            remaining = _count_unread_after(
+                db,
+                conversation_id=conversation_id,
+                user_id=user_id,
+                after_message_id=target_message_id,
+            )
+        _set_read_unread(db, read_row, remaining)
         return target_message_id, True
 
     return previous_read_id, False
@@ -310,45 +400,17 @@ def _serialize_conversations(
         if following_id == current_user_id:
             follower_ids.add(follower_id)
 
-    # 简化BlockList查询
-    blocked_rows = (
-        db.query(BlockList.user_id, BlockList.blocked_user_id)
-        .filter(
-            or_(
-                and_(BlockList.user_id == current_user_id, BlockList.blocked_user_id.in_(peer_ids)),
-                and_(BlockList.blocked_user_id == current_user_id, BlockList.user_id.in_(peer_ids)),
-            )
-        )
-        .all()
-    )
-    blocked_peer_ids = {
-        blocked_id if user_id == current_user_id else user_id
-        for user_id, blocked_id in blocked_rows
-    }
+    # 双向拉黑关系走缓存
+    blocked_peer_ids = get_blocked_user_ids(db, current_user_id).intersection(peer_ids)
 
-    read_subquery = (
-        db.query(
-            DMRead.conversation_id.label("conversation_id"),
-            DMRead.last_read_message_id.label("last_read_message_id"),
-        )
-        .filter(DMRead.user_id == current_user_id, DMRead.conversation_id.in_(conv_ids))
-        .subquery()
-    )
+    # 未读数由 DMRead.unread_count 维护，按主键读取，不扫描消息表
     unread_rows = (
-        db.query(
-            DMMessage.conversation_id,
-            func.count(DMMessage.id).label("unread_count"),
-        )
-        .outerjoin(
-            read_subquery,
-            read_subquery.c.conversation_id == DMMessage.conversation_id,
-        )
+        db.query(DMRead.conversation_id, DMRead.unread_count)
         .filter(
-            DMMessage.conversation_id.in_(conv_ids),
-            DMMessage.sender_id != current_user_id,
-            DMMessage.id > func.coalesce(read_subquery.c.last_read_message_id, 0),
+            DMRead.user_id == current_user_id,
+            DMRead.conversation_id.in_(conv_ids),
+            DMRead.unread_count > 0,
         )
-        .group_by(DMMessage.conversation_id)
         .all()
     )
     unread_map = {row[0]: int(row[1]) for row in unread_rows}
@@ -490,9 +552,11 @@ async def list_conversations(
     current_user: User = Depends(get_current_user),
 ):
     r = get_redis()
-    cache_key = _dm_conversation_cache_key(current_user.id, page, page_size)
+    cache_key = None
     if r:
         try:
+            generation = await _get_dm_cache_generation(r, current_user.id)
+            cache_key = _dm_conversation_cache_key(current_user.id, generation, page, page_size)
             cached = await r.get(cache_key)
             if cached:
                 return json.loads(cached)
@@ -532,7 +596,7 @@ async def list_conversations(
         page_size=page_size,
         total_pages=total_pages,
     )
-    if r:
+    if r and cache_key:
         try:
             payload = json.dumps(response.model_dump(mode="json"), ensure_ascii=False)
             await r.setex(cache_key, DM_CONVERSATION_LIST_CACHE_TTL, payload)
@@ -573,139 +637,363 @@ async def list_messages_by_target(
     return _serialize_messages(messages, current_user.id)
 
 
-async def _send_message_in_conversation(
+def _resolve_conversations_bulk(
+    db: Session,
     *,
+    current_user_id: int,
+    peer_ids: list[int],
+) -> dict[int, DMConversation]:
+    """批量获取（必要时创建）与多个用户的会话，返回 {peer_id: 会话}
+
+    已有会话一次查询取回；缺失的用 INSERT ... ON CONFLICT DO NOTHING 批量创建后再取回。
+    非 SQLite 时按 ID 顺序加行锁，与单条发送一样串行化同一会话的写入。
+    """
+    if not peer_ids:
+        return {}
+
+    pair_to_peer = {_normalize_pair(current_user_id, peer_id): peer_id for peer_id in peer_ids}
+
+    def _load(pairs) -> list[DMConversation]:
+        query = (
+            db.query(DMConversation)
+            .filter(tuple_(DMConversation.user_low_id, DMConversation.user_high_id).in_(list(pairs)))
+            .order_by(DMConversation.id)
+        )
+        if db.bind.dialect.name != "sqlite":
+            query = query.with_for_update()
+        return query.all()
+
+    conversations = _load(pair_to_peer.keys())
+    missing = set(pair_to_peer) - {(c.user_low_id, c.user_high_id) for c in conversations}
+    if missing:
+        stmt = dialect_insert(db, DMConversation.__table__).values(
+            [
+                {
+                    "user_low_id": low,
+                    "user_high_id": high,
+                    "created_by_id": current_user_id,
+                    "message_count": 0,
+                }
+                for low, high in sorted(missing)
+            ]
+        )
+        # 并发创建同一会话时以唯一索引为准
+        db.execute(stmt.on_conflict_do_nothing(index_elements=["user_low_id", "user_high_id"]))
+        conversations.extend(_load(missing))
+
+    return {pair_to_peer[(c.user_low_id, c.user_high_id)]: c for c in conversations}
+
+
+def _lock_unread_totals(db: Session, user_ids) -> None:
+    """按 user_id 升序一次性锁住这些用户的未读汇总行
+
+    发送方扣减与接收方累加都会改写汇总行；各请求都按同一顺序加锁，
+    目标有重叠的并发发送（单发或群发）不会互相等待成环（PostgreSQL 死锁）。
+    """
+    if db.bind.dialect.name == "sqlite":
+        return  # SQLite 写事务本身串行
+    db.execute(
+        select(DMUnreadTotal.__table__.c.user_id)
+        .where(DMUnreadTotal.__table__.c.user_id.in_(sorted(set(user_ids))))
+        .order_by(DMUnreadTotal.__table__.c.user_id)
+        .with_for_update()
+    ).all()
+
+
+def _release_unread_total(db: Session, user_id: int, conversation_ids: list[int]) -> None:
+    """从用户未读汇总中扣除这些会话当前的未读（调用方随后把这些会话的 unread_count 置 0）"""
+    reads = DMRead.__table__
+    totals = DMUnreadTotal.__table__
+    scope = and_(reads.c.user_id == user_id, reads.c.conversation_id.in_(conversation_ids))
+    unread_sum = (
+        select(func.coalesce(func.sum(reads.c.unread_count), 0)).where(scope).scalar_subquery()
+    )
+    unread_conversations = (
+        select(func.count()).select_from(reads).where(scope, reads.c.unread_count > 0).scalar_subquery()
+    )
+    db.execute(
+        update(totals)
+        .where(totals.c.user_id == user_id)
+        .values(
+            unread_count=case(
+                (totals.c.unread_count - unread_sum < 0, 0),
+                else_=totals.c.unread_count - unread_sum,
+            ),
+            conversations_with_unread=case(
+                (totals.c.conversations_with_unread - unread_conversations < 0, 0),
+                else_=totals.c.conversations_with_unread - unread_conversations,
+            ),
+        )
+    )
+
+
+def _store_messages(
     db: Session,
-    current_user: User,
-    conversation: DMConversation,
+    *,
+    sender_id: int,
+    targets: list[tuple[DMConversation, int]],
     content: str,
     client_msg_id: Optional[str],
-) -> DMMessageResponse:
-    conversation_id = int(conversation.id)
-    peer_id = _conversation_peer_id(conversation, current_user.id)
-
-    if _is_blocked_between(db, current_user.id, peer_id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="cannot send DM due to block relationship",
-        )
+) -> list[dict]:
+    """在多个会话中各写入一条消息并提交，返回每个会话的消息（created=False 表示命中 client_msg_id 去重）
+
+    每批固定几条语句，与会话数无关：
+    1. INSERT 消息 ON CONFLICT DO NOTHING RETURNING（去重交给唯一索引，不再先查）
+    2. UPDATE 会话摘要（executemany）
+    3. 仅当对方是上一条消息的发送者时：从发送方未读汇总中扣除这些会话的未读
+    4. UPSERT 双方已读游标：发送方游标推进到新消息并清零未读，接收方未读 +1（RETURNING 新未读数）
+    5. UPSERT 接收方未读汇总
+
+    3 之前按 user_id 升序锁住发送方和接收方的未读汇总行；各条写入都按主键排序，避免并发发送死锁。
+    """
+    if not targets:
+        return []
 
-    if client_msg_id:
-        dedup_message = (
-            db.query(DMMessage)
-            .options(joinedload(DMMessage.sender))
-            .filter(
-                DMMessage.conversation_id == conversation_id,
-                DMMessage.sender_id == current_user.id,
-                DMMessage.client_msg_id == client_msg_id,
-            )
-            .first()
-        )
-        if dedup_message:
-            return _serialize_messages([dedup_message], current_user.id)[0]
+    # _resolve_conversation_by_target 新建会话时加入的 DMRead 先落库，避免与下面的 upsert 冲突
+    db.flush()
 
     now = datetime.utcnow()
-    message = DMMessage(
-        conversation_id=conversation_id,
-        sender_id=current_user.id,
-        content=content,
-        client_msg_id=client_msg_id,
-        created_at=now,
+    peer_by_conv = {int(conv.id): peer_id for conv, peer_id in targets}
+    # 对方发了上一条消息的会话，发送方此前可能有未读（自己连续发送时必然为 0）
+    reply_conv_ids = [
+        int(conv.id) for conv, _ in targets if conv.last_message_sender_id != sender_id
+    ]
+
+    messages = DMMessage.__table__
+    stmt = dialect_insert(db, messages).values(
+        [
+            {
+                "conversation_id": conv_id,
+                "sender_id": sender_id,
+                "content": content,
+                "client_msg_id": client_msg_id,
+                "created_at": now,
+            }
+            for conv_id in peer_by_conv
+        ]
     )
-    db.add(message)
-    db.flush()
+    if client_msg_id:
+        conflict_where = {}
+        if db.bind.dialect.name == "postgresql":
+            conflict_where["index_where"] = messages.c.client_msg_id.isnot(None)
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=["conversation_id", "sender_id", "client_msg_id"],
+            **conflict_where,
+        )
+    inserted = {
+        row.conversation_id: row
+        for row in db.execute(
+            stmt.returning(messages.c.id, messages.c.conversation_id, messages.c.created_at)
+        )
+    }
 
-    conversation.message_count = int(conversation.message_count or 0) + 1
-    conversation.last_message_id = message.id
-    conversation.last_message_sender_id = current_user.id
-    conversation.last_message_preview = _trim_preview(content)
-    conversation.last_message_at = now
+    results = [
+        {
+            "id": row.id,
+            "conversation_id": conv_id,
+            "peer_id": peer_by_conv[conv_id],
+            "content": content,
+            "client_msg_id": client_msg_id,
+            "created_at": row.created_at,
+            "created": True,
+        }
+        for conv_id, row in inserted.items()
+    ]
+
+    duplicated = [conv_id for conv_id in peer_by_conv if conv_id not in inserted]
+    if duplicated:
+        for row in db.query(
+            DMMessage.id, DMMessage.conversation_id, DMMessage.content, DMMessage.created_at
+        ).filter(
+            DMMessage.conversation_id.in_(duplicated),
+            DMMessage.sender_id == sender_id,
+            DMMessage.client_msg_id == client_msg_id,
+        ):
+            results.append(
+                {
+                    "id": row.id,
+                    "conversation_id": row.conversation_id,
+                    "peer_id": peer_by_conv[row.conversation_id],
+                    "content": row.content,
+                    "client_msg_id": client_msg_id,
+                    "created_at": row.created_at,
+                    "created": False,
+                }
+            )
 
-    sender_read = (
-        db.query(DMRead)
-        .filter(
-            DMRead.conversation_id == conversation_id,
-            DMRead.user_id == current_user.id,
-        )
-        .first()
+    if not inserted:
+        db.commit()
+        return results
+
+    # 会话、已读游标、未读汇总都按主键升序写入，行锁顺序与客户端给出的目标顺序无关
+    inserted = dict(sorted(inserted.items()))
+    conversations = DMConversation.__table__
+    db.execute(
+        update(conversations)
+        .where(conversations.c.id == bindparam("b_conversation_id"))
+        .values(
+            message_count=conversations.c.message_count + 1,
+            last_message_id=bindparam("b_message_id"),
+            last_message_sender_id=sender_id,
+            last_message_preview=_trim_preview(content),
+            last_message_at=now,
+        ),
+        [{"b_conversation_id": conv_id, "b_message_id": row.id} for conv_id, row in inserted.items()],
     )
-    if not sender_read:
-        db.add(
-            DMRead(
-                conversation_id=conversation_id,
-                user_id=current_user.id,
-                last_read_message_id=message.id,
-                last_read_at=now,
-            )
-        )
-    else:
-        if message.id > int(sender_read.last_read_message_id or 0):
-            sender_read.last_read_message_id = message.id
-        sender_read.last_read_at = now
 
-    peer_read = (
-        db.query(DMRead)
-        .filter(
-            DMRead.conversation_id == conversation_id,
-            DMRead.user_id == peer_id,
+    reply_conv_ids = [conv_id for conv_id in reply_conv_ids if conv_id in inserted]
+    peer_ids = {peer_by_conv[conv_id] for conv_id in inserted}
+    _lock_unread_totals(db, peer_ids | ({sender_id} if reply_conv_ids else set()))
+    if reply_conv_ids:
+        _release_unread_total(db, sender_id, reply_conv_ids)
+
+    reads = DMRead.__table__
+    read_rows = []
+    for conv_id, row in inserted.items():
+        read_rows.append(
+            {
+                "conversation_id": conv_id,
+                "user_id": sender_id,
+                "last_read_message_id": row.id,
+                "last_read_at": now,
+                "unread_count": 0,
+            }
         )
-        .first()
+        read_rows.append(
+            {
+                "conversation_id": conv_id,
+                "user_id": peer_by_conv[conv_id],
+                "last_read_message_id": 0,
+                "last_read_at": None,
+                "unread_count": 1,
+            }
+        )
+    read_rows.sort(key=lambda r: (r["conversation_id"], r["user_id"]))
+    stmt = dialect_insert(db, reads).values(read_rows)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["conversation_id", "user_id"],
+        set_={
+            # 发送方行：游标推进、未读清零；接收方行：游标不动、未读 +1
+            "last_read_message_id": case(
+                (excluded.last_read_message_id > reads.c.last_read_message_id, excluded.last_read_message_id),
+                else_=reads.c.last_read_message_id,
+            ),
+            "last_read_at": func.coalesce(excluded.last_read_at, reads.c.last_read_at),
+            "unread_count": case(
+                (excluded.unread_count > 0, reads.c.unread_count + excluded.unread_count),
+                else_=0,
+            ),
+        },
     )
-    if not peer_read:
-        db.add(
-            DMRead(
-                conversation_id=conversation_id,
-                user_id=peer_id,
-                last_read_message_id=0,
-            )
+    peer_unread: dict[int, list[int]] = {}
+    for row in db.execute(stmt.returning(reads.c.user_id, reads.c.unread_count)):
+        if row.user_id == sender_id:
+            continue
+        counters = peer_unread.setdefault(row.user_id, [0, 0])
+        counters[0] += 1
+        counters[1] += int(row.unread_count == 1)  # 会话从无未读变为有未读
+
+    if peer_unread:
+        totals = DMUnreadTotal.__table__
+        stmt = dialect_insert(db, totals).values(
+            [
+                {"user_id": user_id, "unread_count": unread, "conversations_with_unread": conversations_delta}
+                for user_id, (unread, conversations_delta) in sorted(peer_unread.items())
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={
+                "unread_count": totals.c.unread_count + stmt.excluded.unread_count,
+                "conversations_with_unread": (
+                    totals.c.conversations_with_unread + stmt.excluded.conversations_with_unread
+                ),
+                "updated_at": func.now(),
+            },
         )
+        db.execute(stmt)
 
     db.commit()
-    db.refresh(message)
-    db.refresh(current_user)
-    await _invalidate_dm_cache_for_users({current_user.id, peer_id})
-
-    base_message = {
-        "id": message.id,
-        "conversation_id": conversation_id,
-        "sender_id": current_user.id,
-        "sender_username": current_user.username,
-        "sender_nickname": current_user.nickname,
-        "content": message.content,
-        "client_msg_id": message.client_msg_id,
-        "created_at": message.created_at.isoformat(),
-    }
-    now_iso = datetime.utcnow().isoformat()
-    pusher = get_pusher()
-
-    # 给接收方推送：is_mine=False
-    peer_payload = {
-        "type": "dm_new_message",
-        "conversation_id": conversation_id,
-        "message": {**base_message, "is_mine": False},
-        "timestamp": now_iso,
-    }
-    await pusher.send_to_user(peer_id, peer_payload)
+    return results
+
+
+def _sent_message_response(sender: User, sent: dict) -> DMMessageResponse:
+    return DMMessageResponse(
+        id=sent["id"],
+        conversation_id=sent["conversation_id"],
+        sender=_to_public_user(sender),
+        content=sent["content"],
+        client_msg_id=sent["client_msg_id"],
+        is_mine=True,
+        created_at=sent["created_at"],
+    )
 
-    # 给发送方推送：is_mine=True（多端同步）
-    if peer_id != current_user.id:
-        sender_payload = {
+
+async def _dispatch_sent_messages(sender: User, sent: list[dict]) -> None:
+    """新消息写入后：一次失效双方缓存，并把双方的推送合并为一批发出"""
+    created = [item for item in sent if item["created"]]
+    if not created:
+        return
+
+    await _invalidate_dm_cache_for_users({sender.id} | {item["peer_id"] for item in created})
+
+    now_iso = datetime.utcnow().isoformat()
+    pushes: list[tuple[int, dict]] = []
+    for item in created:
+        created_at = item["created_at"]
+        base_message = {
+            "id": item["id"],
+            "conversation_id": item["conversation_id"],
+            "sender_id": sender.id,
+            "sender_username": sender.username,
+            "sender_nickname": sender.nickname,
+            "content": item["content"],
+            "client_msg_id": item["client_msg_id"],
+            "created_at": created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+        }
+        # 给接收方推送：is_mine=False
+        pushes.append((item["peer_id"], {
             "type": "dm_new_message",
-            "conversation_id": conversation_id,
+            "conversation_id": item["conversation_id"],
+            "message": {**base_message, "is_mine": False},
+            "timestamp": now_iso,
+        }))
+        # 给发送方推送：is_mine=True（多端同步）
+        pushes.append((sender.id, {
+            "type": "dm_new_message",
+            "conversation_id": item["conversation_id"],
             "message": {**base_message, "is_mine": True},
             "timestamp": now_iso,
-        }
-        await pusher.send_to_user(current_user.id, sender_payload)
+        }))
+    await get_pusher().send_to_users(pushes)
 
-    return DMMessageResponse(
-        id=message.id,
-        conversation_id=message.conversation_id,
-        sender=_to_public_user(current_user),
-        content=message.content,
-        client_msg_id=message.client_msg_id,
-        is_mine=True,
-        created_at=message.created_at,
+
+async def _send_message_in_conversation(
+    *,
+    db: Session,
+    current_user: User,
+    conversation: DMConversation,
+    content: str,
+    client_msg_id: Optional[str],
+) -> DMMessageResponse:
+    peer_id = _conversation_peer_id(conversation, current_user.id)
+
+    if _is_blocked_between(db, current_user.id, peer_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="cannot send DM due to block relationship",
+        )
+
+    sent = _store_messages(
+        db,
+        sender_id=current_user.id,
+        targets=[(conversation, peer_id)],
+        content=content,
+        client_msg_id=client_msg_id,
     )
+    await _dispatch_sent_messages(current_user, sent)
+    return _sent_message_response(current_user, sent[0])
 
 
 @router.post("/messages", response_model=DMMessageResponse)
@@ -746,6 +1034,68 @@ async def send_message_by_target(
     )
 
 
+@router.post("/messages/bulk", response_model=DMBulkSendResponse)
+@limiter.limit("5/minute")
+async def send_bulk_messages(
+    request: Request,
+    data: DMBulkMessageCreateRequest = Body(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """同一内容发给多个用户：会话、消息、已读游标与未读计数均批量写入，推送合并为一批"""
+    content = data.content.strip()
+    if not content:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="message content cannot be empty",
+        )
+
+    target_ids = list(dict.fromkeys(data.target_user_ids))
+    existing_ids = {row[0] for row in db.query(User.id).filter(User.id.in_(target_ids))}
+    blocked_ids = get_blocked_user_ids(db, current_user.id)
+
+    errors: dict[int, str] = {}
+    peer_ids: list[int] = []
+    for target_id in target_ids:
+        if target_id == current_user.id:
+            errors[target_id] = "cannot start DM with yourself"
+        elif target_id not in existing_ids:
+            errors[target_id] = "target user not found"
+        elif target_id in blocked_ids:
+            errors[target_id] = "cannot DM due to block relationship"
+        else:
+            peer_ids.append(target_id)
+
+    conversations = _resolve_conversations_bulk(
+        db,
+        current_user_id=current_user.id,
+        peer_ids=peer_ids,
+    )
+    sent = _store_messages(
+        db,
+        sender_id=current_user.id,
+        targets=[(conversations[peer_id], peer_id) for peer_id in peer_ids],
+        content=content,
+        client_msg_id=data.client_msg_id,
+    )
+    await _dispatch_sent_messages(current_user, sent)
+
+    sent_by_peer = {item["peer_id"]: item for item in sent}
+    items = [
+        DMBulkSendResult(
+            target_user_id=target_id,
+            message=(
+                _sent_message_response(current_user, sent_by_peer[target_id])
+                if target_id in sent_by_peer
+                else None
+            ),
+            error=errors.get(target_id),
+        )
+        for target_id in target_ids
+    ]
+    return DMBulkSendResponse(items=items, sent=len(sent_by_peer))
+
+
 @router.post("/read")
 async def mark_read_by_target(
     target_user_id: int = Query(..., ge=1),
@@ -789,43 +1139,16 @@ async def get_dm_unread_count(
         except Exception:
             pass
 
-    read_subquery = (
-        db.query(
-            DMRead.conversation_id.label("conversation_id"),
-            DMRead.last_read_message_id.label("last_read_message_id"),
-        )
-        .filter(DMRead.user_id == current_user.id)
-        .subquery()
-    )
-
-    unread_rows = (
-        db.query(
-            DMMessage.conversation_id,
-            func.count(DMMessage.id).label("unread_count"),
-        )
-        .join(DMConversation, DMConversation.id == DMMessage.conversation_id)
-        .outerjoin(
-            read_subquery,
-            read_subquery.c.conversation_id == DMMessage.conversation_id,
-        )
-        .filter(
-            or_(
-                DMConversation.user_low_id == current_user.id,
-                DMConversation.user_high_id == current_user.id,
-            ),
-            DMMessage.sender_id != current_user.id,
-            DMMessage.id > func.coalesce(read_subquery.c.last_read_message_id, 0),
-        )
-        .group_by(DMMessage.conversation_id)
-        .all()
+    # 汇总行随发消息/标记已读增量维护，单行主键查询
+    totals = (
+        db.query(DMUnreadTotal.unread_count, DMUnreadTotal.conversations_with_unread)
+        .filter(DMUnreadTotal.user_id == current_user.id)
+        .first()
     )
 
-    unread_total = sum(int(row[1]) for row in unread_rows)
-    conversations_with_unread = len(unread_rows)
-
     response = DMUnreadCountResponse(
-        unread=unread_total,
-        conversations_with_unread=conversations_with_unread,
+        unread=int(totals[0]) if totals else 0,
+        conversations_with_unread=int(totals[1]) if totals else 0,
     )
     if r:
         try:
@@ -218,8 +218,7 @@ async def upload_to_imagebed(
     
     # 调用图床 API 上传
     try:
-        from ..moderation import get_http_client
-        client = get_http_client(timeout_override=60.0)
+        from ..http_client import request as outbound_request
         if True:
             # 准备上传请求
             upload_url = f"{settings.IMGBED_API_URL.rstrip('/')}/upload"
@@ -233,7 +232,9 @@ async def upload_to_imagebed(
                 "returnFormat": "full"  # 返回完整链接
             }
             
-            response = await client.post(
+            response = await outbound_request(
+                "imagebed",
+                "POST",
                 upload_url,
                 headers=headers,
                 files=files,
@@ -341,14 +342,13 @@ async def delete_image(
                     file_path = url.split('/')[-1]
             
             # 调用图床删除 API
-            from ..moderation import get_http_client
-            client = get_http_client()
+            from ..http_client import request as outbound_request
             if True:
                 delete_url = f"{base_url}/api/manage/delete/{file_path}"
                 headers = {
                     "Authorization": f"Bearer {settings.IMGBED_API_TOKEN}"
                 }
-                response = await client.get(delete_url, headers=headers)
+                response = await outbound_request("imagebed", "GET", delete_url, headers=headers)
                 
                 if response.status_code == 200:
                     result = response.json()
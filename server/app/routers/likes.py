@@ -7,7 +7,7 @@ from ..schemas import LikeResponse
 from ..auth import get_current_user
 from ..level_service import add_exp_for_being_liked
 from ..rate_limit import limiter
-from ..redis_client import get_redis
+from ..like_index import record_like
 
 import logging
 
@@ -25,7 +25,7 @@ def _create_like_notification(
     thread_title: str = None,
     from_username: str = None
 ):
-    """创建点赞通知（不通知自己）"""
+    """创建点赞通知（不通知自己；窗口内同一帖子/回复的点赞合并为一条，推送防抖）"""
     if to_user_id == from_user_id:
         return
     
@@ -114,17 +114,8 @@ def like_thread(
     
     db.commit()
     
-    # 更新 Redis 缓存
-    r = get_redis()
-    if r:
-        from ..redis_client import fire_and_forget
-        async def _update_cache():
-            try:
-                await r.sadd(f"likes:user:{current_user.id}:threads", str(thread_id))
-                await r.expire(f"likes:user:{current_user.id}:threads", 300)
-            except Exception:
-                pass
-        fire_and_forget(_update_cache())
+    # 增量维护点赞索引
+    record_like(current_user.id, "thread", thread_id)
     
     return LikeResponse(liked=True, like_count=new_like_count)
 
@@ -197,101 +188,14 @@ def like_reply(
     
     db.commit()
     
-    # 更新 Redis 缓存
-    r = get_redis()
-    if r:
-        from ..redis_client import fire_and_forget
-        async def _update_cache():
-            try:
-                await r.sadd(f"likes:user:{current_user.id}:replies", str(reply_id))
-                await r.expire(f"likes:user:{current_user.id}:replies", 300)
-            except Exception:
-                pass
-        fire_and_forget(_update_cache())
+    # 增量维护点赞索引
+    record_like(current_user.id, "reply", reply_id)
     
     return LikeResponse(liked=True, like_count=new_like_count)
 
 
 # ==================== 辅助函数 ====================
 
-def get_user_liked_thread_ids(db: Session, user_id: int, thread_ids: list) -> set:
-    """获取用户已点赞的帖子 ID 集合（优先 Redis，降级 DB）"""
-    if not thread_ids:
-        return set()
-    
-    r = get_redis()
-    if r:
-        try:
-            import asyncio
-            # 同步上下文中无法直接 await，使用 DB 查询后回写缓存
-        except Exception:
-            pass
-    
-    # DB 查询（主路径）
-    likes = db.query(Like.target_id).filter(
-        and_(
-            Like.user_id == user_id,
-            Like.target_type == "thread",
-            Like.target_id.in_(thread_ids)
-        )
-    ).all()
-    
-    result = {like[0] for like in likes}
-    
-    # 异步回写 Redis 缓存
-    if r and result:
-        from ..redis_client import fire_and_forget
-        async def _write_cache():
-            try:
-                key = f"likes:user:{user_id}:threads"
-                pipe = r.pipeline()
-                await pipe.delete(key)
-                await pipe.sadd(key, *[str(tid) for tid in result])
-                await pipe.expire(key, 300)
-                await pipe.execute()
-            except Exception:
-                pass
-        fire_and_forget(_write_cache())
-    
-    return result
-
-
-def get_user_liked_reply_ids(db: Session, user_id: int, reply_ids: list) -> set:
-    """获取用户已点赞的回复 ID 集合（优先 Redis，降级 DB）"""
-    if not reply_ids:
-        return set()
-    
-    r = get_redis()
-    
-    # DB 查询（主路径）
-    likes = db.query(Like.target_id).filter(
-        and_(
-            Like.user_id == user_id,
-            Like.target_type == "reply",
-            Like.target_id.in_(reply_ids)
-        )
-    ).all()
-    
-    result = {like[0] for like in likes}
-    
-    # 异步回写 Redis 缓存
-    if r and result:
-        from ..redis_client import fire_and_forget
-        async def _write_cache():
-            try:
-                key = f"likes:user:{user_id}:replies"
-                pipe = r.pipeline()
-                await pipe.delete(key)
-                await pipe.sadd(key, *[str(rid) for rid in result])
-                await pipe.expire(key, 300)
-                await pipe.execute()
-            except Exception:
-                pass
-        fire_and_forget(_write_cache())
-    
-    return result
-
-
 def is_thread_liked_by_user(db: Session, user_id: int, thread_id: int) -> bool:
     """检查用户是否已点赞某帖子"""
     return db.query(Like).filter(
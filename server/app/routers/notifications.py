@@ -1,54 +1,61 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, case
+from sqlalchemy.orm import Session
 from typing import Optional, Literal
 import re
+import json
 import asyncio
 import logging
+from datetime import datetime, timedelta
 
 from ..database import get_db
-from ..models import User, Thread, Reply, Notification, BlockList
+from ..models import User, Thread, Reply, Notification
 from ..schemas import NotificationResponse, UnreadCountResponse, PaginatedResponse, UserPublicResponse
 from ..auth import get_current_user
+from ..config import get_settings
+from ..mention_cache import get_mention_resolver
+from ..notification_counters import (
+    get_counts,
+    get_counts_cached,
+    record_all_read,
+    record_created,
+    record_created_many,
+    record_read,
+)
 from ..notifier import push_notification
-from ..redis_client import get_redis
+from ..redis_client import fire_and_forget, get_redis
+from .blocks import get_users_who_blocked as _users_who_blocked
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/notifications", tags=["通知"])
 
+settings = get_settings()
+
+# 按目标合并的通知类型（点赞 / 关注 / 关注的人发帖）
+AGGREGATED_TYPES = {"like", "follow", "new_post"}
+AGGREGATE_RECENT_ACTORS = 5  # 聚合通知保留的最近触发者数
+# 无 Redis 时进程内的推送防抖：通知 ID → 待推送的最新内容
+_pending_pushes: dict[int, dict] = {}
+
+
+_MENTION_PATTERN = re.compile(r"@(\w+)")
+
 
 def parse_mentions(content: str, db: Session) -> list[int]:
-    """解析内容中的 @用户名，返回用户ID列表（批量查询，1次DB）"""
-    pattern = r"@(\w+)"
-    usernames = list(set(re.findall(pattern, content)))  # 去重
-    
+    """解析内容中的 @用户名，返回用户ID列表（走提及解析缓存，命中时 0 次 DB，未命中的用户名批量查询 1 次）"""
+    usernames = _MENTION_PATTERN.findall(content)
     if not usernames:
         return []
-    
-    # 一次查询获取所有提及的用户
-    users = db.query(User.id).filter(User.username.in_(usernames)).all()
-    return [u[0] for u in users]
+    return get_mention_resolver().resolve_sync(db, usernames)
 
 
 def get_users_who_blocked(db: Session, sender_id: int, user_ids: list[int]) -> set[int]:
-    """批量查询：在 user_ids 中，哪些用户拉黑了 sender_id（1 次 DB 查询）
+    """批量查询：在 user_ids 中，哪些用户拉黑了 sender_id（走拉黑关系缓存）
     
     返回拉黑了 sender_id 的用户 ID 集合。
     用于预查询后传入 create_notification(blocked_user_ids=...) 避免 N+1 查询。
     """
-    if not user_ids:
-        return set()
-    
-    rows = (
-        db.query(BlockList.user_id)
-        .filter(
-            BlockList.user_id.in_(user_ids),
-            BlockList.blocked_user_id == sender_id
-        )
-        .all()
-    )
-    return {row[0] for row in rows}
+    return _users_who_blocked(db, sender_id, user_ids)
 
 
 def create_notification(
@@ -79,12 +86,8 @@ def create_notification(
         if user_id in blocked_user_ids:
             return None
     else:
-        # 回落到逐个查询（向后兼容）
-        is_blocked = db.query(BlockList).filter(
-            BlockList.user_id == user_id,
-            BlockList.blocked_user_id == from_user_id
-        ).first()
-        if is_blocked:
+        # 未预查询时读取发送者的拉黑关系缓存（向后兼容）
+        if user_id in _users_who_blocked(db, from_user_id, [user_id]):
             return None
     
     # 截取内容预览
@@ -92,6 +95,12 @@ def create_notification(
     if content_preview and len(content_preview) > 100:
         content_preview = content_preview[:97] + "..."
     
+    if type in AGGREGATED_TYPES and settings.NOTIFICATION_AGGREGATE_WINDOW > 0:
+        return _create_aggregated_notification(
+            db, user_id, from_user_id, type, thread_id, reply_id, content_preview,
+            thread_title=thread_title, from_username=from_username,
+        )
+    
     notification = Notification(
         user_id=user_id,
         from_user_id=from_user_id,
@@ -101,12 +110,7 @@ def create_notification(
         content_preview=content_preview
     )
     db.add(notification)
-    
-    # Redis: 未读计数 +1
-    r = get_redis()
-    if r:
-        from ..redis_client import fire_and_forget
-        fire_and_forget(r.incr(f"unread:{user_id}"))
+    record_created(db, user_id)
     
     # Schedule realtime push (non-blocking, compatible with both async and sync contexts)
     if thread_title and from_username:
@@ -125,11 +129,237 @@ def create_notification(
     return notification
 
 
+def create_notifications_bulk(
+    db: Session,
+    user_ids: list[int],
+    from_user_id: int,
+    type: str,
+    thread_id: Optional[int],
+    content_preview: Optional[str] = None,
+    thread_title: Optional[str] = None,
+    from_username: Optional[str] = None,
+) -> None:
+    """给一批用户发同一条通知（关注的人发帖等扇出场景，调用方负责提交）
+
+    拉黑关系一次批量查询；聚合类型走 create_aggregated_notifications 批量合并/新建，其余逐条创建。
+    """
+    blocked = get_users_who_blocked(db, from_user_id, user_ids)
+    recipients = [uid for uid in user_ids if uid != from_user_id and uid not in blocked]
+    if not recipients:
+        return
+    if type in AGGREGATED_TYPES and settings.NOTIFICATION_AGGREGATE_WINDOW > 0:
+        if content_preview and len(content_preview) > 100:
+            content_preview = content_preview[:97] + "..."
+        create_aggregated_notifications(
+            db, recipients, from_user_id, type, thread_id, None, content_preview,
+            thread_title=thread_title, from_username=from_username,
+        )
+        return
+    for user_id in recipients:
+        create_notification(
+            db=db,
+            user_id=user_id,
+            from_user_id=from_user_id,
+            type=type,
+            thread_id=thread_id,
+            content_preview=content_preview,
+            thread_title=thread_title,
+            from_username=from_username,
+            blocked_user_ids=blocked,
+        )
+
+
+def _aggregate_key_filters(type: str, thread_id: Optional[int], reply_id: Optional[int], from_user_id: int) -> list:
+    """聚合目标：点赞按被赞的帖子/回复，关注按接收者，关注的人发帖按发帖人"""
+    if type == "like":
+        return [Notification.thread_id == thread_id, Notification.reply_id == reply_id]
+    if type == "new_post":
+        return [Notification.from_user_id == from_user_id]
+    return []
+
+
+def _create_aggregated_notification(
+    db: Session,
+    user_id: int,
+    from_user_id: int,
+    type: str,
+    thread_id: Optional[int],
+    reply_id: Optional[int],
+    content_preview: Optional[str],
+    thread_title: Optional[str] = None,
+    from_username: Optional[str] = None,
+):
+    """单个接收者的聚合通知（见 create_aggregated_notifications）"""
+    create_aggregated_notifications(
+        db, [user_id], from_user_id, type, thread_id, reply_id, content_preview,
+        thread_title=thread_title, from_username=from_username,
+    )
+
+
+def create_aggregated_notifications(
+    db: Session,
+    user_ids: list[int],
+    from_user_id: int,
+    type: str,
+    thread_id: Optional[int],
+    reply_id: Optional[int],
+    content_preview: Optional[str],
+    *,
+    thread_title: Optional[str] = None,
+    from_username: Optional[str] = None,
+) -> None:
+    """为一批接收者合并到窗口内同一目标的未读通知，没有可合并的行时新建（调用方负责过滤自己/拉黑并提交）
+
+    - 一次 SELECT（按 user_id 升序加锁）取出所有接收者可合并的行；合并在一次 flush 中写入
+      （同列 UPDATE 合并为 executemany），新建一次 executemany INSERT，计数一条 UPDATE，
+      关注的人发帖扇出给 N 个粉丝时语句数与 N 无关
+    - 合并只更新已有行（触发者、计数、最近触发者、updated_at），不新增通知行，未读数不变；
+      updated_at 前移后该行在列表中重新置顶，/sync 的通知流（按 (updated_at, id) 键集）也会再次下发；
+      已读的行不再合并，下一次事件重新开始一行
+    - 推送：新建的行用手头的数据立即推送；合并只做防抖推送（见 _schedule_aggregated_push），
+      推送内容同样来自内存，不再回查数据库
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    now = datetime.utcnow()
+    window_start = now - timedelta(seconds=settings.NOTIFICATION_AGGREGATE_WINDOW)
+    query = db.query(Notification).filter(
+        Notification.user_id.in_(user_ids),
+        Notification.is_read == False,  # noqa: E712
+        Notification.type == type,
+        Notification.created_at >= window_start,
+        *_aggregate_key_filters(type, thread_id, reply_id, from_user_id),
+    ).order_by(Notification.user_id, Notification.id.desc())
+    if db.get_bind().dialect.name != "sqlite":
+        query = query.with_for_update()
+    existing: dict[int, Notification] = {}
+    for row in query:
+        existing.setdefault(row.user_id, row)  # 每个接收者取最新的一行
+
+    created: list[dict] = []
+    merged: list[Notification] = []
+    for user_id in user_ids:
+        notification = existing.get(user_id)
+        if notification is None:
+            created.append({
+                "user_id": user_id,
+                "from_user_id": from_user_id,
+                "type": type,
+                "thread_id": thread_id,
+                "reply_id": reply_id,
+                "content_preview": content_preview,
+                "aggregate_count": 1,
+                "recent_actor_ids": str(from_user_id),
+                "created_at": now,
+                "updated_at": now,
+            })
+            continue
+        actors = [from_user_id] + [
+            a for a in _split_actor_ids(notification.recent_actor_ids) if a != from_user_id
+        ]
+        notification.from_user_id = from_user_id
+        notification.thread_id = thread_id
+        notification.reply_id = reply_id
+        notification.content_preview = content_preview
+        # 行已加锁（SQLite 写事务串行），直接写入新值，flush 时同列的 UPDATE 合并为 executemany
+        notification.aggregate_count = (notification.aggregate_count or 1) + 1
+        notification.updated_at = now  # 列表置顶，增量同步重新下发
+        notification.recent_actor_ids = ",".join(str(a) for a in actors[:AGGREGATE_RECENT_ACTORS])
+        merged.append(notification)
+    db.flush()
+    if created:
+        db.execute(Notification.__table__.insert(), created)  # 一次 executemany
+        record_created_many(db, [row["user_id"] for row in created])
+
+    if from_username:
+        for row in created:
+            fire_and_forget(push_notification(
+                user_id=row["user_id"],
+                **_aggregated_push_payload(row, thread_title, from_username),
+            ))
+        for notification in merged:
+            fire_and_forget(_schedule_aggregated_push(
+                notification.id,
+                notification.user_id,
+                _aggregated_push_payload(
+                    {column: getattr(notification, column) for column in _PUSH_COLUMNS},
+                    thread_title,
+                    from_username,
+                ),
+            ))
+
+
+_PUSH_COLUMNS = ("type", "thread_id", "reply_id", "from_user_id", "content_preview", "aggregate_count", "recent_actor_ids")
+
+
+def _aggregated_push_payload(row: dict, thread_title: Optional[str], from_username: str) -> dict:
+    return {
+        "notification_type": row["type"],
+        "thread_id": row["thread_id"],
+        "thread_title": thread_title or "",
+        "from_user_id": row["from_user_id"],
+        "from_username": from_username,
+        "reply_id": row["reply_id"],
+        "content": row["content_preview"],
+        "aggregate_count": row["aggregate_count"],
+        "recent_actor_ids": _split_actor_ids(row["recent_actor_ids"]),
+    }
+
+
+async def _schedule_aggregated_push(notification_id: int, user_id: int, payload: dict):
+    """聚合通知合并后的推送防抖：同一通知行在防抖延迟内只推送一次，推送延迟结束时的最新内容
+
+    第一次合并负责推送，延迟期间后续合并只覆盖待推送的内容。
+    有 Redis 时内容存在 `notif:push:{id}`（SET NX 抢推送权，之后 SET XX KEEPTTL 覆盖），集群内去重；
+    否则在进程内去重。内容来自合并时的内存数据，不依赖事务何时提交。
+    """
+    delay = settings.NOTIFICATION_PUSH_DEBOUNCE
+    key = f"notif:push:{notification_id}"
+    r = get_redis()
+    if r:
+        try:
+            encoded = json.dumps(payload, ensure_ascii=False)
+            # 过期时间留出余量，保证负责推送的一方醒来时内容还在
+            if not await r.set(key, encoded, nx=True, px=max(1, int(delay * 2000))):
+                await r.set(key, encoded, xx=True, keepttl=True)
+                return
+            await asyncio.sleep(delay)
+            pipe = r.pipeline(transaction=True)
+            pipe.get(key)
+            pipe.delete(key)
+            latest, _ = await pipe.execute()
+            if latest is not None:
+                payload = json.loads(latest)
+            await push_notification(user_id=user_id, **payload)
+            return
+        except Exception as e:
+            logger.warning(f"[Notify] 聚合通知推送失败: {e}")
+            return
+
+    if notification_id in _pending_pushes:
+        _pending_pushes[notification_id] = payload
+        return
+    _pending_pushes[notification_id] = payload
+    try:
+        await asyncio.sleep(delay)
+        await push_notification(user_id=user_id, **_pending_pushes.get(notification_id, payload))
+    except Exception as e:
+        logger.warning(f"[Notify] 聚合通知推送失败: {e}")
+    finally:
+        _pending_pushes.pop(notification_id, None)
+
+
+def _split_actor_ids(value: Optional[str]) -> list[int]:
+    return [int(a) for a in (value or "").split(",") if a]
+
+
 @router.get("", response_model=PaginatedResponse[NotificationResponse])
 def list_notifications(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     is_read: Optional[bool] = Query(None, description="筛选已读/未读，不传则返回全部"),
+    before_id: Optional[int] = Query(None, ge=1, description="游标分页：返回 ID 小于该值的通知（传入时忽略 page）"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -137,50 +367,91 @@ def list_notifications(
     获取我的通知列表
     
     - **is_read**: 可选，true=已读，false=未读，不传=全部
+    - **before_id**: 可选，游标分页。传入上一页最后一条通知的 ID 获取下一页，
+      按 ID 倒序走 (user_id, id) 索引，不受翻页深度影响（推荐通知很多的 Bot 使用）。
+      该模式按创建顺序返回，聚合通知之后合并的事件请通过 /sync 获取
+    - 不传 before_id 时按 updated_at 倒序，聚合通知合并新事件后重新置顶
+    
+    total 来自维护的通知计数，不再对通知表 COUNT；只查询响应需要的列，不加载完整的 User/Thread 行。
     """
     query = (
-        db.query(Notification)
-        .options(
-            joinedload(Notification.from_user),
-            joinedload(Notification.thread)
+        db.query(
+            Notification.id,
+            Notification.type,
+            Notification.thread_id,
+            Notification.reply_id,
+            Notification.content_preview,
+            Notification.is_read,
+            Notification.created_at,
+            Notification.updated_at,
+            Notification.aggregate_count,
+            Notification.recent_actor_ids,
+            Thread.title.label("thread_title"),
+            User.id.label("from_user_id"),
+            User.username.label("from_username"),
+            User.nickname.label("from_nickname"),
+            User.avatar.label("from_avatar"),
+            User.created_at.label("from_created_at"),
         )
+        .join(User, User.id == Notification.from_user_id)
+        .outerjoin(Thread, Thread.id == Notification.thread_id)
         .filter(Notification.user_id == current_user.id)
     )
     
     if is_read is not None:
         query = query.filter(Notification.is_read == is_read)
     
-    # 统计总数（独立 count 查询，避免子查询包装 + 不必要的 JOIN）
-    count_query = db.query(func.count(Notification.id)).filter(
-        Notification.user_id == current_user.id
-    )
-    if is_read is not None:
-        count_query = count_query.filter(Notification.is_read == is_read)
-    total = count_query.scalar()
+    # 总数取自通知计数（已读数 = 总数 - 未读数）
+    count_total, count_unread = get_counts(db, current_user.id)
+    if is_read is None:
+        total = count_total
+    elif is_read:
+        total = max(0, count_total - count_unread)
+    else:
+        total = count_unread
     total_pages = (total + page_size - 1) // page_size if total > 0 else 1
     
-    # 分页查询
-    notifications = (
-        query
-        .order_by(Notification.created_at.desc())
-        .offset((page - 1) * page_size)
-        .limit(page_size)
-        .all()
-    )
+    if before_id is not None:
+        # 游标分页：键集查询，无 OFFSET
+        page = 1
+        rows = (
+            query
+            .filter(Notification.id < before_id)
+            .order_by(Notification.id.desc())
+            .limit(page_size)
+            .all()
+        )
+    else:
+        rows = (
+            query
+            .order_by(Notification.updated_at.desc(), Notification.id.desc())
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+            .all()
+        )
     
     items = [
         NotificationResponse(
-            id=n.id,
-            type=n.type,
-            thread_id=n.thread_id,
-            thread_title=n.thread.title if n.thread else None,
-            reply_id=n.reply_id,
-            from_user=UserPublicResponse.model_validate(n.from_user),
-            content_preview=n.content_preview,
-            is_read=n.is_read,
-            created_at=n.created_at
+            id=row.id,
+            type=row.type,
+            thread_id=row.thread_id,
+            thread_title=row.thread_title,
+            reply_id=row.reply_id,
+            from_user=UserPublicResponse(
+                id=row.from_user_id,
+                username=row.from_username,
+                nickname=row.from_nickname,
+                avatar=row.from_avatar,
+                created_at=row.from_created_at,
+            ),
+            content_preview=row.content_preview,
+            is_read=row.is_read,
+            created_at=row.created_at,
+            updated_at=row.updated_at,
+            aggregate_count=row.aggregate_count,
+            recent_actor_ids=_split_actor_ids(row.recent_actor_ids),
         )
-        for n in notifications
+        for row in rows
     ]
     
     return PaginatedResponse(
@@ -200,33 +471,11 @@ async def get_unread_count(
     """
     获取未读通知数量
     
-    优先从 Redis 读取未读计数（~0.3ms），Redis 不可用时回落 DB 聚合查询。
+    读取通知计数的 Redis 镜像（~0.3ms），未命中或 Redis 不可用时读计数行（单行主键查询）。
+    计数与通知在同一事务中维护，提交后才失效镜像，并定期与通知表对账。
     """
-    r = get_redis()
-    if r:
-        try:
-            cached = await r.get(f"unread:{current_user.id}")
-            if cached is not None:
-                unread = max(0, int(cached))
-                # total 仍需 DB，但轮询场景主要关心 unread
-                return UnreadCountResponse(unread=unread, total=0)
-        except Exception:
-            pass  # 降级到 DB
-    
-    # 回落 DB 查询
-    result = db.query(
-        func.count(Notification.id).label("total"),
-        func.count(case((Notification.is_read == False, 1))).label("unread")
-    ).filter(Notification.user_id == current_user.id).first()
-    
-    # 回写 Redis 初始化
-    if r:
-        try:
-            await r.set(f"unread:{current_user.id}", result.unread)
-        except Exception:
-            pass
-    
-    return UnreadCountResponse(unread=result.unread, total=result.total)
+    total, unread = await get_counts_cached(db, current_user.id)
+    return UnreadCountResponse(unread=unread, total=total)
 
 
 @router.post("/{notification_id}/read")
@@ -238,30 +487,26 @@ async def mark_as_read(
     """
     标记单条通知为已读
     """
-    notification = (
+    # 条件更新：并发标记同一条通知时只有一个请求改到行，未读数只扣一次
+    updated = (
         db.query(Notification)
-        .filter(Notification.id == notification_id, Notification.user_id == current_user.id)
-        .first()
+        .filter(
+            Notification.id == notification_id,
+            Notification.user_id == current_user.id,
+            Notification.is_read == False,  # noqa: E712
+        )
+        .update({Notification.is_read: True}, synchronize_session=False)
     )
-    
-    if not notification:
+    if updated == 1:
+        record_read(db, current_user.id)
+    elif not db.query(Notification.id).filter(
+        Notification.id == notification_id, Notification.user_id == current_user.id
+    ).first():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="通知不存在"
         )
-    
-    if not notification.is_read:
-        notification.is_read = True
-        db.commit()
-        # Redis: 未读计数 -1
-        r = get_redis()
-        if r:
-            try:
-                await r.decr(f"unread:{current_user.id}")
-            except Exception:
-                pass
-    else:
-        db.commit()
+    db.commit()
     
     return {"message": "已标记为已读"}
 
@@ -278,15 +523,8 @@ async def mark_all_as_read(
         Notification.user_id == current_user.id,
         Notification.is_read == False
     ).update({"is_read": True})
+    record_all_read(db, current_user.id)
     
     db.commit()
     
-    # Redis: 未读计数归零
-    r = get_redis()
-    if r:
-        try:
-            await r.set(f"unread:{current_user.id}", 0)
-        except Exception:
-            pass
-    
     return {"message": "已全部标记为已读"}
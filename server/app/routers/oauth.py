@@ -15,8 +15,10 @@ from urllib.parse import urlencode, quote
 from ..database import get_db
 from ..models import User, OAuthAccount
 from ..schemas import OAuthStatusResponse, OAuthAccountResponse
-from ..auth import generate_token, get_current_user
+from ..auth import generate_token, get_current_user, invalidate_user_cache
+from ..mention_cache import get_mention_resolver
 from ..config import get_settings
+from ..http_client import request as outbound_request
 
 # Setup logging for OAuth operations
 logger = logging.getLogger(__name__)
@@ -130,11 +132,11 @@ async def github_callback(
     action = state_data["action"]
     redirect_uri = state_data["redirect_uri"]
 
-    # 用 code 换取 access_token（P2 #17: 复用全局 httpx client）
-    from ..moderation import get_http_client
-    client = get_http_client()
-    if True:
-        token_response = await client.post(
+    # 用 code 换取 access_token（经出站客户端层：独立连接池 + 熔断；code 一次性，token 请求不重试）
+    try:
+        token_response = await outbound_request(
+            "github",
+            "POST",
             "https://github.com/login/oauth/access_token",
             data={
                 "client_id": settings.GITHUB_CLIENT_ID,
@@ -159,7 +161,9 @@ async def github_callback(
             )
 
         # 获取 GitHub 用户信息
-        user_response = await client.get(
+        user_response = await outbound_request(
+            "github",
+            "GET",
             "https://api.github.com/user",
             headers={
                 "Authorization": f"Bearer {access_token}",
@@ -173,6 +177,9 @@ async def github_callback(
             )
 
         github_user = user_response.json()
+    except httpx.RequestError as e:
+        logger.warning(f"[GitHub OAuth] 请求失败: {e!r}")
+        return RedirectResponse(url=f"{redirect_uri}/login?error=github_unavailable")
 
     github_id = github_user.get("id")
     # CRITICAL: Validate that we got a valid user ID from GitHub
@@ -257,6 +264,8 @@ async def github_callback(
             )
             db.add(oauth_account)
             db.commit()
+            invalidate_user_cache(user.id)  # 清除该 ID 可能残留的负缓存
+            get_mention_resolver().invalidate(username)  # 清除该用户名的提及负缓存
 
             logger.info(
                 f"[GitHub OAuth] New user registered: user_id={user.id}, username={username}, github_id={github_id}"
@@ -500,11 +509,11 @@ async def linuxdo_callback(
     action = state_data["action"]
     redirect_uri = state_data["redirect_uri"]
 
-    # 用 code 换取 access_token（P2 #17: 复用全局 httpx client）
-    from ..moderation import get_http_client
-    client = get_http_client()
-    if True:
-        token_response = await client.post(
+    # 用 code 换取 access_token（经出站客户端层：独立连接池 + 熔断；code 一次性，token 请求不重试）
+    try:
+        token_response = await outbound_request(
+            "linuxdo",
+            "POST",
             "https://connect.linux.do/oauth2/token",
             data={
                 "client_id": settings.LINUXDO_CLIENT_ID,
@@ -531,7 +540,9 @@ async def linuxdo_callback(
             )
 
         # 获取 LinuxDo 用户信息
-        user_response = await client.get(
+        user_response = await outbound_request(
+            "linuxdo",
+            "GET",
             "https://connect.linux.do/api/user",
             headers={
                 "Authorization": f"Bearer {access_token}",
@@ -545,6 +556,9 @@ async def linuxdo_callback(
             )
 
         linuxdo_user = user_response.json()
+    except httpx.RequestError as e:
+        logger.warning(f"[LinuxDo OAuth] 请求失败: {e!r}")
+        return RedirectResponse(url=f"{redirect_uri}/login?error=linuxdo_unavailable")
 
     linuxdo_id = linuxdo_user.get("id")
     # CRITICAL: Validate that we got a valid user ID from LinuxDo
@@ -629,6 +643,8 @@ async def linuxdo_callback(
             )
             db.add(oauth_account)
             db.commit()
+            invalidate_user_cache(user.id)  # 清除该 ID 可能残留的负缓存
+            get_mention_resolver().invalidate(username)  # 清除该用户名的提及负缓存
 
             logger.info(
                 f"[LinuxDo OAuth] New user registered: user_id={user.id}, username={username}, linuxdo_id={linuxdo_id}"
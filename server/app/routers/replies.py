@@ -6,6 +6,7 @@ from typing import Literal
 from datetime import datetime
 from ..database import get_db
 from ..models import User, Thread, Reply, Notification, BlockList, Like
+from ..notification_counters import delete_notifications
 from ..schemas import (
     ReplyCreate, SubReplyCreate, ReplyResponse, 
     SubReplyResponse, PaginatedResponse
@@ -14,8 +15,8 @@ from ..auth import get_current_user
 from ..config import get_settings
 from ..serializers import LLMSerializer
 from .notifications import create_notification, parse_mentions, get_users_who_blocked
-from ..moderation import get_moderator
-from .blocks import get_blocked_user_ids
+from ..moderation import get_moderator, enqueue_moderation
+from .blocks import get_blocked_user_ids, exclude_blocked_authors
 from ..level_service import add_exp_for_reply
 from ..rate_limit import limiter
 
@@ -70,6 +71,8 @@ def create_reply(
     thread.last_reply_at = datetime.utcnow()
     
     db.flush()  # 先 flush 获取 reply.id
+    if needs_moderation:
+        enqueue_moderation(db, "reply", reply.id)
     
     # 解析 @ 提及
     mentioned_user_ids = parse_mentions(data.content, db)
@@ -160,8 +163,9 @@ def list_sub_replies(
     
     # 统计总数（排除被拉黑用户）
     count_query = db.query(func.count(Reply.id)).filter(Reply.parent_id == reply_id)
-    if blocked_user_ids:
-        count_query = count_query.filter(~Reply.author_id.in_(blocked_user_ids))
+    block_filter = exclude_blocked_authors(Reply.author_id, current_user.id, blocked_user_ids)
+    if block_filter is not None:
+        count_query = count_query.filter(block_filter)
     total = count_query.scalar()
     total_pages = (total + page_size - 1) // page_size if total > 0 else 1
     
@@ -174,8 +178,8 @@ def list_sub_replies(
         )
         .filter(Reply.parent_id == reply_id)
     )
-    if blocked_user_ids:
-        sub_query = sub_query.filter(~Reply.author_id.in_(blocked_user_ids))
+    if block_filter is not None:
+        sub_query = sub_query.filter(block_filter)
     
     sub_replies = (
         sub_query
@@ -293,6 +297,8 @@ def create_sub_reply(
     db.add(sub_reply)
     
     db.flush()  # 先 flush 获取 sub_reply.id
+    if needs_moderation:
+        enqueue_moderation(db, "reply", sub_reply.id)
     
     # 获取帖子标题（用于实时推送）
     thread = db.query(Thread).filter(Thread.id == parent.thread_id).first()
@@ -406,7 +412,7 @@ def delete_reply(
     
     # 删除相关通知（外键约束）
     all_reply_ids = sub_reply_ids + [reply_id]
-    db.query(Notification).filter(Notification.reply_id.in_(all_reply_ids)).delete(synchronize_session=False)
+    delete_notifications(db, Notification.reply_id.in_(all_reply_ids))
     
     # P1 #10: 清除回复（及其楼中楼）的 Like 记录
     db.query(Like).filter(
@@ -0,0 +1,326 @@
+"""
+增量同步路由：Bot 断线重连后用一次调用补齐错过的事件
+
+GET /sync?since=<cursor> 返回游标之后的：
+- 私聊新消息（我参与的会话，按消息 ID）
+- 私聊已读游标变化（我参与的会话中双方的已读位置，按 (last_read_at, 会话ID, 用户ID)）
+- 新通知和有变化的聚合通知（按 (updated_at, 通知ID)，聚合通知合并新事件后会再次下发）
+- 关注的用户发布的新帖（按帖子 ID）
+
+游标是各事件流位置的不透明编码，只增不减。每个事件流都是键集查询（WHERE 位置 > 游标 ORDER BY 位置 LIMIT），
+单次最多返回每类 limit 条；任一类未取完时 has_more=true，用返回的 cursor 继续请求即可。
+不带 since 时不返回事件，只返回当前位置的游标（首次接入时先取游标，之后增量拉取）。
+
+提交延迟：ID 和时间戳在插入时分配而不是提交时，ID 较小的行可能晚于 ID 较大的行提交；
+游标一旦越过它，这一行就永远不会下发。因此每个事件流只返回早于 SYNC_COMMIT_LAG 的行，
+游标停在第一条还在窗口内的行之前（首次取游标同理）。事务执行超过该窗口的行仍可能漏掉，
+客户端需要强一致时仍应定期用列表接口校对。
+"""
+
+import base64
+import calendar
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func, or_, tuple_
+from sqlalchemy.orm import Session, defer, joinedload
+
+from ..auth import get_current_user
+from ..database import get_db
+from ..level_service import batch_get_user_levels
+from ..like_index import get_liked_ids
+from ..models import DMConversation, DMMessage, DMRead, Notification, Thread, User
+from ..schemas import (
+    NotificationResponse,
+    SyncDMReadEvent,
+    SyncResponse,
+    ThreadListItem,
+    UserPublicResponse,
+)
+from .blocks import get_blocked_user_ids_async
+from .dm import _serialize_messages
+from .follows import get_follower_ids_cached, get_following_ids_cached
+from .notifications import _split_actor_ids
+
+router = APIRouter(prefix="/sync", tags=["同步"])
+
+_CURSOR_VERSION = "2"
+_EPOCH = datetime(1970, 1, 1)
+_CURSOR_FIELDS = (
+    "dm_message_id", "notification_id", "thread_id", "read_at_us", "read_conv_id", "read_user_id", "notif_at_us",
+)
+_LEGACY_CURSOR_FIELDS = _CURSOR_FIELDS[:-1]  # v1 游标：通知流只按 ID，没有 notif_at_us
+SYNC_COMMIT_LAG = timedelta(seconds=2)  # 只下发早于该窗口的行，给并发事务留出提交时间
+
+
+def _to_micros(dt: Optional[datetime]) -> int:
+    """时间 → UTC 微秒时间戳（无时区的时间按 UTC 处理，与 datetime.utcnow() 写入一致）"""
+    if dt is None:
+        return 0
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return calendar.timegm(dt.timetuple()) * 1_000_000 + dt.microsecond
+
+
+def _from_micros(value: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def encode_cursor(position: dict) -> str:
+    raw = ":".join([_CURSOR_VERSION] + [str(int(position[key])) for key in _CURSOR_FIELDS])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        version, *values = raw.split(":")
+        fields = {_CURSOR_VERSION: _CURSOR_FIELDS, "1": _LEGACY_CURSOR_FIELDS}.get(version)
+        if fields is None or len(values) != len(fields):
+            raise ValueError(raw)
+        position = {key: int(value) for key, value in zip(fields, values)}
+        if any(value < 0 for value in position.values()):
+            raise ValueError(raw)
+        position.setdefault("notif_at_us", -1)  # v1：首次使用时按 notification_id 换算
+        return position
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="invalid sync cursor",
+        )
+
+
+def _settled(rows: list, horizon_us: int, limit: int) -> tuple[list, bool]:
+    """ID 流：截到第一条还在提交延迟窗口内的行之前，返回 (本次下发的行, has_more)"""
+    for index, row in enumerate(rows[:limit]):
+        if _to_micros(row.created_at) >= horizon_us:
+            return rows[:index], False
+    return rows[:limit], len(rows) > limit
+
+
+def _head_position(db: Session, user_id: int, horizon: datetime) -> dict:
+    """当前各事件流的末尾位置（首次同步用，同样只算到提交延迟窗口之前）"""
+    dm_message_id, thread_id = db.query(
+        db.query(func.max(DMMessage.id)).filter(DMMessage.created_at < horizon).scalar_subquery(),
+        db.query(func.max(Thread.id)).filter(Thread.created_at < horizon).scalar_subquery(),
+    ).one()
+    notification = (
+        db.query(Notification.updated_at, Notification.id)
+        .filter(Notification.user_id == user_id, Notification.updated_at < horizon)
+        .order_by(Notification.updated_at.desc(), Notification.id.desc())
+        .first()
+    )
+    return {
+        "dm_message_id": dm_message_id or 0,
+        "notification_id": notification.id if notification else 0,
+        "thread_id": thread_id or 0,
+        "read_at_us": _to_micros(horizon),
+        "read_conv_id": 0,
+        "read_user_id": 0,
+        "notif_at_us": _to_micros(notification.updated_at) if notification else 0,
+    }
+
+
+def _sync_dm_messages(db: Session, user: User, position: dict, limit: int, horizon: datetime) -> tuple[list, bool]:
+    after_id = position["dm_message_id"]
+    # 先用会话表的 last_message_id 筛出有新消息的会话，再按 (conversation_id, id) 索引取消息
+    conv_ids = [
+        row[0]
+        for row in db.query(DMConversation.id).filter(
+            or_(
+                DMConversation.user_low_id == user.id,
+                DMConversation.user_high_id == user.id,
+            ),
+            DMConversation.last_message_id > after_id,
+        )
+    ]
+    if not conv_ids:
+        return [], False
+
+    messages = (
+        db.query(DMMessage)
+        .options(joinedload(DMMessage.sender).joinedload(User.level_info))
+        .filter(DMMessage.conversation_id.in_(conv_ids), DMMessage.id > after_id)
+        .order_by(DMMessage.id)
+        .limit(limit + 1)
+        .all()
+    )
+    messages, has_more = _settled(messages, _to_micros(horizon), limit)
+    if messages:
+        position["dm_message_id"] = messages[-1].id
+    return _serialize_messages(messages, user.id), has_more
+
+
+def _sync_dm_reads(db: Session, user: User, position: dict, limit: int, horizon: datetime) -> tuple[list, bool]:
+    my_conversations = (
+        db.query(DMRead.conversation_id)
+        .filter(DMRead.user_id == user.id)
+        .scalar_subquery()
+    )
+    after = (
+        _from_micros(position["read_at_us"]),
+        position["read_conv_id"],
+        position["read_user_id"],
+    )
+    rows = (
+        db.query(
+            DMRead.conversation_id,
+            DMRead.user_id,
+            DMRead.last_read_message_id,
+            DMRead.last_read_at,
+        )
+        .filter(
+            DMRead.conversation_id.in_(my_conversations),
+            DMRead.last_read_at.isnot(None),
+            DMRead.last_read_at < horizon,
+            tuple_(DMRead.last_read_at, DMRead.conversation_id, DMRead.user_id) > tuple_(*after),
+        )
+        .order_by(DMRead.last_read_at, DMRead.conversation_id, DMRead.user_id)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        last = rows[-1]
+        position["read_at_us"] = _to_micros(last.last_read_at)
+        position["read_conv_id"] = last.conversation_id
+        position["read_user_id"] = last.user_id
+    events = [
+        SyncDMReadEvent(
+            conversation_id=row.conversation_id,
+            user_id=row.user_id,
+            last_read_message_id=int(row.last_read_message_id or 0),
+            last_read_at=row.last_read_at,
+            is_mine=row.user_id == user.id,
+        )
+        for row in rows
+    ]
+    return events, has_more
+
+
+def _sync_notifications(db: Session, user: User, position: dict, limit: int, horizon: datetime) -> tuple[list, bool]:
+    if position["notif_at_us"] < 0:
+        # v1 游标只记录了通知 ID：换算为该通知的创建时间（已删除时取 ID 更小的最近一条），
+        # 之后变化过的通知（含合并了新事件的聚合通知）都会下发
+        anchor = (
+            db.query(Notification.created_at)
+            .filter(Notification.user_id == user.id, Notification.id <= position["notification_id"])
+            .order_by(Notification.id.desc())
+            .first()
+        )
+        position["notif_at_us"] = _to_micros(anchor[0]) if anchor else 0
+    after = (_from_micros(position["notif_at_us"]), position["notification_id"])
+    notifications = (
+        db.query(Notification)
+        .options(
+            joinedload(Notification.from_user),
+            joinedload(Notification.thread).load_only(Thread.id, Thread.title),
+        )
+        .filter(
+            Notification.user_id == user.id,
+            Notification.updated_at < horizon,
+            tuple_(Notification.updated_at, Notification.id) > tuple_(*after),
+        )
+        .order_by(Notification.updated_at, Notification.id)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(notifications) > limit
+    notifications = notifications[:limit]
+    if notifications:
+        position["notification_id"] = notifications[-1].id
+        position["notif_at_us"] = _to_micros(notifications[-1].updated_at)
+    items = [
+        NotificationResponse(
+            id=n.id,
+            type=n.type,
+            thread_id=n.thread_id,
+            thread_title=n.thread.title if n.thread else None,
+            reply_id=n.reply_id,
+            from_user=UserPublicResponse.model_validate(n.from_user),
+            content_preview=n.content_preview,
+            is_read=n.is_read,
+            created_at=n.created_at,
+            updated_at=n.updated_at,
+            aggregate_count=n.aggregate_count,
+            recent_actor_ids=_split_actor_ids(n.recent_actor_ids),
+        )
+        for n in notifications
+    ]
+    return items, has_more
+
+
+async def _sync_threads(db: Session, user: User, position: dict, limit: int, horizon: datetime) -> tuple[list, bool]:
+    following_ids = await get_following_ids_cached(db, user.id)
+    following_ids -= await get_blocked_user_ids_async(db, user.id)
+    if not following_ids:
+        return [], False
+
+    threads = (
+        db.query(Thread)
+        .options(joinedload(Thread.author), defer(Thread.content))
+        .filter(
+            Thread.author_id.in_(following_ids),
+            Thread.id > position["thread_id"],
+        )
+        .order_by(Thread.id)
+        .limit(limit + 1)
+        .all()
+    )
+    threads, has_more = _settled(threads, _to_micros(horizon), limit)
+    if not threads:
+        return [], has_more
+    position["thread_id"] = threads[-1].id
+
+    follower_ids = await get_follower_ids_cached(db, user.id)
+    liked_thread_ids, _ = await get_liked_ids(db, user.id, thread_ids=[t.id for t in threads])
+    user_levels = batch_get_user_levels(db, list({t.author_id for t in threads}))
+    items = []
+    for t in threads:
+        item = ThreadListItem.model_validate(t)
+        item.followed_by_me = True
+        item.mutual_by_me = t.author_id in follower_ids
+        item.liked_by_me = t.id in liked_thread_ids
+        item.like_count = t.like_count or 0
+        level_info = user_levels.get(t.author_id, {"level": 1, "exp": 0})
+        item.author.level = level_info["level"]
+        item.author.exp = level_info["exp"]
+        items.append(item)
+    return items, has_more
+
+
+@router.get("", response_model=SyncResponse)
+async def sync(
+    since: Optional[str] = Query(None, description="上次返回的 cursor，不传则只返回当前游标"),
+    limit: int = Query(50, ge=1, le=200, description="每类事件的最大返回条数"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    增量同步：返回游标之后的私聊消息、已读变化、通知和关注用户的新帖
+
+    - 重连后循环调用直到 has_more=false，并保存最后返回的 cursor
+    - 事件可能在极少数情况下重复（例如同一会话的已读游标多次移动），客户端按 ID 幂等处理即可
+    - 只返回 SYNC_COMMIT_LAG（2 秒）之前的事件：ID/时间在插入时分配，刚写入的行可能还有更早的行未提交，
+      等窗口过去再下发以免游标越过它们；执行时间超过该窗口的事务中的行仍可能漏掉
+    """
+    horizon = datetime.utcnow() - SYNC_COMMIT_LAG
+    if since is None:
+        return SyncResponse(cursor=encode_cursor(_head_position(db, current_user.id, horizon)))
+
+    position = decode_cursor(since)
+    dm_messages, more_messages = _sync_dm_messages(db, current_user, position, limit, horizon)
+    dm_reads, more_reads = _sync_dm_reads(db, current_user, position, limit, horizon)
+    notifications, more_notifications = _sync_notifications(db, current_user, position, limit, horizon)
+    threads, more_threads = await _sync_threads(db, current_user, position, limit, horizon)
+
+    return SyncResponse(
+        cursor=encode_cursor(position),
+        has_more=more_messages or more_reads or more_notifications or more_threads,
+        dm_messages=dm_messages,
+        dm_reads=dm_reads,
+        notifications=notifications,
+        threads=threads,
+    )
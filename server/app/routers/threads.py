@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, BackgroundTasks
 from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session, joinedload, defer
-from sqlalchemy import func, and_, or_, literal_column, literal, case, union_all, extract, text
+from sqlalchemy import func, and_, or_, literal_column, case, union_all, extract, text
 from typing import Literal, Optional
 from datetime import datetime, timedelta
 from ..database import get_db
 from ..models import User, Thread, Reply, Notification, Like, UserLevel
+from ..notification_counters import delete_notifications
 from ..schemas import (
     ThreadCreate, ThreadListItem, ThreadDetail,
     ReplyResponse, SubReplyResponse, PaginatedResponse, ThreadWithReplies,
@@ -14,10 +15,10 @@ from ..schemas import (
 from ..auth import get_current_user, get_optional_user
 from ..config import get_settings
 from ..serializers import LLMSerializer
-from ..moderation import get_moderator
-from .blocks import get_blocked_user_ids, get_blocked_user_ids_async
+from ..moderation import get_moderator, enqueue_moderation
+from .blocks import get_blocked_user_ids, get_blocked_user_ids_async, exclude_blocked_authors
 from ..level_service import add_exp_for_post, get_user_level_info, batch_get_user_levels
-from .likes import get_user_liked_thread_ids, get_user_liked_reply_ids, is_thread_liked_by_user
+from ..like_index import get_liked_ids
 from .follows import get_follower_ids, get_following_ids_cached, get_follower_ids_cached
 from ..rate_limit import limiter
 from ..redis_client import get_redis
@@ -89,8 +90,9 @@ async def get_trending(
     # 拉黑过滤：排除被拉黑用户发的帖子
     if current_user:
         blocked_user_ids = await get_blocked_user_ids_async(db, current_user.id)
-        if blocked_user_ids:
-            query = query.filter(~Thread.author_id.in_(blocked_user_ids))
+        block_filter = exclude_blocked_authors(Thread.author_id, current_user.id, blocked_user_ids)
+        if block_filter is not None:
+            query = query.filter(block_filter)
     
     # SQL 中排序并限制数量，无需拉取 100 条到 Python
     hot_threads = (
@@ -186,9 +188,10 @@ async def search_threads(
     # 拉黑过滤：排除被拉黑用户发的帖子
     if current_user:
         blocked_user_ids = await get_blocked_user_ids_async(db, current_user.id)
-        if blocked_user_ids:
-            query = query.filter(~Thread.author_id.in_(blocked_user_ids))
-            count_query = count_query.filter(~Thread.author_id.in_(blocked_user_ids))
+        block_filter = exclude_blocked_authors(Thread.author_id, current_user.id, blocked_user_ids)
+        if block_filter is not None:
+            query = query.filter(block_filter)
+            count_query = count_query.filter(block_filter)
     
     # 分类筛选
     if category and category in THREAD_CATEGORIES:
@@ -345,8 +348,9 @@ async def list_threads(
     # 拉黑过滤：排除被拉黑用户发的帖子
     if current_user:
         blocked_user_ids = await get_blocked_user_ids_async(db, current_user.id)
-        if blocked_user_ids:
-            base_filter.append(~Thread.author_id.in_(blocked_user_ids))
+        block_filter = exclude_blocked_authors(Thread.author_id, current_user.id, blocked_user_ids)
+        if block_filter is not None:
+            base_filter.append(block_filter)
     
     # 分类筛选
     if category and category in THREAD_CATEGORIES:
@@ -411,30 +415,18 @@ async def list_threads(
         followed_author_ids = await get_following_ids_cached(db, current_user.id)
         # 粉丝集合：用于互关判断
         follower_of_me_ids = await get_follower_ids_cached(db, current_user.id)
-        # 合并"回复过" + "点赞过" 为一次查询
-        parts = [
-            db.query(
-                Reply.thread_id.label("item_id"),
-                literal("replied").label("item_type")
-            ).filter(
+        # 点赞状态：完整点赞索引，一次 Redis 往返
+        liked_thread_ids, _ = await get_liked_ids(db, current_user.id, thread_ids=thread_ids)
+        replied_rows = (
+            db.query(Reply.thread_id)
+            .filter(
                 Reply.thread_id.in_(thread_ids),
                 Reply.author_id == current_user.id
-            ).distinct(),
-            db.query(
-                Like.target_id.label("item_id"),
-                literal("liked").label("item_type")
-            ).filter(
-                Like.user_id == current_user.id,
-                Like.target_type == "thread",
-                Like.target_id.in_(thread_ids)
             )
-        ]
-        combined = parts[0].union_all(parts[1])
-        for item_id, item_type in combined.all():
-            if item_type == "replied":
-                replied_thread_ids.add(item_id)
-            elif item_type == "liked":
-                liked_thread_ids.add(item_id)
+            .distinct()
+            .all()
+        )
+        replied_thread_ids = {row[0] for row in replied_rows}
     
     # 批量获取用户等级信息
     author_ids = list({t.author_id for t in threads})
@@ -511,6 +503,9 @@ def create_thread(
         moderated=not needs_moderation  # 审核开启时标记为未审核，等待定时任务
     )
     db.add(thread)
+    if needs_moderation:
+        db.flush()  # 先 flush 获取 thread.id
+        enqueue_moderation(db, "thread", thread.id)
     
     # 发帖获得经验
     exp_gained, level_up = add_exp_for_post(db, current_user.id)
@@ -548,26 +543,22 @@ def _notify_followers_new_thread(
     from_user_id: int,
     from_username: str
 ):
-    """后台任务：为所有粉丝创建「关注的人发帖」通知"""
+    """后台任务：为所有粉丝创建「关注的人发帖」通知（批量合并/新建，语句数与粉丝数无关）"""
     from ..database import SessionLocal
-    from .notifications import create_notification
+    from .notifications import create_notifications_bulk
     
     db = SessionLocal()
     try:
-        for follower_id in follower_ids:
-            try:
-                create_notification(
-                    db=db,
-                    user_id=follower_id,
-                    from_user_id=from_user_id,
-                    type="new_post",
-                    thread_id=thread_id,
-                    content_preview=content_preview,
-                    thread_title=thread_title,
-                    from_username=from_username
-                )
-            except Exception as e:
-                logger.warning(f"Failed to notify follower {follower_id}: {e}")
+        create_notifications_bulk(
+            db,
+            follower_ids,
+            from_user_id=from_user_id,
+            type="new_post",
+            thread_id=thread_id,
+            content_preview=content_preview,
+            thread_title=thread_title,
+            from_username=from_username
+        )
         db.commit()
     except Exception as e:
         db.rollback()
@@ -657,8 +648,9 @@ async def get_thread(
     # ===== 第3步：查回复列表 + 计数（合并为1次主查询 + 1次count） =====
     # 构建 count 查询
     count_filter = [Reply.thread_id == thread_id, Reply.parent_id.is_(None)]
-    if blocked_user_ids:
-        count_filter.append(~Reply.author_id.in_(blocked_user_ids))
+    block_filter = exclude_blocked_authors(Reply.author_id, current_user_id, blocked_user_ids)
+    if block_filter is not None:
+        count_filter.append(block_filter)
     total = db.query(func.count(Reply.id)).filter(*count_filter).scalar()
     total_pages = (total + page_size - 1) // page_size if total > 0 else 1
     
@@ -672,8 +664,8 @@ async def get_thread(
         )
         .filter(Reply.thread_id == thread_id, Reply.parent_id.is_(None))
     )
-    if blocked_user_ids:
-        replies_query = replies_query.filter(~Reply.author_id.in_(blocked_user_ids))
+    if block_filter is not None:
+        replies_query = replies_query.filter(block_filter)
     
     order = Reply.floor_num.asc() if sort == "asc" else Reply.floor_num.desc()
     replies = (
@@ -711,61 +703,21 @@ async def get_thread(
     author_mutual = author_followed and thread.author_id in follower_ids_cached
     
     if current_user_id:
-        # 子查询1: 用户点赞的回复IDs
-        # 子查询2: 用户是否点赞了该帖子
-        # 子查询3: 用户是否回复过该帖子
-        # 全部合并为一次查询，用 type 字段区分
-        
-        parts = []
-        
-        # part A: 点赞的回复
-        if all_reply_ids:
-            parts.append(
-                db.query(
-                    Like.target_id.label("item_id"),
-                    literal("liked_reply").label("item_type")
-                ).filter(
-                    Like.user_id == current_user_id,
-                    Like.target_type == "reply",
-                    Like.target_id.in_(all_reply_ids)
-                )
-            )
-        
-        # part B: 是否点赞帖子（用 thread_id 作为 item_id）
-        parts.append(
-            db.query(
-                Like.target_id.label("item_id"),
-                literal("liked_thread").label("item_type")
-            ).filter(
-                Like.user_id == current_user_id,
-                Like.target_type == "thread",
-                Like.target_id == thread_id
-            )
+        # 点赞状态（帖子 + 本页全部回复）：点赞索引，一次 pipeline 内的 SMISMEMBER
+        liked_threads, liked_reply_ids = await get_liked_ids(
+            db, current_user_id, thread_ids=[thread_id], reply_ids=all_reply_ids
         )
+        thread_liked = thread_id in liked_threads
         
-        # part C: 是否回复过（只取1条，用 thread_id 作为 item_id）
-        parts.append(
-            db.query(
-                Reply.thread_id.label("item_id"),
-                literal("has_replied").label("item_type")
-            ).filter(
+        # 是否回复过（只取1条）
+        has_replied = (
+            db.query(Reply.id)
+            .filter(
                 Reply.thread_id == thread_id,
                 Reply.author_id == current_user_id
-            ).limit(1)
-        )
-        
-        # 合并所有子查询
-        combined_query = parts[0]
-        for p in parts[1:]:
-            combined_query = combined_query.union_all(p)
-        
-        for item_id, item_type in combined_query.all():
-            if item_type == "liked_reply":
-                liked_reply_ids.add(item_id)
-            elif item_type == "liked_thread":
-                thread_liked = True
-            elif item_type == "has_replied":
-                has_replied = True
+            )
+            .first()
+        ) is not None
     
     # 批量获取用户等级信息（1次查询）
     user_levels = {}
@@ -844,9 +796,9 @@ def delete_thread(
     all_reply_ids = [r.id for r in db.query(Reply.id).filter(Reply.thread_id == thread_id).all()]
     
     # 删除相关通知（外键约束）
-    db.query(Notification).filter(Notification.thread_id == thread_id).delete(synchronize_session=False)
+    delete_notifications(db, Notification.thread_id == thread_id)
     if all_reply_ids:
-        db.query(Notification).filter(Notification.reply_id.in_(all_reply_ids)).delete(synchronize_session=False)
+        delete_notifications(db, Notification.reply_id.in_(all_reply_ids))
     
     # P1 #10: 清除帖子和回复的 Like 记录
     db.query(Like).filter(
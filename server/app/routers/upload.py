@@ -9,7 +9,7 @@ from pathlib import Path
 from ..database import get_db
 from ..models import User
 from ..schemas import UserResponse
-from ..auth import get_current_user
+from ..auth import get_current_user, invalidate_user_cache
 from ..config import get_settings
 from ..rate_limit import limiter
 
@@ -80,6 +80,7 @@ async def upload_avatar(
     current_user.avatar = avatar_url
     db.commit()
     db.refresh(current_user)
+    invalidate_user_cache(current_user.id)
     
     return UserResponse.model_validate(current_user)
 
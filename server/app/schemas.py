@@ -312,6 +312,9 @@ class NotificationResponse(BaseModel):
     content_preview: Optional[str] = None
     is_read: bool
     created_at: datetime
+    aggregate_count: int = 1  # 聚合通知（like / follow / new_post）合并的事件数
+    recent_actor_ids: list[int] = []  # 聚合通知最近的触发者（新的在前），from_user 为最近一位
+    updated_at: Optional[datetime] = None  # 最后一次变更时间（聚合通知合并新事件时更新）
     
     class Config:
         from_attributes = True
@@ -472,6 +475,26 @@ class DMMessageResponse(BaseModel):
         from_attributes = True
 
 
+class DMBulkMessageCreateRequest(BaseModel):
+    """群发私聊消息请求（同一内容发给多个用户，每人一条独立会话消息）"""
+    target_user_ids: List[int] = Field(..., min_length=1, max_length=50, description="接收者用户ID列表")
+    content: str = Field(..., min_length=1, max_length=5000, description="消息内容")
+    client_msg_id: Optional[str] = Field(None, max_length=64, description="客户端消息ID，在每个会话内分别防重复")
+
+
+class DMBulkSendResult(BaseModel):
+    """群发结果（单个接收者）"""
+    target_user_id: int
+    message: Optional[DMMessageResponse] = None
+    error: Optional[str] = None  # 失败原因，成功时为空
+
+
+class DMBulkSendResponse(BaseModel):
+    """群发私聊消息响应"""
+    items: List[DMBulkSendResult]
+    sent: int  # 成功发送（含命中 client_msg_id 去重）的接收者数
+
+
 class DMConversationResponse(BaseModel):
     """私聊会话响应"""
     id: int
@@ -500,3 +523,24 @@ class DMUnreadCountResponse(BaseModel):
     """私聊未读统计响应"""
     unread: int = Field(..., description="未读消息总数")
     conversations_with_unread: int = Field(..., description="有未读消息的会话数")
+
+
+# ========== 增量同步 ==========
+
+class SyncDMReadEvent(BaseModel):
+    """私聊已读游标变化"""
+    conversation_id: int
+    user_id: int  # 移动游标的用户（自己或对方）
+    last_read_message_id: int
+    last_read_at: Optional[datetime] = None
+    is_mine: bool
+
+
+class SyncResponse(BaseModel):
+    """增量同步响应（各类事件按 ID/时间升序，has_more=true 时用返回的 cursor 继续拉取）"""
+    cursor: str = Field(..., description="下次请求的 since 参数")
+    has_more: bool = False
+    dm_messages: List[DMMessageResponse] = []
+    dm_reads: List[SyncDMReadEvent] = []
+    notifications: List[NotificationResponse] = []
+    threads: List[ThreadListItem] = []  # 关注的用户发布的新帖
@@ -1,37 +1,164 @@
 """
 公共设置工具函数
 
-将 _get_setting / _set_setting 提取为共享模块，
-支持批量查询以减少 DB 往返。
-Redis 缓存层：所有设置存入 Redis Hash "sys:settings"，TTL 300 秒。
+将 _get_setting / _set_setting 提取为共享模块。
+
+读取走进程级快照：system_settings 整表（数十行）缓存为一个字典，
+稳态下每次读取只是一次字典查找。
+- 快照来源：Redis Hash `sys:settings`（TTL 300 秒）→ DB 整表查询
+- 失效：invalidate_settings_cache() 删除 Redis Hash 并通过 cache_bus 广播，
+  所有实例丢弃本地快照，下次读取时从 DB 重新加载
+- 本地快照另有 60 秒 TTL 兜底（广播丢失时）：过期后继续返回旧快照，由后台刷新任务
+  优先从 Redis Hash 读取、未命中再查 DB；Redis 不可用时直接同步回源 DB
 """
 
+import asyncio
 import logging
+import threading
+import time
+from typing import Optional
+
 from sqlalchemy.orm import Session
+from .cache_bus import register_handler, publish_invalidation, publish_invalidation_nowait
 from .models import SystemSettings
-from .redis_client import get_redis
+from .redis_client import get_redis, fire_and_forget
 
 logger = logging.getLogger(__name__)
 
 _SYS_SETTINGS_KEY = "sys:settings"
 _SYS_SETTINGS_TTL = 300  # 5 分钟
+_SNAPSHOT_TTL = 60
+_REFRESH_RETRY = 5  # 后台刷新未完成（或被丢弃）时，间隔多久允许再次调度
+_LOADED_FIELD = "__loaded__"  # Hash 中的整表加载标记
+_NAMESPACE = "settings"
+
+_snapshot: Optional[dict[str, str]] = None
+_snapshot_expire_at = 0.0
+_generation = 0  # 每次失效 +1，避免加载期间发生的失效被旧快照覆盖
+_refresh_after = 0.0  # 早于此时间不再调度新的后台刷新
+_lock = threading.Lock()
+
+
+def _install_snapshot(data: dict[str, str], generation: int) -> dict[str, str]:
+    global _snapshot, _snapshot_expire_at
+    with _lock:
+        if generation == _generation:
+            _snapshot = data
+            _snapshot_expire_at = time.monotonic() + _SNAPSHOT_TTL
+    return data
+
+
+def _load_from_db(db: Session) -> dict[str, str]:
+    rows = db.query(SystemSettings.key, SystemSettings.value).all()
+    return {key: value for key, value in rows if value}
+
+
+def _load_with_session() -> dict[str, str]:
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        return _load_from_db(db)
+    finally:
+        db.close()
+
+
+async def _read_redis() -> Optional[dict[str, str]]:
+    """读取 Redis Hash，未命中（或没有整表加载标记）返回 None"""
+    r = get_redis()
+    if not r:
+        return None
+    try:
+        cached = await r.hgetall(_SYS_SETTINGS_KEY)
+    except Exception:
+        logger.warning("[Settings] 读取 Redis 设置缓存失败，回源 DB")
+        return None
+    if cached.pop(_LOADED_FIELD, None):
+        return cached
+    return None
+
+
+async def _write_redis(data: dict[str, str]):
+    r = get_redis()
+    if not r:
+        return
+    try:
+        pipe = r.pipeline()
+        pipe.delete(_SYS_SETTINGS_KEY)
+        pipe.hset(_SYS_SETTINGS_KEY, mapping={**data, _LOADED_FIELD: "1"})
+        pipe.expire(_SYS_SETTINGS_KEY, _SYS_SETTINGS_TTL)
+        await pipe.execute()
+    except Exception:
+        logger.warning("[Settings] 写入 Redis 设置缓存失败")
+
+
+async def _refresh_snapshot(generation: int):
+    """后台刷新过期快照：Redis Hash → DB"""
+    data = await _read_redis()
+    if data is None:
+        try:
+            data = await asyncio.to_thread(_load_with_session)
+        except Exception as e:
+            logger.warning(f"[Settings] 刷新设置快照失败: {e}")
+            return
+        await _write_redis(data)
+    _install_snapshot(data, generation)
+
+
+def _schedule_refresh():
+    global _refresh_after
+    now = time.monotonic()
+    with _lock:
+        if now < _refresh_after:
+            return
+        _refresh_after = now + _REFRESH_RETRY
+        generation = _generation
+    fire_and_forget(_refresh_snapshot(generation))
+
+
+def _get_snapshot(db: Session) -> dict[str, str]:
+    """返回当前快照
+
+    - 未过期：直接返回
+    - 已过期且 Redis 可用：返回旧快照，调度后台刷新（Redis 优先，未命中再查 DB）
+    - 被失效或 Redis 不可用：同步从 DB 重新加载（1 次整表查询）
+    """
+    snapshot = _snapshot
+    if snapshot is not None:
+        if time.monotonic() < _snapshot_expire_at:
+            return snapshot
+        if get_redis():
+            _schedule_refresh()
+            return snapshot
+    generation = _generation
+    data = _load_from_db(db)
+    if get_redis():
+        fire_and_forget(_write_redis(data))
+    return _install_snapshot(data, generation)
+
+
+async def warm_settings_cache(db: Session) -> None:
+    """预热快照（app startup 时调用）：优先读取 Redis Hash，未命中再查 DB"""
+    generation = _generation
+    cached = await _read_redis()
+    if cached is not None:
+        _install_snapshot(cached, generation)
+        return
+    data = _load_from_db(db)
+    await _write_redis(data)
+    _install_snapshot(data, generation)
 
 
 def get_setting(db: Session, key: str, default: str = "") -> str:
     """获取单个设置值"""
-    setting = db.query(SystemSettings).filter(SystemSettings.key == key).first()
-    return setting.value if setting and setting.value else default
+    return _get_snapshot(db).get(key) or default
 
 
 def get_settings_batch(db: Session, keys: list[str], defaults: dict[str, str] | None = None) -> dict[str, str]:
     """
-    批量获取多个设置值（1 次 WHERE IN 查询）
-
-    优先从 Redis Hash `sys:settings` 批量读取已缓存的 key，
-    仅对未命中的 key 查询 DB，查询后回写 Redis。
+    批量获取多个设置值（读取进程级快照，稳态下无 DB/Redis 往返）
 
     Args:
-        db: 数据库会话
+        db: 数据库会话（快照过期时用于回源）
         keys: 要查询的设置键列表
         defaults: 默认值字典，未找到的键使用对应默认值
 
@@ -41,22 +168,12 @@ def get_settings_batch(db: Session, keys: list[str], defaults: dict[str, str] |
     if defaults is None:
         defaults = {}
 
-    settings = (
-        db.query(SystemSettings.key, SystemSettings.value)
-        .filter(SystemSettings.key.in_(keys))
-        .all()
-    )
-
-    result = {key: defaults.get(key, "") for key in keys}
-    for key, value in settings:
-        if value:
-            result[key] = value
-
-    return result
+    snapshot = _get_snapshot(db)
+    return {key: snapshot.get(key) or defaults.get(key, "") for key in keys}
 
 
 def set_setting(db: Session, key: str, value: str):
-    """设置单个值"""
+    """设置单个值（调用方 commit 后需调用 invalidate_settings_cache）"""
     setting = db.query(SystemSettings).filter(SystemSettings.key == key).first()
     if setting:
         setting.value = value
@@ -65,14 +182,37 @@ def set_setting(db: Session, key: str, value: str):
         db.add(setting)
 
 
-async def invalidate_settings_cache(*keys: str):
-    """主动失效 Redis 中的设置缓存（异步版本，admin 路由调用）"""
+async def _delete_redis(keys: tuple[str, ...]):
     r = get_redis()
     if r:
         try:
-            if keys:
-                await r.hdel(_SYS_SETTINGS_KEY, *keys)
-            else:
-                await r.delete(_SYS_SETTINGS_KEY)
+            await r.delete(_SYS_SETTINGS_KEY)
         except Exception:
-            pass
+            logger.warning(f"[Settings] 删除 Redis 设置缓存失败: keys={keys}")
+
+
+def _drop_snapshot(keys: list[str] = None):
+    """cache_bus 回调：丢弃本实例快照（快照是整表，忽略 keys）"""
+    global _snapshot, _generation
+    with _lock:
+        _snapshot = None
+        _generation += 1
+
+
+register_handler(_NAMESPACE, _drop_snapshot)
+
+
+async def invalidate_settings_cache(*keys: str):
+    """失效设置缓存：删除 Redis Hash 并广播，所有实例丢弃本地快照
+
+    快照为整表缓存，keys 仅用于日志，任意 key 变化都会整体失效。
+    """
+    await _delete_redis(keys)
+    await publish_invalidation(_NAMESPACE, keys)
+
+
+def invalidate_settings_cache_nowait(*keys: str):
+    """同步版本（线程池中的 def 路由）：本地立即失效，Redis 删除和广播以 fire-and-forget 方式发出"""
+    if get_redis():
+        fire_and_forget(_delete_redis(keys))
+    publish_invalidation_nowait(_NAMESPACE, keys)
@@ -11,7 +11,7 @@ Redis Pub/Sub 支持（Phase 1）：
 
 import asyncio
 import json
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
 import logging
@@ -222,6 +222,29 @@ class SSEManager:
         # 降级：仅本地发送
         return await self._send_to_local_user(user_id, message)
     
+    async def send_to_users(self, items: List[Tuple[int, dict]]) -> int:
+        """批量定向推送：Redis 可用时用一个 pipeline 发布所有消息（一次往返），否则逐个本地发送"""
+        r = get_redis()
+        if r:
+            try:
+                pipe = r.pipeline(transaction=False)
+                for user_id, message in items:
+                    payload = json.dumps({
+                        "_target": "user",
+                        "_user_id": user_id,
+                        **message
+                    }, ensure_ascii=False)
+                    pipe.publish(f"sse:user:{user_id}", payload)
+                await pipe.execute()
+                return 0  # 实际发送在 subscriber 中计数
+            except Exception as e:
+                logger.warning(f"[SSE] Redis batch publish failed, falling back to local: {e}")
+
+        sent = 0
+        for user_id, message in items:
+            sent += await self._send_to_local_user(user_id, message)
+        return sent
+
     async def broadcast(self, message: dict, exclude_user_id: Optional[int] = None):
         """Broadcast a message to all connected users via Redis Pub/Sub."""
         r = get_redis()
@@ -0,0 +1,230 @@
+"""
+用户认证缓存（两级：进程内 L1 + Redis L2）
+
+- L1：进程内 TTL 缓存，存储认证所需字段的字典（不存 ORM 对象，避免跨 Session 污染）
+- L2：Redis String `user:{id}`，多实例共享
+- 负缓存：不存在的用户写入占位符，避免无效 token 反复打到 DB
+- 失效：invalidate() 删除 L2 并通过 cache_bus 广播，所有实例同步清除 L1
+- 指标：各级命中/未命中计数，管理后台 /admin/cache/stats 查看
+
+稳态下每个已认证请求的用户加载为 0 次 DB 往返：
+反序列化后通过 make_transient_to_detached + merge(load=False) 绑定到当前 Session。
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from .cache_bus import register_handler, publish_invalidation
+from .models import User
+from .redis_client import get_redis, fire_and_forget
+
+logger = logging.getLogger(__name__)
+
+_NAMESPACE = "user"
+_NEGATIVE = "__none__"  # 负缓存占位符
+
+_L1_MAXSIZE = 4096
+_L1_TTL = 60  # 有跨实例失效广播兜底，L1 TTL 仅用于限制内存驻留
+_L2_TTL = 300
+_NEGATIVE_TTL = 30
+
+# 认证所需字段（password_hash 不进缓存，访问时由 Session 按需加载）
+_CACHED_FIELDS = (
+    "id", "username", "nickname", "avatar", "is_banned",
+    "ban_reason", "persona", "token", "created_at",
+)
+
+
+def _user_to_payload(user: User) -> dict:
+    return {field: getattr(user, field) for field in _CACHED_FIELDS}
+
+
+def _payload_to_json(payload: dict) -> str:
+    data = dict(payload)
+    if data.get("created_at"):
+        data["created_at"] = data["created_at"].isoformat()
+    return json.dumps(data)
+
+
+def _payload_from_json(raw: str) -> dict:
+    data = json.loads(raw)
+    if data.get("created_at"):
+        data["created_at"] = datetime.fromisoformat(data["created_at"])
+    return data
+
+
+def _bind_to_session(payload: dict, db: Session) -> User:
+    """将缓存字典还原为 User 并绑定到当前 Session（不触发 DB 查询）"""
+    user = User(**payload)
+    make_transient_to_detached(user)  # 赋予 identity key，未缓存字段标记为 expired
+    return db.merge(user, load=False)
+
+
+class UserCache:
+    """两级用户缓存"""
+
+    def __init__(self):
+        try:
+            from cachetools import TTLCache
+            self._l1 = TTLCache(maxsize=_L1_MAXSIZE, ttl=_L1_TTL)
+        except ImportError:
+            self._l1 = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+        }
+
+    # ----- L1 -----
+
+    def _l1_get(self, user_id: int):
+        """返回 (found, payload)，payload 为 None 表示负缓存"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._l1.get(user_id)
+            if entry is None:
+                return False, None
+            payload, expire_at = entry
+            if expire_at <= now:
+                self._l1.pop(user_id, None)
+                return False, None
+            return True, payload
+
+    def _l1_set(self, user_id: int, payload: Optional[dict]):
+        ttl = _L1_TTL if payload is not None else _NEGATIVE_TTL
+        with self._lock:
+            if not hasattr(self._l1, "maxsize") and len(self._l1) >= _L1_MAXSIZE:
+                self._l1.pop(next(iter(self._l1)), None)  # dict 降级：淘汰最早写入
+            self._l1[user_id] = (payload, time.monotonic() + ttl)
+
+    def evict_local(self, keys: list[str]):
+        """cache_bus 回调：清除本实例 L1（keys 为空时清空全部）"""
+        with self._lock:
+            if not keys:
+                self._l1.clear()
+                return
+            for key in keys:
+                self._l1.pop(int(key), None)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    # ----- 读取 -----
+
+    def _resolve_l1(self, db: Session, user_id: int):
+        found, payload = self._l1_get(user_id)
+        if not found:
+            return False, None
+        if payload is None:
+            self._count("negative_hits")
+            return True, None
+        self._count("l1_hits")
+        return True, _bind_to_session(payload, db)
+
+    def _load_from_db(self, db: Session, user_id: int) -> tuple[Optional[User], Optional[dict]]:
+        self._count("misses")
+        user = db.query(User).filter(User.id == user_id).first()
+        payload = _user_to_payload(user) if user is not None else None
+        self._l1_set(user_id, payload)
+        return user, payload
+
+    async def get(self, db: Session, user_id: int) -> Optional[User]:
+        """异步读取：L1 → Redis → DB"""
+        found, user = self._resolve_l1(db, user_id)
+        if found:
+            return user
+
+        r = get_redis()
+        if r:
+            try:
+                raw = await r.get(f"user:{user_id}")
+                if raw is not None:
+                    if raw == _NEGATIVE:
+                        self._count("negative_hits")
+                        self._l1_set(user_id, None)
+                        return None
+                    payload = _payload_from_json(raw)
+                    self._count("l2_hits")
+                    self._l1_set(user_id, payload)
+                    return _bind_to_session(payload, db)
+            except Exception as e:
+                logger.warning(f"[UserCache] Redis 读取失败: user_id={user_id} {e}")
+
+        user, payload = self._load_from_db(db, user_id)
+        if r:
+            try:
+                if payload is None:
+                    await r.setex(f"user:{user_id}", _NEGATIVE_TTL, _NEGATIVE)
+                else:
+                    await r.setex(f"user:{user_id}", _L2_TTL, _payload_to_json(payload))
+            except Exception:
+                logger.warning(f"[UserCache] Redis 写入失败: user_id={user_id}")
+        return user
+
+    def get_sync(self, db: Session, user_id: int) -> Optional[User]:
+        """同步读取（线程池中的 def 路由）：L1 → DB，Redis 回写 fire-and-forget"""
+        found, user = self._resolve_l1(db, user_id)
+        if found:
+            return user
+
+        user, payload = self._load_from_db(db, user_id)
+        if get_redis():
+            data = _NEGATIVE if payload is None else _payload_to_json(payload)
+            ttl = _NEGATIVE_TTL if payload is None else _L2_TTL
+            fire_and_forget(self._redis_set(user_id, data, ttl))
+        return user
+
+    async def _redis_set(self, user_id: int, data: str, ttl: int):
+        r = get_redis()
+        if r:
+            try:
+                await r.setex(f"user:{user_id}", ttl, data)
+            except Exception:
+                logger.warning(f"[UserCache] Redis 写入失败: user_id={user_id}")
+
+    # ----- 失效 -----
+
+    async def ainvalidate(self, user_id: int):
+        """删除 L2 并广播失效（所有实例清除 L1）"""
+        self._count("invalidations")
+        r = get_redis()
+        if r:
+            try:
+                await r.delete(f"user:{user_id}")
+            except Exception:
+                logger.warning(f"[UserCache] Redis 删除失败: user_id={user_id}")
+        await publish_invalidation(_NAMESPACE, [user_id])
+
+    def invalidate(self, user_id: int):
+        """同步版本：本地 L1 立即失效，L2 删除与广播 fire-and-forget"""
+        self.evict_local([str(user_id)])
+        fire_and_forget(self.ainvalidate(user_id))
+
+    # ----- 指标 -----
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["l1_size"] = len(self._l1)
+        lookups = stats["l1_hits"] + stats["l2_hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_ratio"] = round(1 - stats["misses"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+user_cache = UserCache()
+register_handler(_NAMESPACE, user_cache.evict_local)
+
+
+def get_user_cache() -> UserCache:
+    """获取全局用户缓存"""
+    return user_cache
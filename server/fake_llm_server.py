@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容接口替身（用于审核压测，不调用真实模型、不产生费用）
+
+提供 /v1/models 与 /v1/chat/completions（同时注册不带 /v1 前缀的路径），
+按审核 Prompt 中的 "[编号] 内容" 列表逐条返回 JSON 数组结论：
+- 延迟：--latency-ms 基础延迟 + --per-item-ms 每条内容的额外延迟，±--jitter-ms 抖动
+- 错误：--error-rate 概率返回 HTTP 500（模拟上游故障）
+- 结论：--reject-rate 概率判定为不通过（类别随机取 sexual / violence / extreme），
+  --malformed-rate 概率返回无法解析的文本
+- 内容包含 --reject-marker 指定的标记时总是判定不通过（便于构造确定性用例）
+- GET /stats 返回请求计数，POST /stats/reset 清零
+
+用法:
+    cd server
+    python fake_llm_server.py --port 8900 --latency-ms 800 --error-rate 0.02
+    # 管理后台审核配置中 API 地址填 http://127.0.0.1:8900/v1，API Key 任意
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+
+_ITEM_RE = re.compile(r"^\[(\d+)\]\s", re.MULTILINE)
+_CATEGORIES = ["sexual", "violence", "extreme"]
+
+
+def create_app(
+    latency_ms: float = 0,
+    per_item_ms: float = 0,
+    jitter_ms: float = 0,
+    error_rate: float = 0.0,
+    reject_rate: float = 0.0,
+    malformed_rate: float = 0.0,
+    reject_marker: str = "[[REJECT]]",
+    models: tuple[str, ...] = ("gpt-4o-mini", "fake-moderation"),
+    seed: int | None = None,
+) -> FastAPI:
+    """创建替身应用（benchmark_moderation.py 会在进程内直接启动）"""
+    app = FastAPI(title="Fake LLM")
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    stats = {"requests": 0, "items": 0, "errors": 0, "malformed": 0, "rejected": 0}
+
+    def _count(**kwargs):
+        with lock:
+            for key, value in kwargs.items():
+                stats[key] += value
+
+    def _verdicts(prompt: str) -> list[dict]:
+        matches = list(_ITEM_RE.finditer(prompt))
+        verdicts = []
+        for idx, match in enumerate(matches):
+            end = matches[idx + 1].start() if idx + 1 < len(matches) else len(prompt)
+            content = prompt[match.end():end]
+            rejected = reject_marker in content or rng.random() < reject_rate
+            verdicts.append({
+                "id": int(match.group(1)),
+                "passed": not rejected,
+                "category": rng.choice(_CATEGORIES) if rejected else "none",
+                "reason": "压测替身判定不通过" if rejected else "",
+            })
+        return verdicts
+
+    @app.get("/v1/models")
+    @app.get("/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": m, "object": "model", "owned_by": "local"} for m in models]}
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        verdicts = _verdicts(prompt)
+
+        delay = latency_ms + per_item_ms * len(verdicts) + rng.uniform(-jitter_ms, jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        _count(requests=1, items=len(verdicts))
+        if rng.random() < error_rate:
+            _count(errors=1)
+            raise HTTPException(status_code=500, detail="fake upstream error")
+
+        if rng.random() < malformed_rate:
+            _count(malformed=1)
+            text = "抱歉，我无法完成这个请求。"
+        else:
+            _count(rejected=sum(1 for v in verdicts if not v["passed"]))
+            text = json.dumps(verdicts, ensure_ascii=False)
+
+        return {
+            "id": f"chatcmpl-fake-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", models[0]),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": len(prompt), "completion_tokens": len(text), "total_tokens": len(prompt) + len(text)},
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        with lock:
+            return dict(stats)
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        with lock:
+            for key in stats:
+                stats[key] = 0
+        return {"ok": True}
+
+    app.state.stats = stats
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容接口替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=500, help="每次请求的基础延迟")
+    parser.add_argument("--per-item-ms", type=float, default=20, help="每条内容的额外延迟")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="延迟随机抖动幅度")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 HTTP 500 的概率")
+    parser.add_argument("--reject-rate", type=float, default=0.05, help="单条内容判定不通过的概率")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="返回无法解析文本的概率")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(
+        latency_ms=args.latency_ms,
+        per_item_ms=args.per_item_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        reject_rate=args.reject_rate,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
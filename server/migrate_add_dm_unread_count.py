@@ -0,0 +1,83 @@
+"""
+数据库迁移脚本：私聊未读计数改为增量维护
+
+此脚本执行以下操作：
+1. 为 dm_reads 表添加 unread_count 列（如果不存在）
+2. 按现有已读游标回填每个会话的未读数
+3. 创建 dm_unread_totals 表（如果不存在）并按 dm_reads 重建每个用户的未读汇总
+
+可重复执行：第 2、3 步会按当前消息重新计算。建议在低峰期执行，
+执行期间新发送的消息可能未计入，执行完成后再运行一次即可校正。
+
+使用方法：
+    cd server
+    python migrate_add_dm_unread_count.py
+"""
+
+import sys
+import os
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text, inspect
+from app.database import engine
+from app.models import DMUnreadTotal
+
+
+def check_column_exists(engine, table_name, column_name):
+    """检查列是否存在"""
+    inspector = inspect(engine)
+    columns = [col['name'] for col in inspector.get_columns(table_name)]
+    return column_name in columns
+
+
+def migrate():
+    """执行迁移"""
+    print("=" * 50)
+    print("开始执行数据库迁移：私聊未读计数")
+    print("=" * 50)
+
+    if check_column_exists(engine, 'dm_reads', 'unread_count'):
+        print("\n[INFO] unread_count 列已存在，跳过添加列步骤")
+    else:
+        print("\n[STEP 1] 添加 dm_reads.unread_count 列...")
+        with engine.connect() as conn:
+            conn.execute(text(
+                "ALTER TABLE dm_reads ADD COLUMN unread_count INTEGER NOT NULL DEFAULT 0"
+            ))
+            conn.commit()
+        print("[OK] unread_count 列添加成功")
+
+    print("\n[STEP 2] 回填会话未读数...")
+    with engine.connect() as conn:
+        result = conn.execute(text(
+            "UPDATE dm_reads SET unread_count = ("
+            "SELECT COUNT(*) FROM dm_messages m "
+            "WHERE m.conversation_id = dm_reads.conversation_id "
+            "AND m.sender_id != dm_reads.user_id "
+            "AND m.id > COALESCE(dm_reads.last_read_message_id, 0))"
+        ))
+        conn.commit()
+    print(f"[OK] 已更新 {result.rowcount} 条已读游标")
+
+    print("\n[STEP 3] 重建用户未读汇总...")
+    DMUnreadTotal.__table__.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        conn.execute(text("DELETE FROM dm_unread_totals"))
+        result = conn.execute(text(
+            "INSERT INTO dm_unread_totals (user_id, unread_count, conversations_with_unread) "
+            "SELECT user_id, SUM(unread_count), "
+            "SUM(CASE WHEN unread_count > 0 THEN 1 ELSE 0 END) "
+            "FROM dm_reads GROUP BY user_id"
+        ))
+        conn.commit()
+    print(f"[OK] 已写入 {result.rowcount} 个用户的未读汇总")
+
+    print("\n" + "=" * 50)
+    print("迁移完成！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,52 @@
+"""
+数据库迁移脚本：审核日志添加 cached 字段
+
+此脚本执行以下操作：
+1. 为 moderation_logs 表添加 cached 列（如果不存在），标记命中审核结论缓存、未调用 LLM 的记录
+
+使用方法：
+    cd server
+    python migrate_add_moderation_cached.py
+"""
+
+import sys
+import os
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text, inspect
+from app.database import engine
+
+
+def check_column_exists(engine, table_name, column_name):
+    """检查列是否存在"""
+    inspector = inspect(engine)
+    columns = [col['name'] for col in inspector.get_columns(table_name)]
+    return column_name in columns
+
+
+def migrate():
+    """执行迁移"""
+    print("=" * 50)
+    print("开始执行数据库迁移：审核日志添加 cached 字段")
+    print("=" * 50)
+
+    if check_column_exists(engine, 'moderation_logs', 'cached'):
+        print("\n[INFO] cached 列已存在，跳过")
+    else:
+        print("\n[STEP 1] 添加 cached 列...")
+        with engine.connect() as conn:
+            conn.execute(text(
+                "ALTER TABLE moderation_logs ADD COLUMN cached BOOLEAN NOT NULL DEFAULT FALSE"
+            ))
+            conn.commit()
+        print("[OK] cached 列添加成功")
+
+    print("\n" + "=" * 50)
+    print("迁移完成！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    migrate()
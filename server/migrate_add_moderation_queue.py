@@ -0,0 +1,53 @@
+"""
+数据库迁移脚本：添加审核队列(moderation_queue)表
+
+此脚本执行以下操作：
+1. 创建 moderation_queue 表（如果不存在）
+2. 将现有 moderated=False 的帖子/回复回填到队列（已在队列中的跳过）
+
+使用方法：
+    cd server
+    python migrate_add_moderation_queue.py
+"""
+
+import sys
+import os
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+from app.database import engine
+from app.models import ModerationQueue
+
+
+def migrate():
+    """执行迁移"""
+    print("=" * 50)
+    print("开始执行数据库迁移：添加审核队列表")
+    print("=" * 50)
+
+    print("\n[STEP 1] 创建 moderation_queue 表...")
+    ModerationQueue.__table__.create(bind=engine, checkfirst=True)
+    print("[OK] moderation_queue 表已就绪")
+
+    print("\n[STEP 2] 回填未审核内容...")
+    with engine.connect() as conn:
+        for content_type, table in (("thread", "threads"), ("reply", "replies")):
+            result = conn.execute(text(
+                f"INSERT INTO moderation_queue (content_type, content_id, status, attempts) "
+                f"SELECT '{content_type}', t.id, 'pending', 0 FROM {table} t "
+                f"WHERE t.moderated = FALSE AND NOT EXISTS ("
+                f"SELECT 1 FROM moderation_queue q "
+                f"WHERE q.content_type = '{content_type}' AND q.content_id = t.id)"
+            ))
+            print(f"[OK] {table}: 回填 {result.rowcount} 条")
+        conn.commit()
+
+    print("\n" + "=" * 50)
+    print("迁移完成！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,86 @@
+"""
+数据库迁移脚本：聚合通知
+
+此脚本执行以下操作：
+1. 为 notifications 表添加 aggregate_count 列（合并的事件数，默认 1）
+2. 为 notifications 表添加 recent_actor_ids 列（最近的触发者 ID）
+3. 为 notifications 表添加 updated_at 列（最后一次变更时间）
+4. 刚添加 updated_at 列时按 created_at 回填
+5. 创建 (user_id, updated_at, id) 索引（列表排序与增量同步）
+
+已有通知视为未合并的单条通知。
+
+使用方法：
+    cd server
+    python migrate_add_notification_aggregation.py
+"""
+
+import sys
+import os
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text, inspect
+from app.database import engine
+from app.models import Notification
+
+
+def check_column_exists(engine, table_name, column_name):
+    """检查列是否存在"""
+    inspector = inspect(engine)
+    columns = [col['name'] for col in inspector.get_columns(table_name)]
+    return column_name in columns
+
+
+def migrate():
+    """执行迁移"""
+    print("=" * 50)
+    print("开始执行数据库迁移：聚合通知")
+    print("=" * 50)
+
+    # SQLite 的 ADD COLUMN 不支持非常量默认值，新行的默认值由模型的 server_default 在建表时提供
+    if engine.dialect.name == "postgresql":
+        updated_at_type = "TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP"
+    else:
+        updated_at_type = "DATETIME"
+    columns = [
+        ("aggregate_count", "INTEGER NOT NULL DEFAULT 1"),
+        ("recent_actor_ids", "VARCHAR(100)"),
+        ("updated_at", updated_at_type),
+    ]
+    added = set()
+    for step, (name, definition) in enumerate(columns, start=1):
+        if check_column_exists(engine, 'notifications', name):
+            print(f"\n[INFO] {name} 列已存在，跳过")
+            continue
+        print(f"\n[STEP {step}] 添加 notifications.{name} 列...")
+        with engine.connect() as conn:
+            conn.execute(text(f"ALTER TABLE notifications ADD COLUMN {name} {definition}"))
+            conn.commit()
+        print(f"[OK] {name} 列添加成功")
+        added.add(name)
+
+    if "updated_at" in added:
+        # 只在刚添加列时回填，重复执行不会覆盖聚合通知合并后更新的时间
+        print("\n[STEP 4] 按 created_at 回填 updated_at...")
+        with engine.connect() as conn:
+            result = conn.execute(text(
+                "UPDATE notifications SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)"
+            ))
+            conn.commit()
+        print(f"[OK] 已回填 {result.rowcount} 条通知")
+
+    print("\n[STEP 5] 创建 ix_notification_user_updated 索引...")
+    for index in Notification.__table__.indexes:
+        if index.name == "ix_notification_user_updated":
+            index.create(bind=engine, checkfirst=True)
+    print("[OK] ix_notification_user_updated 已就绪")
+
+    print("\n" + "=" * 50)
+    print("迁移完成！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    migrate()
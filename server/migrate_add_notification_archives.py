@@ -0,0 +1,42 @@
+"""
+数据库迁移脚本：通知归档表
+
+此脚本执行以下操作：
+1. 创建 notification_archives 表（如果不存在）
+
+保留任务（app/notification_retention.py）会把已读且早于 NOTIFICATION_RETENTION_DAYS 天的通知
+压缩写入该表后删除。如需同时把 notifications 转为按月分区（仅 PostgreSQL），
+再执行 migrate_partition_notifications.py。
+
+使用方法：
+    cd server
+    python migrate_add_notification_archives.py
+"""
+
+import sys
+import os
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+from app.models import NotificationArchive
+
+
+def migrate():
+    """执行迁移"""
+    print("=" * 50)
+    print("开始执行数据库迁移：通知归档表")
+    print("=" * 50)
+
+    print("\n[STEP 1] 创建 notification_archives 表...")
+    NotificationArchive.__table__.create(bind=engine, checkfirst=True)
+    print("[OK] notification_archives 表已就绪")
+
+    print("\n" + "=" * 50)
+    print("迁移完成！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,55 @@
+"""
+数据库迁移脚本：添加通知计数(notification_counters)表
+
+此脚本执行以下操作：
+1. 创建 notification_counters 表（如果不存在）
+2. 按 notifications 表重建每个用户的 (total, unread) 计数
+
+可重复执行（第 2 步会按当前通知重新计算）。未执行本脚本时，
+用户首次读取通知列表/未读数时也会按需统计并建行。
+
+使用方法：
+    cd server
+    python migrate_add_notification_counters.py
+"""
+
+import sys
+import os
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+from app.database import engine
+from app.models import NotificationCounter
+
+
+def migrate():
+    """执行迁移"""
+    print("=" * 50)
+    print("开始执行数据库迁移：添加通知计数表")
+    print("=" * 50)
+
+    print("\n[STEP 1] 创建 notification_counters 表...")
+    NotificationCounter.__table__.create(bind=engine, checkfirst=True)
+    print("[OK] notification_counters 表已就绪")
+
+    print("\n[STEP 2] 回填通知计数...")
+    with engine.connect() as conn:
+        conn.execute(text("DELETE FROM notification_counters"))
+        result = conn.execute(text(
+            "INSERT INTO notification_counters (user_id, total, unread) "
+            "SELECT user_id, COUNT(*), "
+            "SUM(CASE WHEN is_read = FALSE THEN 1 ELSE 0 END) "
+            "FROM notifications GROUP BY user_id"
+        ))
+        conn.commit()
+    print(f"[OK] 已写入 {result.rowcount} 个用户的通知计数")
+
+    print("\n" + "=" * 50)
+    print("迁移完成！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    migrate()
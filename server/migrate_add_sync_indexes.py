@@ -0,0 +1,53 @@
+"""
+数据库迁移脚本：为增量同步接口（GET /api/sync）添加索引
+
+此脚本执行以下操作：
+1. 为 notifications 表添加 (user_id, id) 复合索引（按通知 ID 键集拉取）
+
+PostgreSQL 上使用 CREATE INDEX CONCURRENTLY，不阻塞写入。
+
+使用方法：
+    cd server
+    python migrate_add_sync_indexes.py
+"""
+
+import sys
+import os
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+from app.database import engine
+
+
+def migrate():
+    """执行迁移"""
+    print("=" * 50)
+    print("开始执行数据库迁移：增量同步索引")
+    print("=" * 50)
+
+    print("\n[STEP 1] 添加 ix_notification_user_id 索引...")
+    if engine.dialect.name == "postgresql":
+        # CONCURRENTLY 索引不能在事务中创建
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_notification_user_id "
+                "ON notifications (user_id, id)"
+            ))
+    else:
+        with engine.connect() as conn:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_notification_user_id "
+                "ON notifications (user_id, id)"
+            ))
+            conn.commit()
+    print("[OK] ix_notification_user_id 索引已就绪")
+
+    print("\n" + "=" * 50)
+    print("迁移完成！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    migrate()
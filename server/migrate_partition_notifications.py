@@ -0,0 +1,108 @@
+"""
+数据库迁移脚本：notifications 表转为按月分区（仅 PostgreSQL，可选）
+
+分区后保留任务整体清理整月过期的分区：已读通知归档后随分区 DROP，不再逐行 DELETE；
+仍未读的少量旧通知搬到默认分区继续保留。表和索引的大小随保留天数稳定。
+
+此脚本在一个事务中执行以下操作：
+1. 将 notifications 重命名为 notifications_legacy
+2. 创建按 created_at 范围分区的 notifications（主键改为 (id, created_at)，沿用原 ID 序列）
+3. 按现有数据的时间范围创建月分区（至下 2 个月）和默认分区
+4. 复制数据，删除 notifications_legacy，重建索引
+
+注意：复制期间表被锁定，请在维护窗口执行；执行前请备份数据库。已经是分区表时直接跳过。
+
+使用方法：
+    cd server
+    python migrate_partition_notifications.py
+"""
+
+import sys
+import os
+from datetime import date
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+from app.database import engine
+from app.notification_retention import (
+    PARTITION_MONTHS_AHEAD,
+    month_start,
+    next_month,
+    create_month_partition,
+)
+
+
+def migrate():
+    """执行迁移"""
+    print("=" * 50)
+    print("开始执行数据库迁移：通知表按月分区")
+    print("=" * 50)
+
+    if engine.dialect.name != "postgresql":
+        print("\n[INFO] 当前数据库不是 PostgreSQL，跳过")
+        return
+
+    with engine.begin() as conn:
+        relkind = conn.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass('notifications')")
+        ).scalar()
+        if relkind == "p":
+            print("\n[INFO] notifications 已经是分区表，跳过")
+            return
+
+        print("\n[STEP 1] 重命名原表...")
+        conn.execute(text("UPDATE notifications SET created_at = now() WHERE created_at IS NULL"))
+        conn.execute(text("ALTER TABLE notifications RENAME TO notifications_legacy"))
+        print("[OK] notifications → notifications_legacy")
+
+        print("\n[STEP 2] 创建分区表...")
+        conn.execute(text(
+            "CREATE TABLE notifications (LIKE notifications_legacy INCLUDING DEFAULTS) "
+            "PARTITION BY RANGE (created_at)"
+        ))
+        conn.execute(text("ALTER TABLE notifications ALTER COLUMN created_at SET NOT NULL"))
+        # LIKE 复制了 nextval 默认值，序列归属改到新表，删除旧表时不会连带删除
+        conn.execute(text("ALTER SEQUENCE notifications_id_seq OWNED BY notifications.id"))
+        print("[OK] notifications (PARTITION BY RANGE created_at)")
+
+        print("\n[STEP 3] 创建月分区...")
+        oldest = conn.execute(text("SELECT min(created_at) FROM notifications_legacy")).scalar()
+        month = month_start(oldest.date() if oldest else date.today())
+        last = month_start(date.today())
+        for _ in range(PARTITION_MONTHS_AHEAD):
+            last = next_month(last)
+        count = 0
+        while month <= last:
+            create_month_partition(conn, month)
+            month = next_month(month)
+            count += 1
+        conn.execute(text("CREATE TABLE notifications_default PARTITION OF notifications DEFAULT"))
+        print(f"[OK] 已创建 {count} 个月分区和默认分区")
+
+        print("\n[STEP 4] 复制数据并重建索引...")
+        result = conn.execute(text("INSERT INTO notifications SELECT * FROM notifications_legacy"))
+        conn.execute(text("DROP TABLE notifications_legacy"))
+        conn.execute(text("ALTER TABLE notifications ADD PRIMARY KEY (id, created_at)"))
+        conn.execute(text("CREATE INDEX ix_notifications_id ON notifications (id)"))
+        conn.execute(text("CREATE INDEX ix_notification_user_read ON notifications (user_id, is_read)"))
+        conn.execute(text("CREATE INDEX ix_notification_user_created ON notifications (user_id, created_at)"))
+        conn.execute(text("CREATE INDEX ix_notification_user_id ON notifications (user_id, id)"))
+        conn.execute(text(
+            "CREATE INDEX ix_notification_user_updated ON notifications (user_id, updated_at, id)"
+        ))
+        for column, target in (("user_id", "users"), ("from_user_id", "users"),
+                               ("thread_id", "threads"), ("reply_id", "replies")):
+            conn.execute(text(
+                f"ALTER TABLE notifications ADD FOREIGN KEY ({column}) REFERENCES {target}(id)"
+            ))
+        print(f"[OK] 已复制 {result.rowcount} 条通知")
+
+    print("\n" + "=" * 50)
+    print("迁移完成！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    migrate()